@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Compare subbrute's shared_set with the Manager dict it replaced.
+#
+# Every worker process runs the test-and-insert of the spider over its share
+# of the names, and every name is offered by two workers, like a host that is
+# both in the wordlist and found by the spider. The Manager dict pays an IPC
+# round trip for each test and each insert; the shared set touches shared
+# memory only.
+#
+#   python benchmarks/dedup_set.py -n 1000000 -w 8
+
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'subbrute'))
+import subbrute
+
+
+def names(first, last):
+    return ["host%d.example.com" % i for i in range(first, last)]
+
+
+def manager_worker(blacklist, first, last, added):
+    count = 0
+    for name in names(first, last):
+        if name not in blacklist:
+            blacklist[name] = None
+            count += 1
+    added.put(count)
+
+
+def shared_worker(blacklist, first, last, added):
+    count = 0
+    for name in names(first, last):
+        if blacklist.add(name):
+            count += 1
+    added.put(count)
+
+
+def measure(worker, blacklist, count, workers):
+    """Seconds taken, names offered and names added"""
+    added = multiprocessing.Queue()
+    share = count // workers
+    procs = []
+    offered = 0
+    for i in range(workers):
+        # the second half of every share is also the first half of the next one
+        first = i * share
+        last = first + share + share // 2 if i < workers - 1 else count
+        offered += last - first
+        procs.append(multiprocessing.Process(target=worker, args=(blacklist, first, last, added)))
+    start = time.time()
+    for proc in procs:
+        proc.start()
+    total = sum(added.get() for proc in procs)
+    for proc in procs:
+        proc.join()
+    return time.time() - start, offered, total
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-n', '--count', type=int, default=1000000, help='unique names')
+    parser.add_argument('-w', '--workers', type=int, default=8, help='worker processes')
+    parser.add_argument('--sets', default='manager,shared')
+    args = parser.parse_args()
+
+    print("%-8s %10s %12s %10s" % ('set', 'seconds', 'ops/s', 'unique'))
+    for kind in args.sets.split(','):
+        if kind == 'manager':
+            manager = multiprocessing.Manager()
+            seconds, ops, unique = measure(manager_worker, manager.dict(), args.count, args.workers)
+            manager.shutdown()
+        else:
+            seconds, ops, unique = measure(shared_worker, subbrute.shared_set(args.count), args.count, args.workers)
+        print("%-8s %10.2f %12.0f %10d" % (kind, seconds, ops / seconds, unique))
+
+
+if __name__ == "__main__":
+    main()
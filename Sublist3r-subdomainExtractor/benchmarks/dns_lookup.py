@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Compare the lookup engines of subbrute against the stub DNS server.
+#
+# A wordlist of n0..n<count> is bruteforced under the target with the process
+# based lookup and with the async engine. The stub answers for one name in ten
+# and delays every answer by --latency ms, like a real resolver would.
+#
+#   python benchmarks/dns_lookup.py -n 20000 --latency 20
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'subbrute'))
+import subbrute
+
+from dns_stub import parse_ports
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-d', '--domain', default='example.com')
+    parser.add_argument('-n', '--count', type=int, default=20000, help='names in the wordlist')
+    parser.add_argument('-c', '--process-count', type=int, default=16, help='lookup processes of the process engine')
+    parser.add_argument('--ports', default='5301-5308', help='ports of the stub resolvers')
+    parser.add_argument('--latency', type=float, default=20, help='ms the stub waits before answering')
+    parser.add_argument('--engines', default='process,async')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    stub = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.realpath(__file__)), 'dns_stub.py'),
+                             '--ports', args.ports, '--latency', str(args.latency)])
+    try:
+        names = os.path.join(workdir, 'names.txt')
+        with open(names, 'w') as f:
+            for i in range(args.count):
+                f.write('n%d\n' % i)
+        resolvers = os.path.join(workdir, 'resolvers.txt')
+        with open(resolvers, 'w') as f:
+            for port in parse_ports(args.ports):
+                f.write('127.0.0.1#%d\n' % port)
+        time.sleep(0.5)
+
+        print("%-8s %10s %10s %8s" % ('engine', 'seconds', 'names/s', 'found'))
+        for engine in args.engines.split(','):
+            start = time.time()
+            found = sum(1 for result in subbrute.run(args.domain, False, names, resolvers, args.process_count, engine=engine))
+            seconds = time.time() - start
+            print("%-8s %10.2f %10.0f %8d" % (engine, seconds, args.count / seconds, found))
+    finally:
+        stub.kill()
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Stub DNS server for benchmarking subbrute offline.
+#
+# It answers A queries for the benchmark names "n<number>.<domain>" whose
+# number is a multiple of --every, and NXDOMAIN for everything else. Answers
+# are built straight from the query bytes so the stub itself stays cheap,
+# and they can be held back for --latency ms to mimic a real resolver.
+# Several ports can be served at once to stand in for a resolver pool.
+#
+#   python benchmarks/dns_stub.py --ports 5301-5308 --latency 20
+
+import re
+import sys
+import time
+import heapq
+import select
+import socket
+import struct
+import argparse
+
+name_match = re.compile(br"^n(\d+)$")
+
+
+def parse_ports(spec):
+    ports = []
+    for part in spec.split(','):
+        if '-' in part:
+            first, last = part.split('-')
+            ports.extend(range(int(first), int(last) + 1))
+        else:
+            ports.append(int(part))
+    return ports
+
+
+def build_answer(query, every):
+    """The response to a raw query, None if it is not worth answering"""
+    if len(query) < 17:
+        return None
+    (txid, flags, qdcount) = struct.unpack("!HHH", query[:6])
+    if qdcount != 1:
+        return None
+    # walk the labels of the question name
+    pos = 12
+    labels = []
+    while pos < len(query) and query[pos:pos + 1] != b"\x00":
+        length = ord(query[pos:pos + 1])
+        labels.append(query[pos + 1:pos + 1 + length])
+        pos += 1 + length
+    question = query[12:pos + 5]
+    qtype = struct.unpack("!H", query[pos + 1:pos + 3])[0]
+    match = name_match.match(labels[0]) if labels else None
+    if qtype == 1 and match and int(match.group(1)) % every == 0:
+        number = int(match.group(1))
+        header = struct.pack("!HHHHHH", txid, 0x8180, 1, 1, 0, 0)
+        address = struct.pack("!BBBB", 10, (number >> 16) & 0xff, (number >> 8) & 0xff, number & 0xff)
+        # the answer points back at the question name
+        record = struct.pack("!HHHIH", 0xc00c, 1, 1, 300, 4) + address
+        return header + question + record
+    # NXDOMAIN, recursion available
+    return struct.pack("!HHHHHH", txid, 0x8183, 1, 0, 0, 0) + question
+
+
+def serve(ports, every=10, latency=0.0, host='127.0.0.1'):
+    socks = []
+    for port in ports:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind((host, port))
+        sock.setblocking(False)
+        socks.append(sock)
+    delayed = []
+    counter = 0
+    while True:
+        wait = None
+        if delayed:
+            wait = max(0, delayed[0][0] - time.time())
+        readable = select.select(socks, [], [], wait)[0]
+        for sock in readable:
+            while True:
+                try:
+                    data, address = sock.recvfrom(4096)
+                except socket.error:
+                    break
+                answer = build_answer(data, every)
+                if answer is None:
+                    continue
+                if latency:
+                    counter += 1
+                    heapq.heappush(delayed, (time.time() + latency, counter, sock, answer, address))
+                else:
+                    sock.sendto(answer, address)
+        now = time.time()
+        while delayed and delayed[0][0] <= now:
+            (due, count, sock, answer, address) = heapq.heappop(delayed)
+            try:
+                sock.sendto(answer, address)
+            except socket.error:
+                pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--ports', default='5353', help='ports to listen on, e.g. 5301-5308')
+    parser.add_argument('--every', type=int, default=10, help='n<number> exists when number is a multiple of this')
+    parser.add_argument('--latency', type=float, default=0, help='delay every answer by this many ms')
+    args = parser.parse_args()
+    try:
+        serve(parse_ports(args.ports), args.every, args.latency / 1000.0)
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Compare the process and thread engine modes of sublist3r.
+#
+# Both modes run the same engines against the local replay server. Each mode
+# runs in a fresh interpreter so that the peak RSS of one can't leak into the
+# other; the RSS is sampled over the whole process tree (Linux /proc).
+#
+#   python benchmarks/engine_modes.py -e ask,bing,yahoo,ssl,virustotal -n 200
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+import threading
+
+from replay import ENGINES, ReplayServer, replay_engines
+
+
+def tree_rss(pid):
+    """Resident set size in kB of pid and all of its descendants"""
+    children = {}
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open('/proc/%s/stat' % entry) as f:
+                ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+        except (IOError, OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    total = 0
+    stack = [pid]
+    while stack:
+        current = stack.pop()
+        stack.extend(children.get(current, []))
+        try:
+            with open('/proc/%d/status' % current) as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except (IOError, OSError):
+            pass
+    return total
+
+
+def run_child(mode, names, domain, base):
+    import sublist3r
+    enums = replay_engines(names, domain, base)
+    start = time.time()
+    found = sublist3r.run_engines(enums, mode)
+    print(json.dumps({'seconds': time.time() - start, 'found': len(found)}))
+
+
+def measure(mode, args, base):
+    cmd = [sys.executable, os.path.realpath(__file__), '--child', mode,
+           '-e', args.engines, '-d', args.domain, '--base', base]
+    start = time.time()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    peak = [0]
+
+    def sample():
+        while proc.poll() is None:
+            peak[0] = max(peak[0], tree_rss(proc.pid))
+            time.sleep(0.05)
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+    out = proc.communicate()[0]
+    sampler.join()
+    wall = time.time() - start
+    result = json.loads(out.decode('utf-8').strip().splitlines()[-1])
+    return wall, result['seconds'], result['found'], peak[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--engines', default=','.join(sorted(ENGINES)))
+    parser.add_argument('-d', '--domain', default='example.com')
+    parser.add_argument('-n', '--count', type=int, default=50, help='subdomains on every replayed page')
+    parser.add_argument('--child', choices=['process', 'thread'])
+    parser.add_argument('--base')
+    args = parser.parse_args()
+    names = args.engines.split(',')
+
+    if args.child:
+        run_child(args.child, names, args.domain, args.base)
+        return
+
+    server = ReplayServer(args.domain, args.count).start()
+    print("%-8s %10s %12s %8s %12s" % ('mode', 'wall (s)', 'engines (s)', 'found', 'peak RSS'))
+    try:
+        for mode in ('process', 'thread'):
+            wall, seconds, found, rss = measure(mode, args, server.url)
+            print("%-8s %10.2f %12.2f %8d %9.1f MB" % (mode, wall, seconds, found, rss / 1024.0))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
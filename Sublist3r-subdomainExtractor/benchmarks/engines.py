@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Per-engine benchmark of sublist3r against the local replay server.
+#
+# For every engine it reports:
+#   pages     requests the engine sent during enumerate()
+#   enum (s)  end-to-end enumerate() time, HTTP and parsing included
+#   pages/s   pages over the enumerate() time
+#   parse ms  time to get the links out of one response, without any HTTP
+#   found     subdomains found by enumerate()
+#
+# The engines' pacing between pages is there to be polite to the live
+# services, so it is switched off here. Run it before and after touching
+# an engine's regexes to catch parsing regressions:
+#
+#   python benchmarks/engines.py -n 500
+#   python benchmarks/engines.py --fixtures captured/ -d example.com
+
+import json
+import time
+import argparse
+
+import requests
+
+from replay import ENGINES, ReplayServer, replay_engines
+from sublist3r import RateScheduler
+
+# extract_domains() of these engines takes the page already decoded
+PARSE_INPUT = {
+    'virustotal': json.loads,
+}
+
+
+def parse_time(name, page, domain, repeat):
+    """Seconds an engine takes to get the links out of one response"""
+    enum = replay_engines([name], domain, 'http://127.0.0.1:1')[0]
+    response = requests.Response()
+    response.status_code = 200
+    response.encoding = 'utf-8'
+    response._content = page.encode('utf-8')
+    decode = PARSE_INPUT.get(name, lambda page: page)
+    start = time.time()
+    for i in range(repeat):
+        enum.subdomains = []
+        enum.extract_domains(decode(enum.get_response(response)))
+    return (time.time() - start) / repeat
+
+
+def enumerate_time(name, server, domain):
+    """Seconds enumerate() takes, pages requested and subdomains found"""
+    enum = replay_engines([name], domain, server.url)[0]
+    enum.pacer = RateScheduler()
+    before = server.hits.get(name, 0)
+    start = time.time()
+    found = enum.enumerate()
+    seconds = time.time() - start
+    return seconds, server.hits.get(name, 0) - before, len(found or [])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-e', '--engines', default=','.join(sorted(ENGINES)))
+    parser.add_argument('-d', '--domain', default='example.com')
+    parser.add_argument('-n', '--count', type=int, default=50, help='subdomains on every generated page')
+    parser.add_argument('-r', '--repeat', type=int, default=20, help='parses of every page')
+    parser.add_argument('--fixtures', help='directory of captured pages to replay instead of the generated ones')
+    args = parser.parse_args()
+
+    server = ReplayServer(args.domain, args.count, fixtures=args.fixtures).start()
+    print("%-12s %6s %10s %10s %10s %8s" % ('engine', 'pages', 'enum (s)', 'pages/s', 'parse ms', 'found'))
+    try:
+        for name in args.engines.split(','):
+            # the page that carries the results, DNSdumpster's comes back from its form
+            page = server.post_pages.get(name, server.pages[name])
+            parse = parse_time(name, page, args.domain, args.repeat)
+            seconds, pages, found = enumerate_time(name, server, args.domain)
+            print("%-12s %6d %10.3f %10.1f %10.3f %8d" % (name, pages, seconds, pages / seconds if seconds else 0,
+                                                         parse * 1000, found))
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Local replay server for benchmarking the Sublist3r engines offline.
+#
+# Every engine gets a path on the server (/google, /bing, ...) that answers
+# with a canned page in the same markup the real service returns, so the
+# engines' regexes, pagination and stop conditions all run as they would
+# against the live site without sending a single packet out.
+#
+# The pages are generated for the benchmark domain, or read from a directory
+# of captured pages: <engine>.html (or .json) is served for GET requests and
+# <engine>.post.html for POST requests, verbatim. `replay.py --dump DIR`
+# writes the generated pages in that layout as a starting point.
+
+import os
+import sys
+import json
+import argparse
+import functools
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    import urllib.parse as urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    import urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import sublist3r
+
+# engine name on the command line => engine class, same names as sublist3r -e
+ENGINES = {
+    'baidu': sublist3r.BaiduEnum,
+    'yahoo': sublist3r.YahooEnum,
+    'google': sublist3r.GoogleEnum,
+    'bing': sublist3r.BingEnum,
+    'ask': sublist3r.AskEnum,
+    'netcraft': sublist3r.NetcraftEnum,
+    'dnsdumpster': sublist3r.DNSdumpster,
+    'virustotal': sublist3r.Virustotal,
+    'threatcrowd': sublist3r.ThreatCrowd,
+    'ssl': sublist3r.CrtSearch,
+    'passivedns': sublist3r.PassiveDNS,
+}
+
+
+def hostnames(domain, count):
+    return ["host%d.%s" % (i, domain) for i in range(count)]
+
+
+# Each fixture builds a response body for (domain, number of subdomains)
+def google_page(domain, count):
+    return "".join('<div class="g"><cite>%s/index.html</cite></div>' % h for h in hostnames(domain, count))
+
+
+def yahoo_page(domain, count):
+    return "".join('<span class="txt"><span class=" cite fw-xl fz-15px">%s</span></span>' % h for h in hostnames(domain, count))
+
+
+def ask_page(domain, count):
+    return "".join('<p class="web-result-url">%s</p>' % h for h in hostnames(domain, count))
+
+
+def bing_page(domain, count):
+    return "".join('<li class="b_algo"><h2><a href="https://%s/">x</a></h2></li>' % h for h in hostnames(domain, count))
+
+
+def baidu_page(domain, count):
+    return "".join('<a target="_blank" class="c-showurl" style="x">%s/&nbsp;</a>' % h for h in hostnames(domain, count))
+
+
+def netcraft_page(domain, count):
+    return "".join('<a class="results-table__host" href="http://%s/">x</a>' % h for h in hostnames(domain, count))
+
+
+def dnsdumpster_page(domain, count):
+    return '<input type="hidden" name="csrfmiddlewaretoken" value="replaytoken">'
+
+
+def dnsdumpster_results(domain, count):
+    rows = "".join('<tr><td class="col-md-4">%s<br><a href="#">x</a></td></tr>' % h for h in hostnames(domain, count))
+    return '<a name="hostanchor"></a>Host Records (A)<table class="table">%s</table>' % rows
+
+
+def virustotal_page(domain, count):
+    data = [{'type': 'domain', 'id': h} for h in hostnames(domain, count)]
+    return json.dumps({'data': data, 'links': {}})
+
+
+def threatcrowd_page(domain, count):
+    return json.dumps({'subdomains': hostnames(domain, count)})
+
+
+def crtsh_page(domain, count):
+    return "".join('<TR><TD>%s</TD></TR>' % h for h in hostnames(domain, count))
+
+
+def passivedns_page(domain, count):
+    return json.dumps(hostnames(domain, count))
+
+
+FIXTURES = {
+    'google': google_page,
+    'yahoo': yahoo_page,
+    'ask': ask_page,
+    'bing': bing_page,
+    'baidu': baidu_page,
+    'netcraft': netcraft_page,
+    'dnsdumpster': dnsdumpster_page,
+    'virustotal': virustotal_page,
+    'threatcrowd': threatcrowd_page,
+    'ssl': crtsh_page,
+    'passivedns': passivedns_page,
+}
+
+# the response to a POST, for the engines that submit a form
+POST_FIXTURES = {
+    'dnsdumpster': dnsdumpster_results,
+}
+
+FIXTURE_EXTENSIONS = ('.html', '.json', '.txt')
+
+
+def load_fixtures(directory, suffix=''):
+    """Captured pages in directory by engine name"""
+    pages = {}
+    for name in FIXTURES:
+        for extension in FIXTURE_EXTENSIONS:
+            path = os.path.join(directory, name + suffix + extension)
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    pages[name] = f.read().decode('utf-8')
+                break
+    return pages
+
+
+def dump_fixtures(directory, domain='example.com', count=50):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for pages, suffix in ((FIXTURES, ''), (POST_FIXTURES, '.post')):
+        for name, fixture in pages.items():
+            body = fixture(domain, count)
+            extension = '.json' if body.startswith(('{', '[')) else '.html'
+            with open(os.path.join(directory, name + suffix + extension), 'wb') as f:
+                f.write(body.encode('utf-8'))
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body go out in separate writes, don't let Nagle hold the body back
+    disable_nagle_algorithm = True
+
+    def reply(self):
+        url = urlparse.urlparse(self.path)
+        engine = url.path.strip('/').split('/')[0]
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        pages = self.server.pages
+        if self.command == 'POST' and engine in self.server.post_pages:
+            pages = self.server.post_pages
+        if engine not in pages:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.server.hit(engine)
+        body = pages[engine].encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = reply
+    do_POST = reply
+
+    def log_message(self, format, *args):
+        return
+
+
+class ReplayServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+    def __init__(self, domain='example.com', count=50, port=0, fixtures=None):
+        HTTPServer.__init__(self, ('127.0.0.1', port), ReplayHandler)
+        self.pages = dict((name, fixture(domain, count)) for name, fixture in FIXTURES.items())
+        self.post_pages = dict((name, fixture(domain, count)) for name, fixture in POST_FIXTURES.items())
+        if fixtures:
+            self.pages.update(load_fixtures(fixtures))
+            self.post_pages.update(load_fixtures(fixtures, '.post'))
+        self.hits = {}
+        self.hits_lock = threading.Lock()
+        self.thread = None
+
+    def hit(self, engine):
+        with self.hits_lock:
+            self.hits[engine] = self.hits.get(engine, 0) + 1
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def point_engine(enum, name, base):
+    """Rewrite an engine's urls so that it talks to the replay server"""
+    if '{query}' in enum.base_url:
+        enum.base_url = base + '/' + name + '?q={query}&page={page_no}'
+    elif '{domain}' in enum.base_url:
+        enum.base_url = base + '/' + name + '?domain={domain}'
+    else:
+        enum.base_url = base + '/' + name
+    if hasattr(enum, 'url'):
+        # Virustotal formats its first url in the constructor
+        enum.url = enum.base_url.format(domain=enum.domain)
+    if hasattr(enum, 'check_host'):
+        # DNSdumpster resolves every host it finds against 8.8.8.8, accept
+        # them all so that the run measures the engine instead of DNS
+        enum.check_host = functools.partial(accept_host, enum)
+    return enum
+
+
+def accept_host(enum, host):
+    enum.live_subdomains.append(host)
+    return True
+
+
+def replay_engines(names, domain, base, silent=True):
+    enums = []
+    for name in names:
+        enum = ENGINES[name]('http://' + domain, [], silent=silent, verbose=False)
+        enums.append(point_engine(enum, name, base))
+    return enums
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('port', nargs='?', type=int, default=8053)
+    parser.add_argument('-d', '--domain', default='example.com')
+    parser.add_argument('-n', '--count', type=int, default=50, help='subdomains on every generated page')
+    parser.add_argument('--fixtures', help='directory of captured pages to serve instead of the generated ones')
+    parser.add_argument('--dump', help='write the generated pages to this directory and exit')
+    args = parser.parse_args()
+    if args.dump:
+        dump_fixtures(args.dump, args.domain, args.count)
+        sys.exit(0)
+    server = ReplayServer(args.domain, args.count, args.port, args.fixtures)
+    print("[-] Replaying %d engines on %s" % (len(server.pages), server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
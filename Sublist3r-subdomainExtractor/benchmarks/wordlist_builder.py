@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# coding: utf-8
+# Measure the MB/s and peak memory of subbrute's wordlist builder.
+#
+# A dump of --size MB is generated like a certificate transparency or passive
+# DNS export: one record per line with a couple of hostnames in it, the
+# subdomain labels following a long tailed distribution. The builder counts
+# the labels exactly with its partial counts spilled to disk, approximately
+# with the count-min sketch, and with the whole file read in memory like
+# extract_subdomains() used to do.
+#
+#   python benchmarks/wordlist_builder.py --size 200 --top 10000
+
+import os
+import sys
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import collections
+import multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'subbrute'))
+import subbrute
+
+
+def generate(path, size, labels):
+    rng = random.Random(1)
+    words = ['www', 'mail', 'api', 'dev', 'staging', 'cdn'] + ['host%d' % i for i in range(labels)]
+    with open(path, 'w') as f:
+        written = 0
+        while written < size:
+            line = '%s.%s.example%d.com,%s.example%d.co.uk,2024-01-31T08:00:00Z\n' % (
+                words[int(rng.paretovariate(1.2)) % len(words)], words[rng.randrange(len(words))], rng.randrange(100000),
+                words[int(rng.paretovariate(1.2)) % len(words)], rng.randrange(100000))
+            f.write(line)
+            written += len(line)
+
+
+def in_memory(path, top):
+    # the whole file, one findall and a dict of every label
+    with open(path, 'rb') as f:
+        data = f.read()
+    counts = collections.Counter(label for name in subbrute.hostname_match.findall(data.lower())
+                                 for label in subbrute.subdomain_labels(name))
+    # ties in label order, like the other counters
+    return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:top]
+
+
+def measure(kind, path, top, result):
+    import resource
+    start = time.time()
+    if kind == 'memory':
+        words = in_memory(path, top)
+    else:
+        counter = subbrute.sketch_counter() if kind == 'sketch' else subbrute.spill_counter(max_labels=1 << 18)
+        subbrute.count_labels(path, counter)
+        words = counter.top(top)
+        counter.close()
+    seconds = time.time() - start
+    # ru_maxrss is in KB on Linux
+    result.put((seconds, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024, [label for label, count in words]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=200, help='MB of generated dump')
+    parser.add_argument('--labels', type=int, default=2000000, help='distinct subdomain labels')
+    parser.add_argument('--top', type=int, default=10000, help='size of the wordlist')
+    parser.add_argument('--kinds', default='spill,sketch,memory')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, 'dump.txt')
+        generate(path, args.size * 1024 * 1024, args.labels)
+        size = os.path.getsize(path) / (1024.0 * 1024.0)
+
+        exact = None
+        print("%-8s %10s %10s %10s %10s" % ('counter', 'seconds', 'MB/s', 'peak MB', 'top match'))
+        for kind in args.kinds.split(','):
+            # a process per counter, so that every peak RSS is its own
+            result = multiprocessing.Queue()
+            proc = multiprocessing.Process(target=measure, args=(kind, path, args.top, result))
+            proc.start()
+            seconds, peak, words = result.get()
+            proc.join()
+            if exact is None:
+                exact = words
+            match = len(set(words) & set(exact)) / float(max(len(exact), 1))
+            print("%-8s %10.2f %10.1f %10d %9.1f%%" % (kind, seconds, size / seconds, peak, match * 100))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
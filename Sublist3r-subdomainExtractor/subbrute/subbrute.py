@@ -15,8 +15,26 @@ import sys
 import uuid
 import random
 import ctypes
+import time
+import tempfile
+import socket
+import select
+import struct
+import errno
+import collections
+import itertools
+import mmap
+import array
+import threading
+import hashlib
+import bisect
+import heapq
+import sqlite3
+from multiprocessing.pool import ThreadPool
 import dns.resolver
 import dns.rdatatype
+import dns.message
+import dns.rcode
 import json
 
 #Python 2.x and 3.x compatiablity
@@ -32,15 +50,466 @@ import multiprocessing
 #Microsoft compatiablity
 if  sys.platform.startswith('win'):
     #Drop-in replacement,  subbrute + multiprocessing throws exceptions on windows.
-    import threading
     multiprocessing.Process = threading.Thread
 
+#Write the new file next to the old one and swap them,  a kill can't leave half a file.
+def write_json(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmp = tempfile.mkstemp(dir = directory)
+    with os.fdopen(fd, "w") as f:
+        json.dump(data, f)
+    if hasattr(os, "replace"):
+        os.replace(tmp, path)
+    else:
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp, path)
+
+#A set of names shared by every process without a round trip to a manager process.
+#The names are kept as 64 bit hashes in an open addressing table in shared memory.
+#The table is split into stripes,  each with its own lock and its own range of slots.
+#Slots are only ever filled,  so a membership test doesn't need the lock.
+class shared_set(object):
+
+    def __init__(self, capacity = 1 << 16, stripes = 64):
+        #At most half full,  the probes stay short.
+        slots = stripes * 16
+        while slots < capacity * 2:
+            slots <<= 1
+        self.stripes = stripes
+        self.stripe_size = slots // stripes
+        self.table = multiprocessing.RawArray(ctypes.c_uint64, slots)
+        self.locks = [multiprocessing.Lock() for i in range(stripes)]
+
+    @staticmethod
+    def hash(name):
+        if not isinstance(name, bytes):
+            name = name.encode("utf-8")
+        #Zero marks an empty slot.
+        return struct.unpack("<Q", hashlib.md5(name).digest()[:8])[0] or 1
+
+    #Returns the slot of h and whether it is there,  the slot is None if the stripe is full.
+    def find(self, h):
+        first = (h % self.stripes) * self.stripe_size
+        mask = self.stripe_size - 1
+        slot = (h // self.stripes) & mask
+        for i in range(self.stripe_size):
+            value = self.table[first + slot]
+            if value == h:
+                return (first + slot, True)
+            if not value:
+                return (first + slot, False)
+            slot = (slot + 1) & mask
+        return (None, False)
+
+    def __contains__(self, name):
+        return self.find(self.hash(name))[1]
+
+    #Returns True if the name wasn't in the set.
+    #The test and the insert are one step,  two processes can't both add the same name.
+    def add(self, name):
+        h = self.hash(name)
+        with self.locks[h % self.stripes]:
+            (slot, found) = self.find(h)
+            if found:
+                return False
+            if slot is not None:
+                self.table[slot] = h
+            #else the stripe is full,  a name looked up twice is better than a name never looked up.
+            return True
+
+#What we learned about each resolver,  kept in a file across runs.
+#server => {"latency": seconds per query, "error_rate": share of failed queries, "status": "ok", "spam" or "unreliable", "checked": time}
+class resolver_scoreboard(object):
+    #Averages lean this much towards the latest run.
+    weight = 0.3
+    #Resolvers that failed are left alone for this long.
+    penalty = 24 * 60 * 60
+
+    def __init__(self, path = None):
+        self.path = path
+        self.lock = threading.Lock()
+        self.scores = self.read()
+        self.saved = time.time()
+
+    def read(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def update(self, server, queries, errors, elapsed, status):
+        if not queries:
+            return
+        with self.lock:
+            score = self.scores.get(server)
+            latency = elapsed / queries
+            error_rate = float(errors) / queries
+            if score:
+                latency = score["latency"] * (1 - self.weight) + latency * self.weight
+                error_rate = score["error_rate"] * (1 - self.weight) + error_rate * self.weight
+            self.scores[server] = {"latency": latency, "error_rate": error_rate, "status": status, "checked": time.time()}
+
+    #Known good resolvers first,  fastest first.  Then the ones we don't know,  then the ones that failed a while ago.
+    #Resolvers that failed recently are left out.
+    def order(self, servers):
+        good = []
+        unknown = []
+        bad = []
+        now = time.time()
+        for server in servers:
+            score = self.scores.get(server)
+            if not score:
+                unknown.append(server)
+            elif score["status"] == "ok" and score["error_rate"] < 0.5:
+                good.append(server)
+            elif now - score["checked"] > self.penalty:
+                bad.append(server)
+            else:
+                trace("Skipped nameserver - failed recently:", server)
+        good.sort(key = lambda server: self.scores[server]["latency"])
+        return good + unknown + bad
+
+    def save(self):
+        self.saved = time.time()
+        if not self.path:
+            return
+        with self.lock:
+            #Another run may have saved in the mean time,  keep the newest score of each resolver.
+            scores = self.read()
+            for (server, score) in self.scores.items():
+                if server not in scores or scores[server]["checked"] <= score["checked"]:
+                    scores[server] = score
+            self.scores = scores
+            write_json(self.path, scores)
+
+#Wildcard answers of a target,  learned once and shared by every resolver and by the next runs.
+#"target record_type" => {"ips": [...], "cnames": [...], "learned": time, "ttl": seconds}
+class wildcard_store(object):
+    #Wildcard records do change,  learn them again after this long.
+    ttl = 6 * 60 * 60
+
+    def __init__(self, target, record_type, path = None):
+        self.key = "%s %s" % (target, record_type)
+        self.path = path
+        self.lock = threading.Lock()
+        #Held by the resolver that is learning the fingerprint,  the others wait and only confirm it.
+        self.learning = threading.Lock()
+        self.ips = set()
+        self.cnames = set()
+        self.learned = None
+        entry = self.read().get(self.key)
+        if entry and time.time() - entry["learned"] < entry["ttl"]:
+            self.ips = set(entry["ips"])
+            self.cnames = set(entry["cnames"])
+            self.learned = entry["learned"]
+
+    def read(self):
+        if not self.path or not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (IOError, ValueError):
+            return {}
+
+    def known(self):
+        return self.learned is not None
+
+    #Returns the answers that weren't part of the fingerprint.
+    def add(self, ips, cnames):
+        with self.lock:
+            new = (ips - self.ips) | (cnames - self.cnames)
+            self.ips |= ips
+            self.cnames |= cnames
+        return new
+
+    #A resolver has probed until it got no new wildcards,  the fingerprint is complete.
+    def learn(self):
+        with self.lock:
+            if self.learned is None:
+                self.learned = time.time()
+
+    def save(self):
+        if not self.path or not self.known():
+            return
+        with self.lock:
+            now = time.time()
+            fingerprints = dict((key, entry) for (key, entry) in self.read().items() if now - entry["learned"] < entry["ttl"])
+            fingerprints[self.key] = {"ips": sorted(self.ips), "cnames": sorted(self.cnames), "learned": self.learned, "ttl": self.ttl}
+            write_json(self.path, fingerprints)
+
+#Answers of the DNS queries,  kept for their TTL and shared by the next runs.
+#An in-process LRU in front of a SQLite file that every lookup process opens on its own,  in WAL mode
+#so that they read while another one writes.  The writes are batched,  flush() commits them.
+#A name that doesn't exist is cached for the negative TTL of its SOA (RFC 2308) under the empty record type.
+#get() returns the answers as strings,  False for a name that doesn't exist and None when nothing is known.
+class answer_cache(object):
+    #No answer is trusted for longer than this,  whatever its TTL.
+    max_ttl = 24 * 60 * 60
+
+    def __init__(self, path = None, size = 10000, batch_size = 256):
+        self.path = path
+        self.size = size
+        self.batch_size = batch_size
+        self.lru = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.pending = []
+        self.db = None
+        self.pid = None
+        if path:
+            try:
+                with self.connect() as db:
+                    db.execute("DELETE FROM answers WHERE expires < ?", (time.time(),))
+            except sqlite3.Error as e:
+                trace("answer cache failure:", e)
+
+    #A connection can't cross a fork,  every process opens its own.
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["lock"] = None
+        state["db"] = None
+        state["pid"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def connect(self):
+        if self.db is None or self.pid != os.getpid():
+            directory = os.path.dirname(os.path.abspath(self.path))
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            self.db = sqlite3.connect(self.path, timeout = 30, check_same_thread = False)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("PRAGMA synchronous=NORMAL")
+            self.db.execute("CREATE TABLE IF NOT EXISTS answers (name TEXT NOT NULL, record_type TEXT NOT NULL, "
+                            "answers TEXT, expires REAL NOT NULL, PRIMARY KEY (name, record_type))")
+            self.pid = os.getpid()
+        return self.db
+
+    def remember(self, key, expires, value):
+        self.lru.pop(key, None)
+        self.lru[key] = (expires, value)
+        while len(self.lru) > self.size:
+            self.lru.popitem(last = False)
+
+    def get(self, name, record_type = "A"):
+        name = name.lower()
+        now = time.time()
+        with self.lock:
+            for key in ((name, record_type), (name, "")):
+                entry = self.lru.pop(key, None)
+                if entry is not None and entry[0] > now:
+                    self.lru[key] = entry
+                    return entry[1]
+            if not self.path:
+                return None
+            try:
+                rows = self.connect().execute("SELECT record_type, answers, expires FROM answers WHERE name = ? AND record_type IN (?, '') AND expires > ?",
+                                              (name, record_type, now)).fetchall()
+            except sqlite3.Error as e:
+                trace("answer cache failure:", e)
+                return None
+            for (rtype, answers, expires) in rows:
+                value = False
+                if answers is not None:
+                    value = json.loads(answers)
+                self.remember((name, rtype), expires, value)
+                return value
+        return None
+
+    def put(self, name, record_type, answers, ttl):
+        if not answers:
+            return
+        self.store(name.lower(), record_type, list(answers), ttl)
+
+    def put_nxdomain(self, name, ttl):
+        self.store(name.lower(), "", False, ttl)
+
+    def store(self, name, record_type, value, ttl):
+        #Without a TTL,  an NXDOMAIN without a SOA for one,  the answer isn't cached.
+        if not ttl or ttl <= 0:
+            return
+        expires = time.time() + min(ttl, self.max_ttl)
+        with self.lock:
+            self.remember((name, record_type), expires, value)
+            if self.path:
+                self.pending.append((name, record_type, json.dumps(value) if value is not False else None, expires))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            try:
+                with self.connect() as db:
+                    db.executemany("INSERT OR REPLACE INTO answers (name, record_type, answers, expires) VALUES (?, ?, ?, ?)", self.pending)
+            except sqlite3.Error as e:
+                #It is only a cache,  the answers are asked again next time.
+                trace("answer cache failure:", e)
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            if self.db is not None and self.pid == os.getpid():
+                self.db.close()
+            self.db = None
+
+#Seconds until a dnspython answer expires,  the smallest TTL of the records along its CNAME chain.
+def answer_ttl(answer):
+    return max(0, int(answer.expiration - time.time()))
+
+#The negative TTL of an NXDOMAIN response,  the smaller of the TTL of its SOA and the SOA minimum field.
+#None when the authority section has no SOA,  such an answer isn't cached.
+def negative_ttl(response):
+    if response is None:
+        return None
+    for rrset in response.authority:
+        if rrset.rdtype == dns.rdatatype.SOA:
+            return min(rrset.ttl, rrset[0].minimum)
+    return None
+
+#The response of an NXDOMAIN exception,  only the newer versions of dnspython keep it.
+def nxdomain_response(e):
+    responses = getattr(e, "kwargs", {}).get("responses") or {}
+    for response in responses.values():
+        return response
+    return None
+
+#A query through the answer cache,  cache may be None.  The answers as strings,  False for a name
+#that doesn't exist.  The other failures raise as resolver.query() does.
+def cached_query(resolver, cache, hostname, record_type = "A"):
+    if cache is not None:
+        cached = cache.get(hostname, record_type)
+        if cached is not None:
+            return cached
+    try:
+        answer = resolver.query(hostname, record_type)
+    except dns.resolver.NXDOMAIN as e:
+        if cache is not None:
+            cache.put_nxdomain(hostname, negative_ttl(nxdomain_response(e)))
+        return False
+    answers = [str(rr) for rr in answer]
+    if cache is not None:
+        cache.put(hostname, record_type, answers, answer_ttl(answer))
+    return answers
+
+#Upper bounds of the latency histogram buckets in ms,  the last bucket takes everything slower.
+latency_buckets = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+#The name of a resolver in the metrics,  the port only when it isn't 53.
+def nameserver_name(host, port = 53):
+    if port == 53:
+        return host
+    return "%s#%d" % (host, port)
+
+#Counters of the queries sent to every resolver.
+#Each lookup process keeps its own and sends them to the parent along with its "done" batches,
+#a query only costs a few dict and list updates.  The parent merges them into one.
+#resolver => {"queries": n, "status": {"NOERROR": n, "NXDOMAIN": n, "Timeout": n...}, "elapsed": seconds, "latency": [count per bucket]}
+class dns_metrics(object):
+
+    def __init__(self):
+        self.resolvers = {}
+        #Time spent waiting for verify_nameservers to hand out a resolver.
+        self.resolver_wait = 0.0
+        #Lookups answered by the answer cache,  without a query.
+        self.cache_hits = 0
+
+    def record(self, resolver, status, elapsed):
+        stats = self.resolvers.get(resolver)
+        if stats is None:
+            stats = self.resolvers[resolver] = {"queries": 0, "status": {}, "elapsed": 0.0, "latency": [0] * (len(latency_buckets) + 1)}
+        stats["queries"] += 1
+        stats["status"][status] = stats["status"].get(status, 0) + 1
+        stats["elapsed"] += elapsed
+        stats["latency"][bisect.bisect_left(latency_buckets, elapsed * 1000)] += 1
+
+    #The counters since the last take,  for the parent.
+    def take(self):
+        if not self.resolvers and not self.resolver_wait and not self.cache_hits:
+            return None
+        data = (self.resolvers, self.resolver_wait, self.cache_hits)
+        self.resolvers = {}
+        self.resolver_wait = 0.0
+        self.cache_hits = 0
+        return data
+
+    def merge(self, data):
+        (resolvers, resolver_wait, cache_hits) = data
+        self.resolver_wait += resolver_wait
+        self.cache_hits += cache_hits
+        for (resolver, stats) in resolvers.items():
+            total = self.resolvers.get(resolver)
+            if total is None:
+                self.resolvers[resolver] = stats
+                continue
+            total["queries"] += stats["queries"]
+            total["elapsed"] += stats["elapsed"]
+            for (status, count) in stats["status"].items():
+                total["status"][status] = total["status"].get(status, 0) + count
+            total["latency"] = [a + b for (a, b) in zip(total["latency"], stats["latency"])]
+
+    def queries(self):
+        return sum(stats["queries"] for stats in self.resolvers.values())
+
+    #The upper bound of the bucket that holds the given share of the queries.
+    @staticmethod
+    def percentile(latency, share):
+        rank = share * sum(latency)
+        seen = 0
+        for (i, count) in enumerate(latency):
+            seen += count
+            if count and seen >= rank:
+                if i < len(latency_buckets):
+                    return latency_buckets[i]
+                return None
+        return None
+
+    def report(self, elapsed):
+        resolvers = {}
+        status = {}
+        for (resolver, stats) in self.resolvers.items():
+            for (name, count) in stats["status"].items():
+                status[name] = status.get(name, 0) + count
+            resolvers[resolver] = {"queries": stats["queries"],
+                                   "status": stats["status"],
+                                   "mean_ms": round(stats["elapsed"] * 1000 / stats["queries"], 1),
+                                   "p50_ms": self.percentile(stats["latency"], 0.5),
+                                   "p90_ms": self.percentile(stats["latency"], 0.9),
+                                   "p99_ms": self.percentile(stats["latency"], 0.99),
+                                   "latency_ms": dict(zip([str(b) for b in latency_buckets] + ["inf"], stats["latency"]))}
+        queries = self.queries()
+        return {"elapsed": round(elapsed, 3),
+                "queries": queries,
+                "qps": round(queries / elapsed, 1) if elapsed else None,
+                "status": status,
+                "resolver_wait": round(self.resolver_wait, 3),
+                "cache_hits": self.cache_hits,
+                "resolvers": resolvers}
+
+#A resolver is handed out once it can detect the wildcards of every target.
 class verify_nameservers(multiprocessing.Process):
 
-    def __init__(self, target, record_type, resolver_q, resolver_list, wildcards):
+    def __init__(self, targets, record_type, resolver_q, resolver_list, wildcards, scoreboard = None, fingerprints = None, concurrency = 32, shared_q = None):
         multiprocessing.Process.__init__(self, target = self.run)
         self.daemon = True
         signal_init()
+        #Every resolver handed out on resolver_q is also put on shared_q,  for a process that shares them
+        #with the others instead of taking one for itself.
+        self.shared_q = shared_q
+        #Resolvers are qualified this many at a time.
+        self.concurrency = concurrency
+        self.scoreboard = resolver_scoreboard(scoreboard)
 
         self.time_to_die = False
         self.resolver_q = resolver_q
@@ -50,10 +519,11 @@ class verify_nameservers(multiprocessing.Process):
         self.record_type = "A"
         if record_type == "AAAA":
             self.record_type = record_type
+        self.fingerprints = dict((target, wildcard_store(target, self.record_type, fingerprints)) for target in targets)
         self.resolver_list = resolver_list
         resolver = dns.resolver.Resolver()
-        #The domain provided by the user.
-        self.target = target
+        #The domains provided by the user.
+        self.targets = targets
         #1 website in the world,  modify the following line when this status changes.
         #www.google.cn,  I'm looking at you ;)
         self.most_popular_website = "www.google.com"
@@ -84,39 +554,76 @@ class verify_nameservers(multiprocessing.Process):
                 self.resolver_q.put(nameserver, timeout = 1)
                 trace("Added nameserver:", nameserver)
                 keep_trying = False
+                if self.shared_q is not None:
+                    self.shared_q.put(nameserver)
             except Exception as e:
                 if type(e) == Queue.Full or str(type(e)) == "<class 'queue.Full'>":
                     keep_trying = True
 
+    #A resolver of our own for every server,  the servers are qualified in parallel.
+    def server_resolver(self, server):
+        resolver = dns.resolver.Resolver(configure = False)
+        resolver.timeout = self.resolver.timeout
+        resolver.lifetime = self.resolver.lifetime
+        (host, port) = split_nameserver(server)
+        resolver.nameserver_ports[host] = port
+        resolver.nameservers = [host]
+        return resolver
+
+    def qualify(self, server):
+        stats = {"queries": 0, "errors": 0, "elapsed": 0.0, "status": "ok"}
+        qualified = False
+        if not self.time_to_die:
+            try:
+                resolver = self.server_resolver(server)
+                #Only add the nameserver to the queue if we can detect wildcards. 
+                qualified = not self.spam(resolver, stats) and all(self.find_wildcards(target, resolver, stats) for target in self.targets)
+            except Exception as e:
+                #Rejected server :(
+                trace("Rejected nameserver - unreliable:", server, type(e)) 
+                stats["status"] = "unreliable"
+            self.scoreboard.update(server, stats["queries"], stats["errors"], stats["elapsed"], stats["status"])
+        return (server, qualified)
+
     def verify(self, nameserver_list):
         added_resolver = False
+        servers = []
         for server in nameserver_list:
-            if self.time_to_die:
-                #We are done here.
-                break
             server = server.strip()
-            if server:
-                self.resolver.nameservers = [server]
-                try:
-                    #test_result = self.resolver.query(self.most_popular_website, "A")
-                    #should throw an exception before this line.
-                    if True:#test_result:
-                        #Only add the nameserver to the queue if we can detect wildcards. 
-                        if(self.find_wildcards(self.target)):# and self.find_wildcards(".com")
-                            #wildcards have been added to the set, it is now safe to be added to the queue.
-                            #blocking queue,  this process will halt on put() when the queue is full:
-                            self.add_nameserver(server)
-                            added_resolver = True
-                        else:
-                            trace("Rejected nameserver - wildcard:", server)
-                except Exception as e:
-                    #Rejected server :(
-                    trace("Rejected nameserver - unreliable:", server, type(e)) 
+            if server and server not in servers:
+                servers.append(server)
+        pool = ThreadPool(max(1, min(self.concurrency, len(servers))))
+        try:
+            #Known good and fast resolvers are qualified first,  they are the first ones handed out.
+            for (server, qualified) in pool.imap_unordered(self.qualify, self.scoreboard.order(servers)):
+                if self.time_to_die:
+                    #We are done here.
+                    break
+                if qualified:
+                    #wildcards have been added to the set, it is now safe to be added to the queue.
+                    #blocking queue,  this process will halt on put() when the queue is full:
+                    self.add_nameserver(server)
+                    added_resolver = True
+                else:
+                    trace("Rejected nameserver - wildcard:", server)
+                #This process is killed when the run is over,  don't wait until the end of the list.
+                if time.time() - self.scoreboard.saved > 5:
+                    self.scoreboard.save()
+        finally:
+            pool.terminate()
+            self.scoreboard.save()
+            for fingerprint in self.fingerprints.values():
+                fingerprint.save()
         return added_resolver
 
     def run(self):
         #Every user will get a different set of resovlers, this helps redistribute traffic.
+        #The scoreboard puts the ones that we know to be good in front.
         random.shuffle(self.resolver_list)
+        #Wildcards of a previous run are known before the first resolver is handed out.
+        for (target, fingerprint) in self.fingerprints.items():
+            for w in fingerprint.ips:
+                self.wildcards.add(wildcard_key(target, w))
         if not self.verify(self.resolver_list):
             #This should never happen,  inform the user.
             sys.stderr.write('Warning: No nameservers found, trying fallback list.\n')
@@ -127,23 +634,90 @@ class verify_nameservers(multiprocessing.Process):
             self.resolver_q.put(False, timeout = 1)
         except:
             pass
+        if self.shared_q is not None:
+            self.shared_q.put(False)
 
-    #Only add the nameserver to the queue if we can detect wildcards. 
-    #Returns False on error.
-    def find_wildcards(self, host):
-        #We want sovle the following three problems:
-        #1)The target might have a wildcard DNS record.
-        #2)The target maybe using geolocaiton-aware DNS.
-        #3)The DNS server we are testing may respond to non-exsistant 'A' records with advertizements.
-        #I have seen a CloudFlare Enterprise customer with the first two conditions.
+    #Time every query of a qualification,  timeouts and broken answers count as errors.
+    def query(self, resolver, stats, name, rdtype):
+        start = time.time()
         try:
-            #This is case #3,  these spam nameservers seem to be more trouble then they are worth.
-             wildtest = self.resolver.query(uuid.uuid4().hex + ".com", "A")
+            return resolver.query(name, rdtype)
+        except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.name.EmptyLabel):
+            raise
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            stats["queries"] += 1
+            stats["elapsed"] += time.time() - start
+
+    #We want sovle the following three problems:
+    #1)The target might have a wildcard DNS record.
+    #2)The target maybe using geolocaiton-aware DNS.
+    #3)The DNS server we are testing may respond to non-exsistant 'A' records with advertizements.
+    #I have seen a CloudFlare Enterprise customer with the first two conditions.
+    #This is case #3,  these spam nameservers seem to be more trouble then they are worth.
+    def spam(self, resolver, stats):
+        try:
+             wildtest = self.query(resolver, stats, uuid.uuid4().hex + ".com", "A")
              if len(wildtest):
-                trace("Spam DNS detected:", host)
-                return False
+                trace("Spam DNS detected:", resolver.nameservers)
+                stats["status"] = "spam"
+                return True
         except:
             pass
+        return False
+
+    #Only add the nameserver to the queue if we can detect wildcards. 
+    #Returns False on error.
+    def find_wildcards(self, host, resolver = None, stats = None):
+        resolver = resolver or self.resolver
+        if stats is None:
+            stats = {"queries": 0, "errors": 0, "elapsed": 0.0, "status": "ok"}
+        fingerprint = self.fingerprints[host]
+        if fingerprint.known():
+            return self.confirm_wildcards(host, resolver, stats)
+        with fingerprint.learning:
+            if fingerprint.known():
+                #Another resolver learned them while we waited.
+                return self.confirm_wildcards(host, resolver, stats)
+            return self.learn_wildcards(host, resolver, stats)
+
+    #The wildcards are known,  a single probe is enough to confirm them.
+    def confirm_wildcards(self, host, resolver, stats):
+        try:
+            if not self.probe_wildcards(host, resolver, stats):
+                return True
+        except (dns.resolver.NXDOMAIN, dns.name.EmptyLabel):
+            #not found
+            return True
+        except Exception as e:
+            #This resolver maybe flakey, we don't want it for our tests.
+            trace("wildcard exception:", resolver.nameservers, type(e)) 
+            stats["status"] = "unreliable"
+            return False
+        #This resolver sees other wildcards,  maybe geolocaiton-aware DNS.  Look for all of them.
+        return self.learn_wildcards(host, resolver, stats)
+
+    #Query a random subdomain of host,  returns the wildcards we didn't know about.
+    def probe_wildcards(self, host, resolver, stats):
+        testdomain = "%s.%s" % (uuid.uuid4().hex, host)
+        wildtest = self.query(resolver, stats, testdomain, self.record_type)
+        ips = set()
+        cnames = set()
+        if wildtest:
+            #This 'A' record may contain a list of wildcards.
+            for w in wildtest:
+                ips.add(str(w))
+            #The wildcard may be a CNAME to another host.
+            if wildtest.canonical_name != wildtest.qname:
+                cnames.add(str(wildtest.canonical_name))
+        for w in ips:
+            #wildcards were detected.
+            self.wildcards.add(wildcard_key(host, w))
+        return self.fingerprints[host].add(ips, cnames)
+
+    def learn_wildcards(self, host, resolver, stats):
         test_counter = 8
         looking_for_wildcards = True
         while looking_for_wildcards and test_counter >= 0 :
@@ -151,115 +725,214 @@ class verify_nameservers(multiprocessing.Process):
             #Don't get lost, this nameserver could be playing tricks.
             test_counter -= 1            
             try:
-                testdomain = "%s.%s" % (uuid.uuid4().hex, host)
-                wildtest = self.resolver.query(testdomain, self.record_type)
-                #This 'A' record may contain a list of wildcards.
-                if wildtest:
-                    for w in wildtest:
-                        w = str(w)
-                        if w not in self.wildcards:
-                            #wildcards were detected.
-                            self.wildcards[w] = None
-                            #We found atleast one wildcard, look for more.
-                            looking_for_wildcards = True
+                if self.probe_wildcards(host, resolver, stats):
+                    #We found atleast one wildcard, look for more.
+                    looking_for_wildcards = True
             except Exception as e:
                 if type(e) == dns.resolver.NXDOMAIN or type(e) == dns.name.EmptyLabel:
                     #not found
+                    self.fingerprints[host].learn()
                     return True
                 else:
                     #This resolver maybe flakey, we don't want it for our tests.
-                    trace("wildcard exception:", self.resolver.nameservers, type(e)) 
+                    trace("wildcard exception:", resolver.nameservers, type(e)) 
+                    stats["status"] = "unreliable"
                     return False 
         #If we hit the end of our depth counter and,
         #there are still wildcards, then reject this nameserver because it smells bad.
-        return (test_counter >= 0)
+        if test_counter >= 0:
+            self.fingerprints[host].learn()
+            return True
+        return False
 
+#Looks up the work of in_q,  the slow lane is one of these with a longer timeout.
+#A timeout or a host that no resolver will answer goes back to the parent,  which retries it later.
 class lookup(multiprocessing.Process):
 
-    def __init__(self, in_q, out_q, resolver_q, domain, wildcards, spider_blacklist):
+    def __init__(self, in_q, out_q, resolver_q, targets, wildcards, spider_blacklist, timeout = None, max_retries = 4, cache = None):
         multiprocessing.Process.__init__(self, target = self.run)
         signal_init()
         self.required_nameservers = 16
+        self.max_retries = max_retries
         self.in_q = in_q
         self.out_q = out_q
         self.resolver_q = resolver_q        
-        self.domain = domain
+        self.targets = targets
         self.wildcards = wildcards
         self.spider_blacklist = spider_blacklist
         self.resolver = dns.resolver.Resolver()
         #Force pydns to use our nameservers
         self.resolver.nameservers = []
+        #The resolvers of this process as host#port,  the resolver is only ever given the one a query goes to.
+        self.nameservers = []
+        if timeout:
+            self.resolver.timeout = timeout
+            self.resolver.lifetime = timeout * 2
+        #The resolvers that already failed the host being checked,  and the one that got the last query.
+        self.avoid = ()
+        self.last_nameserver = None
+        #The resolvers of this process take turns.
+        self.turn = 0
+        #Finished work is acknowledged to the parent in batches,  so it knows how far the run got.
+        self.done = []
+        self.requeued = False
+        self.metrics = dns_metrics()
+        #An answer_cache,  the answers of the earlier runs that haven't expired are used without a query.
+        self.cache = cache
+
+    #The parent owns the work queue,  it schedules the retries and spidered hosts.
+    def requeue(self, work):
+        self.requeued = True
+        self.out_q.put(("requeue", work))
+
+    def flush_done(self):
+        if self.cache is not None:
+            self.cache.flush()
+        metrics = self.metrics.take()
+        if metrics:
+            self.out_q.put(("metrics", metrics))
+        if self.done:
+            self.out_q.put(("done", self.done))
+            self.done = []
+
+    #The same name as in the metrics,  several resolvers may share an address on different ports.
+    def nameserver(self, server):
+        return nameserver_name(*split_nameserver(server))
 
     def get_ns(self):
         ret = []
         try:
             ret = [self.resolver_q.get_nowait()]
-            if ret == False:
+            if ret == [False]:
                 #Queue is empty,  inform the rest.
                 self.resolver_q.put(False)
                 ret = []
+            else:
+                ret = [self.nameserver(ret[0])]
         except:
             pass      
         return ret  
 
     def get_ns_blocking(self):
         ret = []
+        start = time.time()
         ret = [self.resolver_q.get()]
-        if ret == False:
+        self.metrics.resolver_wait += time.time() - start
+        if ret == [False]:
             trace("get_ns_blocking - Resolver list is empty.")
             #Queue is empty,  inform the rest.
             self.resolver_q.put(False)
             ret = []
+        else:
+            ret = [self.nameserver(ret[0])]
         return ret
 
-    def check(self, host, record_type = "A", retries = 0):
+    #Every query goes to a single resolver,  so that a failure is pinned on the one that was asked and
+    #the query is timed and counted against it.  The resolvers take turns,  and a retry never goes to
+    #a resolver that already failed the host as long as this process has another one.
+    def query(self, host, record_type = "A"):
+        if self.nameservers:
+            untried = [ns for ns in self.nameservers if ns not in self.avoid]
+            if not untried:
+                trace("No untried resolver left for:", host, "asking one that failed it again.")
+                untried = self.nameservers
+            self.turn += 1
+            self.last_nameserver = untried[self.turn % len(untried)]
+            (address, port) = split_nameserver(self.last_nameserver)
+            self.resolver.nameserver_ports[address] = port
+            self.resolver.nameservers = [address]
+        else:
+            #dnspython raises NoNameservers.
+            self.last_nameserver = "none"
+            self.resolver.nameservers = []
+        start = time.time()
+        try:
+            resp = self.resolver.query(host, record_type)
+        except Exception as e:
+            self.metrics.record(self.last_nameserver, type(e).__name__, time.time() - start)
+            raise
+        self.metrics.record(self.last_nameserver, "NOERROR", time.time() - start)
+        return resp
+
+    def remember(self, host, record_type, resp):
+        if self.cache is not None:
+            self.cache.put(host, record_type, [str(a) for a in resp], answer_ttl(resp))
+
+    #The resolvers failed this host every time,  the parent reports it instead of dropping it.
+    def unresolved(self, host, record_type):
+        trace("unresolved:", host)
+        self.out_q.put(("unresolved", host, record_type))
+
+    def check(self, host, record_type = "A", retries = 0, index = -1, tried = ()):
         trace("Checking:", host)
+        name = host
+        if self.cache is not None:
+            cached = self.cache.get(host, record_type or "A")
+            if cached is not None:
+                self.metrics.cache_hits += 1
+                return cached
         cname_record = []
-        retries = 0        
-        if len(self.resolver.nameservers) <= self.required_nameservers:
+        cname_ttl = answer_cache.max_ttl
+        if len(self.nameservers) <= self.required_nameservers or (tried and len(tried) >= len(self.nameservers)):
             #This process needs more nameservers,  lets see if we have one avaible
-            self.resolver.nameservers += self.get_ns()
+            self.nameservers += self.get_ns()
+        self.avoid = frozenset(tried)
         #Ok we should be good to go.
         while True:
             try:
                 #Query the nameserver, this is not simple...
                 if not record_type or record_type == "A":
-                    resp = self.resolver.query(host)
+                    resp = self.query(host)
+                    self.remember(host, "A", resp)
                     #Crawl the response
-                    hosts = extract_hosts(str(resp.response), self.domain)
+                    hosts = extract_hosts(str(resp.response), find_target(host, self.targets))
                     for h in hosts:
-                        if h not in self.spider_blacklist:
-                            self.spider_blacklist[h]=None
+                        if self.spider_blacklist.add(h):
                             trace("Found host with spider:", h)
-                            self.in_q.put((h, record_type, 0))
+                            self.out_q.put(("spider", (h, record_type, 0, -1)))
                     return resp
                 if record_type == "CNAME":
                     #A max 20 lookups
                     for x in range(20):
                         try:
-                            resp = self.resolver.query(host, record_type)
+                            resp = self.query(host, record_type)
                         except dns.resolver.NoAnswer:
                             resp = False
                             pass
                         if resp and resp[0]:
                             host = str(resp[0]).rstrip(".")
                             cname_record.append(host)
+                            cname_ttl = min(cname_ttl, answer_ttl(resp))
                         else:
+                            if self.cache is not None:
+                                self.cache.put(name, record_type, cname_record, cname_ttl)
                             return cname_record                    
                 else:
                     #All other records:
-                    return self.resolver.query(host, record_type)
+                    resp = self.query(host, record_type)
+                    self.remember(host, record_type, resp)
+                    return resp
 
             except Exception as e:
-                if type(e) == dns.resolver.NoNameservers:
-                    #We should never be here.
-                    #We must block,  another process should try this host.
-                    #do we need a limit?
-                    self.in_q.put((host, record_type, 0))
-                    self.resolver.nameservers += self.get_ns_blocking()
+                if type(e) == dns.resolver.NoNameservers and not self.nameservers:
+                    #Nobody was asked,  that isn't a failure of the host.  Another process should take it
+                    #while this one waits for a resolver.
+                    self.requeue((host, record_type, retries, index, list(tried)))
+                    self.nameservers += self.get_ns_blocking()
+                    return False
+                elif type(e) == dns.resolver.NoNameservers:
+                    #Every resolver we asked failed this host.
+                    if retries >= self.max_retries:
+                        self.unresolved(host, record_type)
+                        return False
+                    #Another process should try this host after a while,  on other resolvers.
+                    self.requeue((host, record_type, retries + 1, index, list(tried) + [self.last_nameserver]))
+                    self.nameservers += self.get_ns()
                     return False
                 elif type(e) == dns.resolver.NXDOMAIN:
                     #"Non-existent domain name."
+                    if self.cache is not None:
+                        self.cache.put_nxdomain(host, negative_ttl(nxdomain_response(e)))
                     return False
                 elif type(e) == dns.resolver.NoAnswer:
                     #"The response did not contain an answer."
@@ -270,18 +943,14 @@ class lookup(multiprocessing.Process):
                 elif type(e) == dns.resolver.Timeout:
                     trace("lookup failure:", host, retries)
                     #Check if it is time to give up.
-                    if retries >= 3:
-                        if retries > 3:
-                            #Sometimes 'internal use' subdomains will timeout for every request.
-                            #As far as I'm concerned, the authorative name server has told us this domain exists,
-                            #we just can't know the address value using this method.
-                            return ['Mutiple Query Timeout - External address resolution was restricted']
-                        else:
-                            #Maybe another process can take a crack at it.
-                            self.in_q.put((host, record_type, retries + 1))
-                        return False
-                    retries += 1
-                    #retry...
+                    if retries >= self.max_retries:
+                        #Sometimes 'internal use' subdomains will timeout for every request.
+                        #As far as I'm concerned, the authorative name server has told us this domain exists,
+                        #we just can't know the address value using this method.
+                        return ['Mutiple Query Timeout - External address resolution was restricted']
+                    #Don't hold up this process,  the parent retries it after a backoff on another resolver.
+                    self.requeue((host, record_type, retries + 1, index, list(tried) + [self.last_nameserver]))
+                    return False
                 elif type(e) == IndexError:
                     #Some old versions of dnspython throw this error,
                     #doesn't seem to affect the results,  and it was fixed in later versions.
@@ -289,7 +958,7 @@ class lookup(multiprocessing.Process):
                 elif type(e) == TypeError:
                     # We'll get here if the number procs > number of resolvers.
                     # This is an internal error do we need a limit?
-                    self.in_q.put((host, record_type, 0))
+                    self.requeue((host, record_type, retries, index, list(tried)))
                     return False
                 elif type(e) == dns.rdatatype.UnknownRdatatype:
                     error("DNS record type not supported:", record_type)
@@ -299,39 +968,38 @@ class lookup(multiprocessing.Process):
                     raise e
 
     def run(self):
-        #This process needs one resolver before it can start looking.
-        self.resolver.nameservers += self.get_ns_blocking()
         while True:
+            #This process needs a resolver before it can start looking.
+            if not self.nameservers:
+                self.nameservers += self.get_ns_blocking()
+            if not self.nameservers:
+                #Every resolver is taken,  the work is left to the processes that have one.
+                trace("No resolver left for this lookup process.")
+                self.flush_done()
+                self.out_q.put(False)
+                break
             found_addresses = []
-            work = self.in_q.get()
-            #Check if we have hit the end marker
-            while not work:
-                #Look for a re-queued lookup
-                try:
-                    work = self.in_q.get(blocking = False)
-                    #if we took the end marker of the queue we need to put it back
-                    if work:
-                        self.in_q.put(False)
-                except:#Queue.Empty
-                    trace('End of work queue')
-                    #There isn't an item behind the end marker
-                    work = False
-                    break
+            try:
+                work = self.in_q.get_nowait()
+            except Queue.Empty:
+                #We are about to block,  tell the parent what we have finished.
+                self.flush_done()
+                work = self.in_q.get()
             #Is this the end all work that needs to be done?
+            #The parent only sends the end marker once nothing is outstanding.
             if not work:
+                self.flush_done()
                 #Perpetuate the end marker for all threads to see
                 self.in_q.put(False)
                 #Notify the parent that we have died of natural causes
                 self.out_q.put(False)
                 break
             else:
-                if len(work) == 3:
-                    #keep track of how many times this lookup has timedout.
-                    (hostname, record_type, timeout_retries) = work
-                    response = self.check(hostname, record_type, timeout_retries)
-                else:
-                    (hostname, record_type) = work
-                    response = self.check(hostname, record_type) 
+                #keep track of how many times this lookup has timedout,  and on which resolvers.
+                (hostname, record_type, timeout_retries, index) = work[:4]
+                tried = work[4] if len(work) > 4 else ()
+                self.requeued = False
+                response = self.check(hostname, record_type, timeout_retries, index, tried)
                 sys.stdout.flush()
                 trace(response)                  
                 #self.wildcards is populated by the verify_nameservers() thread.
@@ -339,9 +1007,10 @@ class lookup(multiprocessing.Process):
                 #A queue ensure nameserver cannot be used before it's wildcard entries are found.
                 reject = False
                 if response:
+                    target = find_target(hostname, self.targets)
                     for a in response:
                         a = str(a)
-                        if a in self.wildcards:
+                        if wildcard_key(target, a) in self.wildcards:
                             trace("resovled wildcard:", hostname)
                             reject= True
                             #reject this domain.
@@ -350,8 +1019,314 @@ class lookup(multiprocessing.Process):
                             found_addresses.append(a)
                     if not reject:
                         #This request is filled, send the results back  
-                        result = (hostname, record_type, found_addresses)
-                        self.out_q.put(result)
+                        self.out_q.put(("result", hostname, record_type, found_addresses))
+                if not self.requeued:
+                    self.done.append((index, hostname))
+                    if len(self.done) >= 64:
+                        self.flush_done()
+
+#A query of async_lookup,  one per host being looked up.
+class dns_query(object):
+    __slots__ = ("work", "rdtype", "resolver", "txid", "attempt", "tried", "sent")
+
+    def __init__(self, work, rdtype):
+        self.work = work
+        self.rdtype = rdtype
+        self.resolver = None
+        self.txid = None
+        self.attempt = 0
+        self.tried = set()
+        self.sent = None
+
+#An event loop lookup engine,  one process keeps thousands of queries in flight.
+#Every query goes out of a single non-blocking UDP socket and the answers are matched by transaction ID.
+#It speaks the same in_q/out_q protocol as lookup, so run() can use either of them.
+class async_lookup(multiprocessing.Process):
+
+    def __init__(self, in_q, out_q, resolver_q, targets, wildcards, spider_blacklist, max_inflight = 2048, per_resolver = 64, timeout = 2, max_attempts = 4, cache = None):
+        multiprocessing.Process.__init__(self, target = self.run)
+        signal_init()
+        self.in_q = in_q
+        self.out_q = out_q
+        self.resolver_q = resolver_q
+        self.targets = targets
+        self.wildcards = wildcards
+        self.spider_blacklist = spider_blacklist
+        self.max_inflight = max_inflight
+        #A resolver only gets this many of our queries at once.
+        self.per_resolver = per_resolver
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        #(address, port) of the verified resolvers and their queries in flight.
+        self.resolvers = []
+        self.resolver_load = {}
+        self.resolvers_done = False
+        self.next_resolver = 0
+        #txid => dns_query
+        self.inflight = {}
+        #The timeout is the same for every query,  so the deadlines are in send order.
+        self.deadlines = collections.deque()
+        #Queries waiting for a free resolver,  retries go first.
+        self.waiting = collections.deque()
+        self.done = []
+        self.sock = None
+        self.metrics = dns_metrics()
+        self.cache = cache
+
+    def requeue(self, work):
+        self.out_q.put(("requeue", work))
+
+    def flush_done(self):
+        if self.cache is not None:
+            self.cache.flush()
+        metrics = self.metrics.take()
+        if metrics:
+            self.out_q.put(("metrics", metrics))
+        if self.done:
+            self.out_q.put(("done", self.done))
+            self.done = []
+
+    def get_resolvers(self, block = False):
+        while not self.resolvers_done:
+            try:
+                if block:
+                    start = time.time()
+                    server = self.resolver_q.get()
+                    self.metrics.resolver_wait += time.time() - start
+                else:
+                    server = self.resolver_q.get_nowait()
+            except Queue.Empty:
+                return
+            block = False
+            if server is False:
+                #Queue is empty,  inform the rest.
+                self.resolvers_done = True
+                self.resolver_q.put(False)
+                return
+            (host, port) = split_nameserver(server)
+            if (host, port) not in self.resolver_load:
+                self.resolvers.append((host, port))
+                self.resolver_load[(host, port)] = 0
+
+    #Round robin over the resolvers that are below their limit,  a retry never goes to a resolver it already tried.
+    def pick_resolver(self, query):
+        count = len(self.resolvers)
+        fallback = None
+        for i in range(count):
+            resolver = self.resolvers[(self.next_resolver + i) % count]
+            if self.resolver_load[resolver] >= self.per_resolver:
+                continue
+            if resolver in query.tried:
+                fallback = fallback or resolver
+                continue
+            self.next_resolver = (self.next_resolver + i + 1) % count
+            return resolver
+        #Every resolver has been tried,  start over.
+        return fallback
+
+    def send(self, query, resolver):
+        txid = random.randint(0, 65535)
+        while txid in self.inflight:
+            txid = random.randint(0, 65535)
+        message = dns.message.make_query(query.work[0], query.rdtype)
+        message.id = txid
+        query.txid = txid
+        query.resolver = resolver
+        query.attempt += 1
+        query.tried.add(resolver)
+        self.inflight[txid] = query
+        self.resolver_load[resolver] += 1
+        query.sent = time.time()
+        self.deadlines.append((query.sent + self.timeout, query, query.attempt))
+        try:
+            self.sock.sendto(message.to_wire(), resolver)
+        except socket.error as e:
+            #A full send buffer, the deadline will retry this query.
+            trace("send failure:", query.work[0], resolver, e)
+
+    def release(self, query):
+        del self.inflight[query.txid]
+        self.resolver_load[query.resolver] -= 1
+
+    def retry(self, query, reason):
+        if query.attempt < self.max_attempts:
+            trace("lookup failure:", query.work[0], reason, query.attempt)
+            self.waiting.appendleft(query)
+        elif reason == "timeout":
+            #Same as lookup,  the authorative name server has told us this domain exists,
+            #we just can't know the address value using this method.
+            self.finish(query, ['Mutiple Query Timeout - External address resolution was restricted'])
+        else:
+            trace("unresolved:", query.work[0], reason)
+            self.out_q.put(("unresolved", query.work[0], query.work[1]))
+            self.finish(query, False)
+
+    def add_work(self, work):
+        work = tuple(work[:4])
+        record_type = work[1]
+        try:
+            rdtype = dns.rdatatype.from_text(record_type or "A")
+        except dns.rdatatype.UnknownRdatatype:
+            error("DNS record type not supported:", record_type)
+        query = dns_query(work, rdtype)
+        if self.cache is not None:
+            cached = self.cache.get(work[0], record_type or "A")
+            if cached is not None:
+                self.metrics.cache_hits += 1
+                self.finish(query, cached)
+                return
+        self.waiting.append(query)
+
+    def send_waiting(self):
+        while self.waiting and len(self.inflight) < self.max_inflight:
+            resolver = self.pick_resolver(self.waiting[0])
+            if not resolver:
+                #Every resolver is at its limit.
+                return
+            self.send(self.waiting.popleft(), resolver)
+
+    def expire(self):
+        now = time.time()
+        while self.deadlines and self.deadlines[0][0] <= now:
+            (deadline, query, attempt) = self.deadlines.popleft()
+            #Only if the query is still waiting on this attempt.
+            if query.attempt == attempt and self.inflight.get(query.txid) is query:
+                self.metrics.record(nameserver_name(*query.resolver), "Timeout", now - query.sent)
+                self.release(query)
+                self.retry(query, "timeout")
+
+    def receive(self):
+        while True:
+            try:
+                (data, address) = self.sock.recvfrom(65535)
+            except socket.error as e:
+                if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                continue
+            if len(data) < 12:
+                continue
+            query = self.inflight.get(struct.unpack("!H", data[:2])[0])
+            #Only the resolver we asked may answer.
+            if query is None or query.resolver != address[:2]:
+                continue
+            try:
+                response = dns.message.from_wire(data)
+            except Exception:
+                continue
+            if not response.question or response.question[0].name.to_text().rstrip(".").lower() != query.work[0].lower():
+                continue
+            self.release(query)
+            self.answer(query, response)
+
+    def answer(self, query, response):
+        rcode = response.rcode()
+        self.metrics.record(nameserver_name(*query.resolver), dns.rcode.to_text(rcode), time.time() - query.sent)
+        if rcode == dns.rcode.NXDOMAIN:
+            if self.cache is not None:
+                self.cache.put_nxdomain(query.work[0], negative_ttl(response))
+            self.finish(query, False)
+        elif rcode != dns.rcode.NOERROR:
+            #SERVFAIL, REFUSED...  another resolver should try this host.
+            self.retry(query, dns.rcode.to_text(rcode))
+        elif query.rdtype == dns.rdatatype.CNAME:
+            cname_record = [str(rr.target).rstrip(".") for rrset in response.answer if rrset.rdtype == dns.rdatatype.CNAME for rr in rrset]
+            self.remember(query, response, cname_record)
+            self.finish(query, cname_record)
+        else:
+            found = [rr for rrset in response.answer if rrset.rdtype == query.rdtype for rr in rrset]
+            self.remember(query, response, found)
+            if query.rdtype == dns.rdatatype.A:
+                #Crawl the response
+                for h in extract_hosts(str(response), find_target(query.work[0], self.targets)):
+                    if self.spider_blacklist.add(h):
+                        trace("Found host with spider:", h)
+                        self.out_q.put(("spider", (h, query.work[1], 0, -1)))
+            self.finish(query, found or False)
+
+    #The TTL of an answer is the smallest one along its CNAME chain.
+    def remember(self, query, response, found):
+        if self.cache is not None and found:
+            self.cache.put(query.work[0], query.work[1] or "A", [str(rr) for rr in found], min(rrset.ttl for rrset in response.answer))
+
+    def finish(self, query, response):
+        (hostname, record_type, timeout_retries, index) = query.work
+        if response:
+            found_addresses = []
+            target = find_target(hostname, self.targets)
+            for a in response:
+                a = str(a)
+                if wildcard_key(target, a) in self.wildcards:
+                    trace("resovled wildcard:", hostname)
+                    found_addresses = None
+                    break
+                found_addresses.append(a)
+            if found_addresses is not None:
+                self.out_q.put(("result", hostname, record_type, found_addresses))
+        self.done.append((index, hostname))
+        if len(self.done) >= 64:
+            self.flush_done()
+
+    def run(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        try:
+            #Thousands of answers can arrive between two reads.
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        except socket.error:
+            pass
+        #This process needs one resolver before it can start looking.
+        self.get_resolvers(block = True)
+        end = False
+        while True:
+            self.get_resolvers()
+            while not end and len(self.inflight) + len(self.waiting) < self.max_inflight:
+                try:
+                    if self.inflight or self.waiting:
+                        work = self.in_q.get_nowait()
+                    else:
+                        #Nothing in flight,  tell the parent what we have finished and wait for work.
+                        self.flush_done()
+                        work = self.in_q.get(True, 0.1)
+                except Queue.Empty:
+                    break
+                if not work:
+                    end = True
+                    break
+                self.add_work(work)
+            if not self.resolvers and self.resolvers_done:
+                #There is nobody left to ask.
+                while self.waiting:
+                    query = self.waiting.popleft()
+                    self.out_q.put(("unresolved", query.work[0], query.work[1]))
+                    self.finish(query, False)
+            self.send_waiting()
+            if end and not self.inflight and not self.waiting:
+                break
+            if not self.inflight:
+                continue
+            wait = max(0, min(0.05, self.deadlines[0][0] - time.time()))
+            if select.select([self.sock], [], [], wait)[0]:
+                self.receive()
+            self.expire()
+        self.flush_done()
+        self.sock.close()
+        #Perpetuate the end marker for all threads to see
+        self.in_q.put(False)
+        #Notify the parent that we have died of natural causes
+        self.out_q.put(False)
+
+#The wildcards of every target share one set.
+def wildcard_key(target, address):
+    return "%s %s" % (target, address)
+
+#The target a hostname belongs to,  the longest one when the targets are nested.
+def find_target(hostname, targets):
+    labels = hostname.lower().split(".")
+    for i in range(len(labels)):
+        name = ".".join(labels[i:])
+        if name in targets:
+            return name
+    return None
 
 #Extract relevant hosts
 #The dot at the end of a domain signifies the root,
@@ -365,50 +1340,468 @@ def extract_hosts(data, hostname):
     for fh in hosts:
         host = fh.rstrip(".")
         #Is this host in scope?
-        if host.endswith(hostname):
+        if host == hostname or host.endswith("." + hostname):
             ret.append(host)
     return ret
 
+#The subdomain labels of a hostname,  the TLD and the domain name are left out.
+def subdomain_labels(name):
+    p = name.split(b".")[0:-1]
+    #gobble everything that might be a TLD
+    while p and len(p[-1]) <= 3:
+        p = p[0:-1]
+    #remove the domain name
+    return [q for q in p[0:-1] if q]
+
+#Exact counts of labels,  with bounded memory.
+#Counts are kept in a dict until it holds max_labels labels,  then they are written to disk as a run sorted by label.
+#The runs are merged at the end,  one line of each at a time,  so the counts stay exact whatever the size of the input.
+class spill_counter(object):
+
+    def __init__(self, max_labels = 1 << 20, directory = None):
+        self.max_labels = max_labels
+        self.directory = directory
+        self.counts = {}
+        self.runs = []
+
+    def add_counts(self, counts):
+        for (label, count) in counts.items():
+            self.counts[label] = self.counts.get(label, 0) + count
+        if len(self.counts) >= self.max_labels:
+            self.spill()
+
+    def spill(self):
+        run = tempfile.TemporaryFile(dir = self.directory)
+        for label in sorted(self.counts):
+            run.write(label + b"\t" + str(self.counts[label]).encode("ascii") + b"\n")
+        run.seek(0)
+        self.runs.append(run)
+        self.counts = {}
+
+    @staticmethod
+    def read_run(run):
+        for line in run:
+            (label, count) = line.rstrip(b"\n").split(b"\t")
+            yield (label, int(count))
+
+    #(label, count) of every label,  in label order.
+    def items(self):
+        if not self.runs:
+            for label in sorted(self.counts):
+                yield (label, self.counts[label])
+            return
+        if self.counts:
+            self.spill()
+        (last, total) = (None, 0)
+        for (label, count) in heapq.merge(*[self.read_run(run) for run in self.runs]):
+            if label != last:
+                if last is not None:
+                    yield (last, total)
+                (last, total) = (label, 0)
+            total += count
+        if last is not None:
+            yield (last, total)
+
+    def top(self, k = None):
+        if k is None:
+            return sorted(self.items(), key = lambda item: item[1], reverse = True)
+        return heapq.nlargest(k, self.items(), key = lambda item: item[1])
+
+    def close(self):
+        for run in self.runs:
+            run.close()
+        self.runs = []
+
+#Approximate counts of labels in fixed memory,  a count-min sketch of depth rows of width counters.
+#Only the labels whose estimate makes them one of the candidates most frequent ones are kept,
+#the estimate of a label can only be too high,  by about total / width.
+class sketch_counter(object):
+
+    def __init__(self, width = 1 << 20, depth = 4, candidates = 100000):
+        self.width = width
+        self.depth = depth
+        self.rows = [array.array("L", [0]) * width for i in range(depth)]
+        self.candidates = candidates
+        self.estimates = {}
+
+    def add_counts(self, counts):
+        width = self.width
+        rows = self.rows
+        estimates = self.estimates
+        for (label, count) in counts.items():
+            #Two halves of one hash make the hash of every row.
+            h = hash(label) & 0xffffffffffffffff
+            (h1, h2) = (h & 0xffffffff, (h >> 32) | 1)
+            estimate = None
+            for (i, row) in enumerate(rows):
+                slot = (h1 + i * h2) % width
+                row[slot] += count
+                if estimate is None or row[slot] < estimate:
+                    estimate = row[slot]
+            estimates[label] = estimate
+        if len(estimates) > 2 * self.candidates:
+            self.estimates = dict(heapq.nlargest(self.candidates, estimates.items(), key = lambda item: item[1]))
+
+    def top(self, k = None):
+        items = sorted(self.estimates.items(), key = lambda item: (-item[1], item[0]))
+        return items[:k]
+
+    def close(self):
+        pass
+
+#Count the subdomain labels of a file without reading it in one go.
+#The file is read chunk_size bytes at a time,  the name cut at the end of a chunk is carried over to the next one.
+#A run of name bytes longer than a name can be isn't one,  it is dropped up to its end so binary input
+#can't grow the carried over part without bound.
+#Only names with 3 or more sections,  subdomain.domain.tld,  are counted.
+hostname_match = re.compile(br"[a-zA-Z0-9_-]+(?:\.[a-zA-Z0-9_-]+){2,}")
+name_bytes = b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_.-"
+max_name_length = 253
+def count_labels(file_name, counter = None, chunk_size = 4 * 1024 * 1024):
+    if counter is None:
+        counter = spill_counter()
+    tail = b""
+    skipping = False
+    with open(file_name, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            if skipping:
+                #The rest of the run that was dropped.
+                chunk = chunk.lstrip(name_bytes)
+                if not chunk:
+                    continue
+                skipping = False
+            chunk = tail + chunk
+            cut = len(chunk.rstrip(name_bytes))
+            (chunk, tail) = (chunk[:cut], chunk[cut:])
+            if len(tail) > max_name_length:
+                tail = b""
+                skipping = True
+            counter.add_counts(chunk_labels(chunk))
+    if tail:
+        counter.add_counts(chunk_labels(tail))
+    return counter
+
+#A dump repeats the same names over and over,  each one is split into labels once per chunk.
+def chunk_labels(chunk):
+    labels = collections.Counter()
+    for (name, count) in collections.Counter(hostname_match.findall(chunk.lower())).items():
+        if len(name) > max_name_length:
+            continue
+        for label in subdomain_labels(name):
+            labels[label] += count
+    return labels
+
 #Return a list of unique sub domains,  sorted by frequency.
-#Only match domains that have 3 or more sections subdomain.domain.tld
-domain_match = re.compile("([a-zA-Z0-9_-]*\.[a-zA-Z0-9_-]*\.[a-zA-Z0-9_-]*)+")
-def extract_subdomains(file_name):
-    #Avoid re-compilation
-    global domain_match
-    subs = {}
-    sub_file = open(file_name).read()
-    f_all = re.findall(domain_match, sub_file)
-    del sub_file
-    for i in f_all:
-        if i.find(".") >= 0:
-            p = i.split(".")[0:-1]
-            #gobble everything that might be a TLD
-            while p and len(p[-1]) <= 3:
-                p = p[0:-1]
-            #remove the domain name
-            p = p[0:-1]
-            #do we have a subdomain.domain left?
-            if len(p) >= 1:
-                trace(str(p), " : ", i)
-                for q in p:
-                    if q :
-                        #domain names can only be lower case.
-                        q = q.lower()
-                        if q in subs:
-                            subs[q] += 1
-                        else:
-                            subs[q] = 1
-    #Free some memory before the sort...
-    del f_all
-    #Sort by freq in desc order
-    subs_sorted = sorted(subs.keys(), key = lambda x: subs[x], reverse = True)
-    return subs_sorted
-
-def print_target(target, record_type = None, subdomains = "names.txt", resolve_list = "resolvers.txt", process_count = 16, output = False, json_output = False, found_subdomains=[],verbose=False):
+#top keeps the top most frequent ones,  sketch counts them approximately in fixed memory instead of
+#exactly with the partial counts spilled to disk.
+def extract_subdomains(file_name, top = None, sketch = False):
+    counter = count_labels(file_name, sketch_counter() if sketch else spill_counter())
+    try:
+        return [label.decode("ascii") for (label, count) in counter.top(top)]
+    finally:
+        counter.close()
+
+#Compiled wordlists.
+#A compiled wordlist is deduplicated,  normalized and ordered by frequency,  and it is read through mmap.
+#Layout: header (magic, version, count),  count + 1 little endian uint64 offsets,  then the names back to back.
+wordlist_magic = b"SBWL"
+wordlist_header = struct.Struct("<4sII")
+wordlist_offset = struct.Struct("<Q")
+label_match = re.compile(r"^[a-z0-9_-]+(\.[a-z0-9_-]+)*$")
+
+class wordlist(object):
+
+    def __init__(self, file_name):
+        self.file = open(file_name, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+        (magic, version, self.count) = wordlist_header.unpack_from(self.map, 0)
+        if magic != wordlist_magic or version != 1:
+            raise ValueError("Not a compiled wordlist: %s" % file_name)
+        self.index = wordlist_header.size
+        self.names = self.index + (self.count + 1) * wordlist_offset.size
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if i < 0 or i >= self.count:
+            raise IndexError(i)
+        start = wordlist_offset.unpack_from(self.map, self.index + i * wordlist_offset.size)[0]
+        end = wordlist_offset.unpack_from(self.map, self.index + (i + 1) * wordlist_offset.size)[0]
+        return self.map[self.names + start:self.names + end].decode("ascii")
+
+    #Nothing is read before it is asked for,  a run can start anywhere in the list.
+    def iter_from(self, start = 0):
+        for i in range(start, self.count):
+            yield self[i]
+
+    def __iter__(self):
+        return self.iter_from(0)
+
+    def close(self):
+        self.map.close()
+        self.file.close()
+
+def iter_wordlist(words, start = 0):
+    if isinstance(words, wordlist):
+        return words.iter_from(start)
+    return itertools.islice(words, start, None)
+
+#Compiled wordlists are recognized by their magic,  anything else is read as text.
+def open_wordlist(file_name):
+    try:
+        with open(file_name, "rb") as f:
+            magic = f.read(len(wordlist_magic))
+    except IOError:
+        error("File not found:", file_name)
+    if magic == wordlist_magic:
+        return wordlist(file_name)
+    return check_open(file_name)
+
+#The name as it belongs in a wordlist,  or None if it can't be a subdomain label.
+def normalize_name(name):
+    #A comma will never be in a url,  but the input might be a CSV file.
+    name = name.split(",")[0].strip().strip(".").lower()
+    if not label_match.match(name):
+        return None
+    return name
+
+#Write an iterable of normalized,  unique names to a compiled wordlist in the given order.
+#The offsets are packed as they go,  array has no 64 bit type on Python 2.
+def write_wordlist(file_name, names):
+    offsets = bytearray()
+    position = 0
+    blob = tempfile.TemporaryFile()
+    for name in names:
+        data = name.encode("ascii")
+        offsets += wordlist_offset.pack(position)
+        blob.write(data)
+        position += len(data)
+    offsets += wordlist_offset.pack(position)
+    count = len(offsets) // wordlist_offset.size - 1
+    blob.seek(0)
+    with open(file_name, "wb") as f:
+        f.write(wordlist_header.pack(wordlist_magic, 1, count))
+        f.write(offsets)
+        while True:
+            chunk = blob.read(1024 * 1024)
+            if not chunk:
+                break
+            f.write(chunk)
+    blob.close()
+    return count
+
+#Compile a text wordlist.
+#The input is expected in frequency order (as names.txt is),  an optional "name,count" column reorders it.
+def compile_wordlist(source, destination):
+    counts = collections.OrderedDict()
+    with open(source) as f:
+        for line in f:
+            parts = line.strip().split(",")
+            name = normalize_name(parts[0])
+            if name is None:
+                continue
+            count = 0
+            if len(parts) > 1 and parts[1].strip().isdigit():
+                count = int(parts[1])
+            counts[name] = counts.get(name, 0) + count
+    names = list(counts.keys())
+    if any(counts.values()):
+        #sorted() is stable,  names without counts keep their relative order.
+        names.sort(key = lambda name: counts[name], reverse = True)
+    return write_wordlist(destination, names)
+
+#Labels that tell the environments of a service apart,  alterations swap them in and out of known names.
+environment_words = ["dev", "development", "stage", "staging", "prod", "production", "test", "qa", "uat", "preprod", "beta", "sandbox", "demo"]
+number_match = re.compile(r"\d+")
+
+#Candidates made out of the hostnames that are known to exist.
+#Every known hostname gets one generator per tier:  0 are its numeric neighbours,  1 the environment words
+#put around its first label and 2 the environment words swapped for the ones in its labels.
+#A lower tier is drained before a higher one and the hostnames of a tier take turns,  a candidate is only
+#made when it is popped.  Memory is bound by the number of known hostnames,  not by the number of candidates,
+#and at most budget candidates are handed out.
+class alterations(object):
+
+    def __init__(self, targets, words = environment_words, budget = 100000, numeric_range = 3):
+        self.targets = frozenset(targets)
+        self.words = words
+        self.budget = budget
+        self.numeric_range = numeric_range
+        self.used = 0
+        self.tiers = [collections.deque() for i in range(3)]
+
+    def add(self, hostname):
+        hostname = hostname.lower()
+        target = find_target(hostname, self.targets)
+        if target is None or hostname == target:
+            return
+        labels = hostname[:-len(target) - 1].split(".")
+        self.tiers[0].append(self.numeric(labels, target))
+        self.tiers[1].append(self.affixes(labels, target))
+        self.tiers[2].append(self.swaps(labels, target))
+
+    #The next candidate,  None once the budget is spent or every generator is exhausted.
+    def pop(self):
+        if self.used >= self.budget:
+            return None
+        for tier in self.tiers:
+            while tier:
+                try:
+                    candidate = next(tier[0])
+                except StopIteration:
+                    tier.popleft()
+                    continue
+                tier.rotate(-1)
+                self.used += 1
+                return candidate
+        return None
+
+    def exhausted(self):
+        return self.used >= self.budget or not any(self.tiers)
+
+    #web-02 => web-01,  web-03,  web-00,  web-04...  the zero padding is kept.
+    def numeric(self, labels, target):
+        for i, label in enumerate(labels):
+            numbers = list(number_match.finditer(label))
+            if not numbers:
+                continue
+            number = numbers[-1]
+            value = int(number.group())
+            for step in range(1, self.numeric_range + 1):
+                for n in (value + step, value - step):
+                    if n < 0:
+                        continue
+                    digits = str(n).zfill(len(number.group()))
+                    altered = label[:number.start()] + digits + label[number.end():]
+                    yield ".".join(labels[:i] + [altered] + labels[i + 1:] + [target])
+
+    #api => dev-api,  api-dev,  dev.api,  api.dev
+    def affixes(self, labels, target):
+        first = labels[0]
+        rest = labels[1:] + [target]
+        for word in self.words:
+            if word in first.split("-"):
+                continue
+            for altered in ("%s-%s" % (word, first), "%s-%s" % (first, word), "%s.%s" % (word, first), "%s.%s" % (first, word)):
+                yield ".".join([altered] + rest)
+
+    #api-dev => api-stage,  api-prod...  every label and every dash separated part of it.
+    def swaps(self, labels, target):
+        for i, label in enumerate(labels):
+            parts = label.split("-")
+            for j, part in enumerate(parts):
+                if part not in self.words:
+                    continue
+                for word in self.words:
+                    if word == part:
+                        continue
+                    altered = "-".join(parts[:j] + [word] + parts[j + 1:])
+                    yield ".".join(labels[:i] + [altered] + labels[i + 1:] + [target])
+
+#The hostnames found become apexes of their own,  breadth first:  every name found under a target
+#(depth 1) is bruteforced with the first words of the wordlist,  the names found under those (depth 2)
+#with a tenth of that and so on down to depth.  The wordlist is in frequency order,  a deeper level
+#only gets its most common names.  An apex is first probed with a random label,  one that answers is
+#a wildcard of its own and isn't bruteforced.  The probes and the names of every level count towards
+#budget,  no more than that many queries are handed out.
+class recursion(object):
+
+    def __init__(self, targets, subdomains = "names.txt", depth = 1, words = 1000, budget = 100000):
+        self.targets = frozenset(targets)
+        self.subdomains = open_wordlist(subdomains)
+        self.depth = depth
+        self.words = words
+        self.budget = budget
+        self.used = 0
+        #probe hostname => (apex, depth)
+        self.probes = {}
+        self.wildcards = set()
+        #depth => deque of (apex, wordlist iterator),  the apexes of a level take turns.
+        self.levels = collections.defaultdict(collections.deque)
+        #apex => wordlist entries handed out,  saved with the checkpoint of its target.
+        self.progress = {}
+        #The progress of an interrupted run,  an apex picks up there once it is probed again.
+        self.restored = {}
+
+    #What checkpoint() saved for a target.
+    def restore(self, state):
+        self.wildcards.update(state.get("wildcards", []))
+        for (apex, handed_out) in state.get("apexes", {}).items():
+            self.restored[apex] = handed_out
+            self.used += handed_out
+
+    def checkpoint(self, target):
+        return {"apexes": dict((apex, n) for (apex, n) in self.progress.items() if find_target(apex, self.targets) == target),
+                "wildcards": sorted(apex for apex in self.wildcards if find_target(apex, self.targets) == target)}
+
+    #The probe to look up for a hostname that was found,  None when it isn't recursed into.
+    def add(self, hostname):
+        hostname = hostname.lower()
+        target = find_target(hostname, self.targets)
+        if target is None or hostname == target or self.used >= self.budget:
+            return None
+        depth = hostname.count(".") - target.count(".")
+        if depth > self.depth or hostname in self.wildcards:
+            return None
+        probe = "%s.%s" % (uuid.uuid4().hex[:16], hostname)
+        self.probes[probe] = (hostname, depth)
+        self.used += 1
+        return probe
+
+    def is_probe(self, hostname):
+        return hostname in self.probes
+
+    #A probe resolved,  its apex answers for any name.
+    def wildcard(self, probe):
+        (apex, depth) = self.probes[probe]
+        trace("Wildcard apex, not recursing:", apex)
+        self.wildcards.add(apex)
+
+    #A probe was looked up,  the wordlist of a clean apex is queued behind the apexes of its level.
+    def done(self, probe):
+        (apex, depth) = self.probes.pop(probe)
+        if apex in self.wildcards:
+            return
+        size = max(1, self.words // (10 ** (depth - 1)))
+        start = self.restored.pop(apex, 0)
+        self.progress[apex] = start
+        self.levels[depth].append((apex, itertools.islice(iter_wordlist(self.subdomains), start, size)))
+
+    #The next hostname of the shallowest level,  None once the budget is spent or no level is left.
+    def pop(self):
+        while self.used < self.budget and self.levels:
+            level = self.levels[min(self.levels)]
+            (apex, names) = level.popleft()
+            try:
+                s = next(names)
+            except StopIteration:
+                if not level:
+                    del self.levels[min(self.levels)]
+                continue
+            level.append((apex, names))
+            self.progress[apex] += 1
+            s = str(s).strip().split(",")[0]
+            if s:
+                self.used += 1
+                return "%s.%s" % (s, apex)
+        return None
+
+    def exhausted(self):
+        return not self.probes and (self.used >= self.budget or not self.levels)
+
+def print_target(target, record_type = None, subdomains = "names.txt", resolve_list = "resolvers.txt", process_count = 16, output = False, json_output = False, found_subdomains=[],verbose=False, checkpoint = None, engine = "process", cache_dir = None, status = False, metrics = None, recursive = 0, recursion_budget = 100000):
     subdomains_list = []
     results_temp = []
-    run(target, record_type, subdomains, resolve_list, process_count)
-    for result in run(target, record_type, subdomains, resolve_list, process_count):
+    levels = None
+    if recursive:
+        levels = recursion([target.lower()], subdomains, recursive, budget = recursion_budget)
+    for result in run(target, record_type, subdomains, resolve_list, process_count, checkpoint, engine = engine, cache_dir = cache_dir, status = status, metrics = metrics, recursive = levels):
         (hostname, record_type, response) = result
         if not record_type:
             result = hostname
@@ -418,81 +1811,569 @@ def print_target(target, record_type = None, subdomains = "names.txt", resolve_l
             if verbose:
                 print(result)
             subdomains_list.append(result)
+            #Written as the results come in,  so the files can be followed while the run goes on.
+            if output:
+                output.write(result + "\n")
+                output.flush()
+            if json_output:
+                record = {"subdomain": hostname,
+                          "record_type": record_type or "A",
+                          "addresses": list(response),
+                          "first_seen": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())}
+                json_output.write(json.dumps(record, sort_keys = True) + "\n")
+                json_output.flush()
 
     return  set(subdomains_list)
 
-def run(target, record_type = None, subdomains = "names.txt", resolve_list = "resolvers.txt", process_count = 16):
-    subdomains = check_open(subdomains)
+#Progress of a bruteforce run.
+#It is written to a state file every now and then,  so that a killed run can pick up where it stopped.
+class run_state(object):
+
+    def __init__(self, target, record_type, path = None):
+        self.target = target
+        self.record_type = record_type
+        self.path = path
+        #Every wordlist entry before the offset is done.
+        self.offset = 0
+        #Wordlist entries after the offset that are done.
+        self.done = set()
+        #hostname => work that is outside of the wordlist order, spidered hosts and retries.
+        self.pending = {}
+        self.results = []
+        #What the recursion object handed out below the hostnames found.
+        self.recursion = {}
+        self.saved = time.time()
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return False
+        try:
+            with open(self.path) as f:
+                state = json.load(f)
+        except (IOError, ValueError):
+            trace("Unreadable state file:", self.path)
+            return False
+        #A state file of another run,  don't resume from it.
+        if state.get("target") != self.target or state.get("record_type") != self.record_type:
+            return False
+        self.offset = state["offset"]
+        self.done = set(state.get("done", []))
+        self.pending = dict((w[0], tuple(w)) for w in state["pending"])
+        self.recursion = state.get("recursion", {})
+        self.results = [tuple(r) for r in state["results"]]
+        return True
+
+    def save(self):
+        self.saved = time.time()
+        if not self.path:
+            return
+        state = {"target": self.target,
+                 "record_type": self.record_type,
+                 "offset": self.offset,
+                 "done": sorted(self.done),
+                 "pending": list(self.pending.values()),
+                 "results": self.results,
+                 "recursion": self.recursion}
+        write_json(self.path, state)
+
+    def remove(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    #The wordlist entry at index was looked up,  or didn't need a lookup.
+    def skip(self, index):
+        if index >= self.offset:
+            self.done.add(index)
+        while self.offset in self.done:
+            self.done.remove(self.offset)
+            self.offset += 1
+
+    def ack(self, index, hostname):
+        self.pending.pop(hostname, None)
+        if index >= 0:
+            self.skip(index)
+
+def run(target, record_type = None, subdomains = "names.txt", resolve_list = "resolvers.txt", process_count = 16, checkpoint = None, checkpoint_interval = 30, engine = "process", cache_dir = None, status = False, metrics = None, recursive = None):
+    target = target.lower()
+    for (target, hostname, record_type, response) in run_many([target], record_type, subdomains, resolve_list, process_count, {target: checkpoint}, checkpoint_interval, engine, cache_dir,
+                                                              status = status, metrics = metrics, recursive = recursive):
+        yield (hostname, record_type, response)
+
+#Bruteforce many targets with one resolver verifier and one pool of lookup processes.
+#The targets take turns feeding the work queue,  so the pipeline stays full and no single
+#authoritative server gets all of the queries.  Yields (target, hostname, record_type, response).
+#checkpoints maps a target to its state file.  known are hostnames that are never looked up,
+#a caller that resolved them recently already has their answer.  altered is an alterations object,
+#its candidates go ahead of the wordlist and every hostname found is added to it.
+#The lookup processes count the queries of every resolver,  status shows a live line of the throughput
+#on stderr and metrics is a file for the JSON report of the run.  recursive is a recursion object,
+#the hostnames found become apexes that the same lookup processes bruteforce once the wordlist is done.
+def run_many(targets, record_type = None, subdomains = "names.txt", resolve_list = "resolvers.txt", process_count = 16, checkpoints = None, checkpoint_interval = 30, engine = "process", cache_dir = None, known = (), altered = None, status = False, metrics = None, recursive = None):
+    checkpoints = checkpoints or {}
+    known = list(known)
+    targets = [t.strip().lower() for t in targets]
+    targets = [t for (i, t) in enumerate(targets) if t and t not in targets[:i]]
+    target_set = frozenset(targets)
+    subdomains = open_wordlist(subdomains)
     resolve_list = check_open(resolve_list)
     if (len(resolve_list) / 16) < process_count:
         sys.stderr.write('Warning: Fewer than 16 resovlers per thread, consider adding more nameservers to resolvers.txt.\n')
-    if os.name == 'nt':
-        wildcards = {}
-        spider_blacklist = {}
-    else:
-        wildcards = multiprocessing.Manager().dict()
-        spider_blacklist = multiprocessing.Manager().dict()
+    #Shared memory,  the lookup processes check them for every name without any IPC.
+    wildcards = shared_set(max(4096, 256 * len(targets)))
+    #Room for the wordlist of every target and the hosts found by the spider.
+    extra = len(known)
+    if altered is not None:
+        #Past this many a candidate may be looked up twice,  but the table doesn't grow with the budget.
+        extra += min(altered.budget, 1 << 22)
+    if recursive is not None:
+        extra += min(recursive.budget, 1 << 22)
+    spider_blacklist = shared_set(min(len(subdomains) * len(targets), 1 << 22) + extra + 65536)
+    for hostname in known:
+        spider_blacklist.add(hostname.lower())
     in_q = multiprocessing.Queue()
     out_q = multiprocessing.Queue()
-    #have a buffer of at most two new nameservers that lookup processes can draw from.
-    resolve_q = multiprocessing.Queue(maxsize = 2)
+    #have a buffer of new nameservers that lookup processes can draw from,  they are qualified many at a time.
+    resolve_q = multiprocessing.Queue(maxsize = 16)
+    #The slow lane shares the resolvers of the others instead of taking one for itself.
+    shared_q = None
+    if engine != "async":
+        shared_q = multiprocessing.Queue()
+
+    #Pick up where a previous run of each target stopped.
+    states = {}
+    for target in targets:
+        state = run_state(target, record_type, checkpoints.get(target))
+        if state.load():
+            trace("Resuming from wordlist offset:", target, state.offset)
+            if recursive is not None:
+                recursive.restore(state.recursion)
+            for result in state.results:
+                spider_blacklist.add(result[0])
+                #The alterations and the levels below them go on from here.
+                if altered is not None:
+                    altered.add(result[0])
+                if recursive is not None:
+                    recursive.add(result[0])
+                yield (target,) + result
+        else:
+            #The empty string
+            state.pending[target] = (target, record_type, 0, -1)
+        states[target] = state
 
     #Make a source of fast nameservers avaiable for other processes.
-    verify_nameservers_proc = verify_nameservers(target, record_type, resolve_q, resolve_list, wildcards)
+    #What was learned about the resolvers is kept in the cache directory for the next run.
+    scoreboard = None
+    if cache_dir:
+        scoreboard = os.path.join(cache_dir, "resolvers.json")
+    #So are the wildcards of the targets.
+    fingerprints = None
+    if cache_dir:
+        fingerprints = os.path.join(cache_dir, "wildcards.json")
+    verify_nameservers_proc = verify_nameservers(targets, record_type, resolve_q, resolve_list, wildcards, scoreboard, fingerprints, shared_q = shared_q)
     verify_nameservers_proc.start()
-    #The empty string 
-    in_q.put((target, record_type))
-    spider_blacklist[target]=None
-    #A list of subdomains is the input
-    for s in subdomains:
-        s = str(s).strip()
-        if s:
-            if s.find(","):
-                #SubBrute should be forgiving, a comma will never be in a url
-                #but the user might try an use a CSV file as input.
-                s=s.split(",")[0]
-            if not s.endswith(target):
-                hostname = "%s.%s" % (s, target)
-            else:
-                #A user might feed an output list as a subdomain list.
-                hostname = s
-            if hostname not in spider_blacklist:
-                spider_blacklist[hostname]=None
-                work = (hostname, record_type)
+    complete = False
+    workers = []
+    cache = None
+    try:
+        #And the answers,  every lookup process opens the same file.
+        if cache_dir:
+            cache = answer_cache(os.path.join(cache_dir, "dns.sqlite"))
+        #The work in flight,  the wordlist is fed lazily so that the state file knows how far we got.
+        outstanding = 0
+        window = process_count * 64
+        if engine == "async":
+            #A single event loop process,  keep it busy.
+            window = 8192
+        for state in states.values():
+            for work in state.pending.values():
+                spider_blacklist.add(work[0])
                 in_q.put(work)
-    #Terminate the queue
-    in_q.put(False)
-    for i in range(process_count):
-        worker = lookup(in_q, out_q, resolve_q, target, wildcards, spider_blacklist)
-        worker.start()
-    threads_remaining = process_count
-    while True:
+                outstanding += 1
+        if recursive is not None:
+            #The hostnames that were added before the run are probed right away.
+            for probe in list(recursive.probes):
+                in_q.put((probe, record_type, 0, -1))
+                outstanding += 1
+        #A list of subdomains is the input,  every target starts at its first entry that isn't done.
+        words = collections.deque((target, enumerate(iter_wordlist(subdomains, states[target].offset), states[target].offset)) for target in targets)
+        end_sent = False
+        saved = time.time()
+        totals = dns_metrics()
+        progress = run_progress(states, len(subdomains))
+        found = 0
+        retries = retry_scheduler()
+        unresolved = []
+        slow_q = None
+        if engine == "async":
+            #It retries on its own,  on another resolver every time.
+            workers.append(async_lookup(in_q, out_q, resolve_q, target_set, wildcards, spider_blacklist, cache = cache))
+        else:
+            for i in range(process_count):
+                workers.append(lookup(in_q, out_q, resolve_q, target_set, wildcards, spider_blacklist, cache = cache))
+            slow_q = multiprocessing.Queue()
+            workers.append(lookup(slow_q, out_q, shared_q, target_set, wildcards, spider_blacklist, timeout = 5, cache = cache))
+        for worker in workers:
+            worker.start()
+        threads_remaining = len(workers)
+        while True:
+            #Retries that are due go ahead of everything else.
+            for (work, slow) in retries.due():
+                if slow and slow_q is not None:
+                    slow_q.put(work)
+                else:
+                    in_q.put(work)
+            #The alterations of the names found so far are the most likely to exist.
+            while altered is not None and outstanding < window:
+                hostname = altered.pop()
+                if hostname is None:
+                    break
+                if spider_blacklist.add(hostname):
+                    work = (hostname, record_type, 0, -1)
+                    states[find_target(hostname, target_set)].pending[hostname] = work
+                    in_q.put(work)
+                    outstanding += 1
+            while words and outstanding < window:
+                (target, names) = words.popleft()
+                try:
+                    (index, s) = next(names)
+                except StopIteration:
+                    continue
+                words.append((target, names))
+                if index in states[target].done:
+                    #Looked up before the run was interrupted.
+                    continue
+                s = str(s).strip()
+                if s:
+                    if s.find(","):
+                        #SubBrute should be forgiving, a comma will never be in a url
+                        #but the user might try an use a CSV file as input.
+                        s=s.split(",")[0]
+                    if s != target and not s.endswith("." + target):
+                        hostname = "%s.%s" % (s, target)
+                    else:
+                        #A user might feed an output list as a subdomain list.
+                        hostname = s
+                    if spider_blacklist.add(hostname):
+                        in_q.put((hostname, record_type, 0, index))
+                        outstanding += 1
+                        continue
+                states[target].skip(index)
+            #Breadth first,  the levels below the targets once their wordlist is handed out.
+            while recursive is not None and not words and outstanding < window:
+                hostname = recursive.pop()
+                if hostname is None:
+                    break
+                if spider_blacklist.add(hostname):
+                    work = (hostname, record_type, 0, -1)
+                    states[find_target(hostname, target_set)].pending[hostname] = work
+                    in_q.put(work)
+                    outstanding += 1
+            if not words and outstanding <= 0 and not end_sent and (altered is None or altered.exhausted()) and (recursive is None or recursive.exhausted()):
+                #Terminate the queue
+                in_q.put(False)
+                if slow_q is not None:
+                    slow_q.put(False)
+                end_sent = True
+            try:
+                #The output is valid hostnames
+                result = out_q.get(True, retries.wait(1))
+                #we will get an empty exception before this runs. 
+                if not result:
+                    threads_remaining -= 1
+                elif result[0] == "result":
+                    result = result[1:]
+                    if recursive is not None and recursive.is_probe(result[0]):
+                        recursive.wildcard(result[0])
+                        continue
+                    target = find_target(result[0], target_set)
+                    if states[target].path:
+                        states[target].results.append(result)
+                    if altered is not None:
+                        altered.add(result[0])
+                    if recursive is not None:
+                        probe = recursive.add(result[0])
+                        if probe:
+                            in_q.put((probe, record_type, 0, -1))
+                            outstanding += 1
+                    found += 1
+                    #run_many() is a generator, and yields results from the work queue
+                    yield (target,) + result
+                elif result[0] == "done":
+                    for (index, hostname) in result[1]:
+                        if recursive is not None and recursive.is_probe(hostname):
+                            recursive.done(hostname)
+                        else:
+                            states[find_target(hostname, target_set)].ack(index, hostname)
+                        outstanding -= 1
+                elif result[0] == "metrics":
+                    totals.merge(result[1])
+                elif result[0] == "unresolved":
+                    #Every resolver failed it,  it may well exist.
+                    unresolved.append(result[1])
+                elif result[0] == "requeue":
+                    work = result[1]
+                    #A probe isn't worth resuming.
+                    if recursive is None or not recursive.is_probe(work[0]):
+                        states[find_target(work[0], target_set)].pending[work[0]] = work
+                    retries.schedule(work)
+                elif result[0] == "spider":
+                    work = result[1]
+                    states[find_target(work[0], target_set)].pending[work[0]] = work
+                    in_q.put(work)
+                    outstanding += 1
+            except Exception as e:
+                #The cx_freeze version uses queue.Empty instead of Queue.Empty :(
+                if type(e) == Queue.Empty or str(type(e)) == "<class 'queue.Empty'>":
+                    #The work of a crashed lookup process is lost,  don't wait for it forever.
+                    if not any(w.is_alive() for w in workers):
+                        sys.stderr.write("Warning: every lookup process died,  the run stopped early.\n")
+                        break
+                else:
+                    raise(e)
+            if checkpoints and time.time() - saved > checkpoint_interval:
+                saved = time.time()
+                for state in states.values():
+                    if recursive is not None:
+                        state.recursion = recursive.checkpoint(state.target)
+                    state.save()
+            if status:
+                progress.show(totals, found)
+            #make sure everyone is complete
+            if threads_remaining <= 0:
+                complete = True
+                break
+        if status:
+            progress.show(totals, found, True)
+            sys.stderr.write("\n")
+        if unresolved:
+            sys.stderr.write("Warning: %d names could not be resolved,  every resolver that was asked failed them.\n" % len(unresolved))
+        if metrics:
+            report = totals.report(time.time() - progress.started)
+            report["found"] = found
+            report["processes"] = len(workers)
+            report["retries"] = retries.scheduled
+            report["slow_lane"] = retries.slow
+            report["unresolved"] = sorted(unresolved)
+            if recursive is not None:
+                report["recursion"] = {"queries": recursive.used, "wildcard_apexes": len(recursive.wildcards)}
+            write_json(metrics, report)
+    finally:
+        if complete:
+            #The run is complete,  there is nothing left to resume.
+            for state in states.values():
+                state.remove()
+        else:
+            #It stopped early,  keep what is done so that it can be resumed.
+            for state in states.values():
+                if recursive is not None:
+                    state.recursion = recursive.checkpoint(state.target)
+                state.save()
+        #Don't leave a lookup process behind.
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            if worker.pid is not None:
+                worker.join(5)
+        trace("killing nameserver process")
+        #We no longer require name servers.
         try:
-            #The output is valid hostnames
-            result = out_q.get(True, 10)
-            #we will get an empty exception before this runs. 
-            if not result:
-                threads_remaining -= 1
-            else:
-                #run() is a generator, and yields results from the work queue
-                yield result
+            killproc(pid = verify_nameservers_proc.pid)
+        except:
+            #Windows threading.tread
+            verify_nameservers_proc.end()
+        verify_nameservers_proc.join(5)
+        if cache is not None:
+            cache.close()
+    trace("End")
+
+#Retries of the hosts that timed out or that no resolver would answer,  in the order they are due.
+#Every retry waits twice as long as the one before,  with some jitter so that the retries of a resolver
+#that went away don't all come back at once.  A host that failed slow_after times goes to the slow lane,
+#a lookup process of its own with a longer timeout,  so it stops holding up the fast path.
+class retry_scheduler(object):
+
+    def __init__(self, base = 0.5, max_delay = 10, slow_after = 2):
+        self.base = base
+        self.max_delay = max_delay
+        self.slow_after = slow_after
+        #(due, sequence, work),  the sequence keeps the work tuples from being compared.
+        self.heap = []
+        self.scheduled = 0
+        self.slow = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def schedule(self, work):
+        delay = min(self.max_delay, self.base * (2 ** max(work[2] - 1, 0))) * random.uniform(1, 1.5)
+        heapq.heappush(self.heap, (time.time() + delay, self.scheduled, work))
+        self.scheduled += 1
+
+    #Yields (work, slow) for every retry that is due.
+    def due(self):
+        now = time.time()
+        while self.heap and self.heap[0][0] <= now:
+            work = heapq.heappop(self.heap)[2]
+            slow = work[2] >= self.slow_after
+            if slow:
+                self.slow += 1
+            yield (work, slow)
+
+    #Seconds until the next retry is due,  at most longest.
+    def wait(self, longest):
+        if not self.heap:
+            return longest
+        return max(0.01, min(longest, self.heap[0][0] - time.time()))
+
+#The live status line of a run:  queries per second over the last interval,  how much of the wordlist
+#is done and when the rest will be at the rate so far.
+class run_progress(object):
+
+    def __init__(self, states, words, interval = 1.0):
+        self.states = states
+        self.total = words * len(states)
+        self.start = sum(state.offset for state in states.values())
+        self.started = time.time()
+        self.interval = interval
+        self.shown = self.started
+        self.queries = 0
+
+    def show(self, totals, found, final = False):
+        now = time.time()
+        if not final and now - self.shown < self.interval:
+            return
+        queries = totals.queries()
+        qps = (queries - self.queries) / max(now - self.shown, 0.001)
+        if final:
+            qps = queries / max(now - self.started, 0.001)
+        self.shown = now
+        self.queries = queries
+        done = sum(state.offset for state in self.states.values())
+        eta = "--:--:--"
+        if done > self.start and done < self.total:
+            seconds = int((self.total - done) * (now - self.started) / (done - self.start))
+            eta = "%d:%02d:%02d" % (seconds // 3600, seconds // 60 % 60, seconds % 60)
+        line = "%d queries  %.0f qps  %d found  %.1f%% of the wordlist  ETA %s  %d resolvers  %.1fs waiting for resolvers" % (
+            queries, qps, found, 100.0 * done / max(self.total, 1), eta, len(totals.resolvers), totals.resolver_wait)
+        sys.stderr.write("\r" + line.ljust(110))
+        sys.stderr.flush()
+
+#Qualify resolvers in this process until there are enough of them,  the best known ones go first.
+def qualify_nameservers(verifier, resolve_list, required = 16):
+    servers = []
+    for server in resolve_list:
+        server = server.strip()
+        if server and server not in servers:
+            servers.append(server)
+    qualified = []
+    pool = ThreadPool(max(1, min(verifier.concurrency, len(servers))))
+    try:
+        for (server, ok) in pool.imap_unordered(verifier.qualify, verifier.scoreboard.order(servers)):
+            if ok:
+                qualified.append(server)
+                if len(qualified) >= required:
+                    break
+    finally:
+        pool.terminate()
+        verifier.scoreboard.save()
+    return qualified
+
+#Resolve hostnames that were found some other way,  the results of the passive engines for one.
+#The resolvers are qualified as for a bruteforce and the answers go through the wildcard filter of
+#lookup.run(),  a CNAME is dropped when it points at a wildcard CNAME of its target.
+#Every host and record type is a job for a pool of threads that take turns on the resolvers,
+#the answers that the cache directory holds from the earlier runs are used without a query.
+#Yields (hostname, record_type, answers) for the ones that resolved.
+def resolve_many(hostnames, targets, record_types = ("A", "AAAA", "CNAME"), resolve_list = "resolvers.txt", process_count = 16, cache_dir = None, required_nameservers = 16):
+    targets = frozenset(t.strip().lower() for t in targets)
+    scoreboard = None
+    fingerprints = None
+    if cache_dir:
+        scoreboard = os.path.join(cache_dir, "resolvers.json")
+        fingerprints = os.path.join(cache_dir, "wildcards.json")
+    wildcards = set()
+    #They are never started,  they qualify the resolvers and learn the wildcards in this process.
+    verifiers = {}
+    for rdtype in ("A", "AAAA"):
+        verifiers[rdtype] = verify_nameservers(list(targets), rdtype, None, [], wildcards, scoreboard, fingerprints)
+        for (target, fingerprint) in verifiers[rdtype].fingerprints.items():
+            for w in fingerprint.ips:
+                wildcards.add(wildcard_key(target, w))
+    verifier = verifiers["A"]
+    nameservers = qualify_nameservers(verifier, check_open(resolve_list), required_nameservers)
+    if not nameservers:
+        sys.stderr.write('Warning: No nameservers found, trying fallback list.\n')
+        nameservers = qualify_nameservers(verifier, verifier.backup_resolver, required_nameservers)
+    if not nameservers:
+        return
+    if "AAAA" in record_types:
+        for target in targets:
+            verifiers["AAAA"].find_wildcards(target, verifier.server_resolver(nameservers[0]))
+    for v in verifiers.values():
+        for fingerprint in v.fingerprints.values():
+            fingerprint.save()
+    wildcard_cnames = dict((target, set(c.rstrip(".") for c in verifiers["A"].fingerprints[target].cnames | verifiers["AAAA"].fingerprints[target].cnames)) for target in targets)
+
+    resolver = dns.resolver.Resolver(configure = False)
+    resolver.timeout = 2
+    resolver.lifetime = 6
+    #Every query goes to the next resolver.
+    resolver.rotate = True
+    for server in nameservers:
+        (host, port) = split_nameserver(server)
+        resolver.nameserver_ports[host] = port
+        resolver.nameservers.append(host)
+
+    cache = None
+    if cache_dir:
+        cache = answer_cache(os.path.join(cache_dir, "dns.sqlite"))
+
+    def resolve(job):
+        (hostname, record_type) = job
+        try:
+            answer = cached_query(resolver, cache, hostname, record_type)
         except Exception as e:
-            #The cx_freeze version uses queue.Empty instead of Queue.Empty :(
-            if type(e) == Queue.Empty or str(type(e)) == "<class 'queue.Empty'>":
-                pass
-            else:
-                raise(e)
-        #make sure everyone is complete
-        if threads_remaining <= 0:
-            break
-    trace("killing nameserver process")
-    #We no longer require name servers.
+            #NoAnswer or every resolver timed out.
+            trace("resolve failure:", hostname, record_type, type(e))
+            return (hostname, record_type, None)
+        if not answer:
+            return (hostname, record_type, None)
+        target = find_target(hostname, targets)
+        if record_type == "CNAME":
+            #The lookup processes cache the CNAMEs without the root dot.
+            found = [c.rstrip(".") for c in answer]
+            if target and wildcard_cnames[target] & set(found):
+                trace("resovled wildcard:", hostname)
+                return (hostname, record_type, None)
+            return (hostname, record_type, found)
+        found = []
+        for a in answer:
+            a = str(a)
+            if wildcard_key(target, a) in wildcards:
+                trace("resovled wildcard:", hostname)
+                return (hostname, record_type, None)
+            found.append(a)
+        return (hostname, record_type, found)
+
+    jobs = ((hostname, record_type) for hostname in hostnames for record_type in record_types)
+    pool = ThreadPool(process_count)
     try:
-        killproc(pid = verify_nameservers_proc.pid)
-    except:
-        #Windows threading.tread
-        verify_nameservers_proc.end()
-    trace("End")
+        for (hostname, record_type, found) in pool.imap_unordered(resolve, jobs):
+            if found:
+                yield (hostname, record_type, found)
+    finally:
+        pool.terminate()
+        if cache is not None:
+            cache.close()
+
+#Resolvers may carry a port as in dnsmasq and unbound configs,  "127.0.0.1#5353".
+def split_nameserver(server):
+    server = str(server).strip()
+    if "#" in server:
+        (host, port) = server.split("#", 1)
+        return (host, int(port))
+    return (server, 53)
 
 #exit handler for signals.  So ctrl+c will work. 
 #The 'multiprocessing' library each process is it's own process which side-steps the GIL
@@ -566,7 +2447,7 @@ if __name__ == "__main__":
     parser.add_option("-t", "--targets_file", dest = "targets", default = "",
               type = "string", help = "(optional) A file containing a newline delimited list of domains to brute force.")
     parser.add_option("-o", "--output", dest = "output",  default = False, help = "(optional) Output to file (Greppable Format)")
-    parser.add_option("-j", "--json", dest="json", default = False, help="(optional) Output to file (JSON Format)")
+    parser.add_option("-j", "--json", dest="json", default = False, help="(optional) Output to file (JSON Lines Format,  one record per subdomain)")
     parser.add_option("-a", "-A", action = 'store_true', dest = "ipv4", default = False,
               help = "(optional) Print all IPv4 addresses for sub domains (default = off).")
     parser.add_option("--type", dest = "type", default = False,
@@ -576,6 +2457,26 @@ if __name__ == "__main__":
               help = "(optional) Number of lookup theads to run. default = 16")
     parser.add_option("-f", "--filter_subs", dest = "filter", default = "",
               type = "string", help = "(optional) A file containing unorganized domain names which will be filtered into a list of subdomains sorted by frequency.  This was used to build names.txt.")                 
+    parser.add_option("--engine", dest = "engine", default = "process",
+              type = "choice", choices = ["process", "async"], help = "(optional) Lookup with one process per thread,  or with a single event loop that keeps thousands of queries in flight (default = process)")
+    parser.add_option("--checkpoint-dir", dest = "checkpoint_dir", default = "",
+              type = "string", help = "(optional) Periodically save the progress of each target to this directory,  an interrupted run started again with the same directory resumes where it stopped.")
+    parser.add_option("--cache-dir", dest = "cache_dir", default = "",
+              type = "string", help = "(optional) Remember the speed and reliability of every resolver,  the wildcards of every target and the DNS answers in this directory,  the next run tries the good resolvers first,  skips the ones that failed recently,  only confirms the wildcards and doesn't ask again for the answers whose TTL hasn't run out.")
+    parser.add_option("--compile", dest = "compile", default = "",
+              type = "string", help = "(optional) Compile the --subs wordlist into this file: deduplicated,  normalized and memory-mapped,  so large lists start instantly.  With -f the filtered list is compiled instead of printed.")
+    parser.add_option("--top", dest = "top", default = 0,
+              type = "int", help = "(optional) With -f,  only keep this many of the most frequent subdomains.")
+    parser.add_option("--sketch", action = 'store_true', dest = "sketch", default = False,
+              help = "(optional) With -f,  count approximately in fixed memory instead of exactly with partial counts spilled to disk.")
+    parser.add_option("--status", action = 'store_true', dest = "status", default = False,
+              help = "(optional) Show a live line of the queries per second,  progress and ETA on stderr.")
+    parser.add_option("--metrics", dest = "metrics", default = "",
+              type = "string", help = "(optional) Write the query counts,  answer codes and latency histogram of every resolver to this JSON file at the end of each target.")
+    parser.add_option("--recursive", dest = "recursive", default = 0,
+              type = "int", help = "(optional) Bruteforce the subdomains found in turn,  down to this many levels below the target.  Each level gets a tenth of the names of the one above,  starting at the first 1000 of the wordlist.")
+    parser.add_option("--recursion-budget", dest = "recursion_budget", default = 100000,
+              type = "int", help = "(optional) With --recursive,  the most queries to send below the subdomains found,  default = 100000")
     parser.add_option("-v", "--verbose", action = 'store_true', dest = "verbose", default = False,
               help = "(optional) Print debug information.")
     (options, args) = parser.parse_args()
@@ -583,13 +2484,23 @@ if __name__ == "__main__":
     
     verbose = options.verbose
 
-    if len(args) < 1 and options.filter == "" and options.targets == "":
+    if len(args) < 1 and options.filter == "" and options.targets == "" and options.compile == "":
         parser.error("You must provie a target. Use -h for help.")
 
     if options.filter != "":
         #cleanup this file and print it out
-        for d in extract_subdomains(options.filter):
-            print(d)
+        names = extract_subdomains(options.filter, options.top or None, options.sketch)
+        if options.compile != "":
+            count = write_wordlist(options.compile, [name for name in names if normalize_name(name) == name])
+            print("Compiled %d names into %s" % (count, options.compile))
+        else:
+            for d in names:
+                print(d)
+        sys.exit()
+
+    if options.compile != "":
+        count = compile_wordlist(options.subs, options.compile)
+        print("Compiled %d names into %s" % (count, options.compile))
         sys.exit()
 
     if options.targets != "":
@@ -630,6 +2541,19 @@ if __name__ == "__main__":
             #options.output
             #options.json
             print(target, record_type, options.subs, options.resolvers, options.process_count, output, json_output)
-            print_target(target, record_type, options.subs, options.resolvers, options.process_count, output, json_output)
+            checkpoint = None
+            if options.checkpoint_dir:
+                if not os.path.isdir(options.checkpoint_dir):
+                    os.makedirs(options.checkpoint_dir)
+                checkpoint = os.path.join(options.checkpoint_dir, "%s.state" % target)
+            metrics = None
+            if options.metrics:
+                metrics = options.metrics
+                if len(targets) > 1:
+                    #One report per target,  metrics.json => metrics-example.com.json
+                    (base, ext) = os.path.splitext(options.metrics)
+                    metrics = "%s-%s%s" % (base, target, ext or ".json")
+            print_target(target, record_type, options.subs, options.resolvers, options.process_count, output, json_output, checkpoint = checkpoint, engine = options.engine, cache_dir = options.cache_dir or None,
+                         status = options.status, metrics = metrics, recursive = options.recursive, recursion_budget = options.recursion_budget)
 
 
@@ -14,8 +14,17 @@ import random
 import multiprocessing
 import threading
 import socket
+import select
+import errno
 import json
-from collections import Counter
+import struct
+import tempfile
+import zlib
+import csv
+import sqlite3
+import calendar
+from collections import Counter, OrderedDict, deque
+from multiprocessing.pool import ThreadPool
 
 # external modules
 from subbrute import subbrute
@@ -26,9 +35,17 @@ import requests
 if sys.version > '3':
     import urllib.parse as urlparse
     import urllib.parse as urllib
+    from sys import intern
+    from io import StringIO
 else:
     import urlparse
     import urllib
+    from StringIO import StringIO
+
+try:
+    import queue as Queue
+except ImportError:
+    import Queue
 
 # In case you cannot install some of the required development packages
 # there's also an option to disable the SSL warning:
@@ -95,23 +112,286 @@ def parse_args():
     parser = argparse.ArgumentParser(epilog='\tExample: \r\npython ' + sys.argv[0] + " -d google.com")
     parser.error = parser_error
     parser._optionals.title = "OPTIONS"
-    parser.add_argument('-d', '--domain', help="Domain name to enumerate it's subdomains", required=True)
+    targets = parser.add_mutually_exclusive_group(required=True)
+    targets.add_argument('-d', '--domain', help="Domain name to enumerate it's subdomains")
+    targets.add_argument('-dL', '--domain-list', help='File with one domain per line to enumerate in one run, -o and --ports-output are then directories with a file per domain')
     parser.add_argument('-b', '--bruteforce', help='Enable the subbrute bruteforce module', nargs='?', default=False)
     parser.add_argument('-p', '--ports', help='Scan the found subdomains against specified tcp ports')
     parser.add_argument('-v', '--verbose', help='Enable Verbosity and display results in realtime', nargs='?', default=False)
+    parser.add_argument('-r', '--resolve', help='Resolve the subdomains found by the engines for A, AAAA and CNAME records, dropping wildcard answers', default=False, action='store_true')
+    parser.add_argument('--alterations', help='With -b, try up to this many alterations of the found subdomains (web-01 => web-02, api => dev-api, api-dev => api-prod) ahead of the wordlist', type=int, default=0)
+    parser.add_argument('--recursive', help='With -b, bruteforce the found subdomains in turn down to this many levels below the domain, breadth first with fewer words per level', type=int, default=0)
     parser.add_argument('-t', '--threads', help='Number of threads to use for subbrute bruteforce', type=int, default=30)
+    parser.add_argument('--bruteforce-engine', help='Lookup with one process per thread or with a single async DNS event loop', choices=['process', 'async'], default='process')
+    parser.add_argument('--dns-metrics', help='With -b, write the query counts, answer codes and latency histogram of every resolver to this JSON file')
     parser.add_argument('-e', '--engines', help='Specify a comma-separated list of search engines')
     parser.add_argument('-o', '--output', help='Save the results to text file')
+    parser.add_argument('--output-format', help='Save one subdomain per line, one JSON record or CSV row per subdomain as they are found, or the sorted results as a nested JSON tree', choices=['text', 'jsonl', 'csv', 'tree'], default='text')
+    parser.add_argument('--ports-output', help='Save the port scan results to text file as host,port,state,latency in ms')
     parser.add_argument('-n', '--no-color', help='Output without color', default=False, action='store_true')
+    parser.add_argument('--cache-dir', help='Cache the engine responses in this directory and reuse them on the next runs')
+    parser.add_argument('--cache-size', help='Maximum size of the response cache in MB', type=int, default=100)
+    parser.add_argument('--history', help='Record every run in this SQLite database, with the first and last time each subdomain was seen')
+    parser.add_argument('--since', help='Only report the subdomains first seen since this UTC date or time (2024-01-31, 2024-01-31T08:00) or age (12h, 7d), requires --history')
+    parser.add_argument('--new-only', help='Only report the subdomains that no earlier run found, requires --history', default=False, action='store_true')
+    parser.add_argument('--fresh', help='Take the subdomains the bruteforce or -r resolved in the last FRESH hours from the history instead of resolving them again', type=float, default=0)
+    parser.add_argument('-m', '--engine-mode', help='Run the search engines as separate processes or as threads of this process (default process, thread with -dL)', choices=['process', 'thread'])
     return parser.parse_args()
 
 
 def write_file(filename, subdomains):
-    # saving subdomains results to output file
+    # saving subdomains results to output file as they come in
     print("%s[-] Saving results to file: %s%s%s%s" % (Y, W, R, filename, W))
     with open(str(filename), 'wt') as f:
         for subdomain in subdomains:
-            f.write(subdomain + os.linesep)
+            # text mode already turns \n into os.linesep
+            f.write(subdomain + '\n')
+            f.flush()
+
+
+def write_tree(filename, tree):
+    # the nested tree can only be written once the run is over
+    print("%s[-] Saving results to file: %s%s%s%s" % (Y, W, R, filename, W))
+    with open(str(filename), 'wt') as f:
+        json.dump(tree, f, indent=2)
+        f.write('\n')
+
+
+def iso_time(timestamp=None):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def parse_since(value):
+    """Unix time of a --since value, a UTC date or time in ISO format or an age like 12h or 7d"""
+    ages = {'m': 60, 'h': 3600, 'd': 86400, 'w': 7 * 86400}
+    if value[-1:] in ages and value[:-1].isdigit():
+        return time.time() - int(value[:-1]) * ages[value[-1]]
+    for fmt in ('%Y-%m-%dT%H:%M:%SZ', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%dT%H:%M', '%Y-%m-%d'):
+        try:
+            return calendar.timegm(time.strptime(value, fmt))
+        except ValueError:
+            continue
+    raise ValueError("invalid time: %s" % value)
+
+
+def new_record(subdomain, source, addresses=None, record_type=None, first_seen=None):
+    """The result record of a subdomain as the record writers take it"""
+    return {
+        'subdomain': subdomain,
+        'sources': [source],
+        'addresses': list(addresses or []),
+        'record_type': record_type,
+        # None until the port scan has been over the subdomain
+        'ports': None,
+        'first_seen': iso_time(first_seen),
+    }
+
+
+class RecordWriter(object):
+    """Buffered writer of the result records that streams them to a file
+
+    Records are buffered and the buffer goes to the file once it holds
+    buffer_size records or flush_interval seconds after the first record in
+    it, so a tail -f of the file keeps up with the scan without one write
+    per subdomain. The port scan writes a second record for every subdomain
+    it goes over, the last record of a subdomain is the complete one.
+    """
+    fields = ('subdomain', 'sources', 'addresses', 'record_type', 'ports', 'first_seen')
+    extension = '.txt'
+
+    def __init__(self, filename, buffer_size=64, flush_interval=1.0):
+        self.file = open(str(filename), 'w')
+        self.buffer = []
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.timer = None
+        self.buffer.append(self.header())
+
+    def header(self):
+        return ''
+
+    def encode(self, record):
+        raise NotImplementedError
+
+    def write(self, record):
+        with self.lock:
+            self.buffer.append(self.encode(record))
+            if len(self.buffer) >= self.buffer_size:
+                self.write_buffer()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def write_buffer(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.buffer:
+            self.file.write(''.join(self.buffer))
+            self.buffer = []
+            self.file.flush()
+
+    def flush(self):
+        with self.lock:
+            self.write_buffer()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+
+class TextWriter(RecordWriter):
+    """One subdomain per line, the later records of a subdomain are left out"""
+    def __init__(self, filename, buffer_size=64, flush_interval=1.0):
+        self.written = set()
+        super(TextWriter, self).__init__(filename, buffer_size, flush_interval)
+
+    def encode(self, record):
+        if record['subdomain'] in self.written:
+            return ''
+        self.written.add(record['subdomain'])
+        return record['subdomain'] + '\n'
+
+
+class JsonLinesWriter(RecordWriter):
+    extension = '.jsonl'
+
+    def encode(self, record):
+        return json.dumps(OrderedDict((field, record[field]) for field in self.fields)) + '\n'
+
+
+class CsvWriter(RecordWriter):
+    """One row per record, the lists are joined with ';'"""
+    extension = '.csv'
+
+    def __init__(self, filename, buffer_size=64, flush_interval=1.0):
+        self.line = StringIO()
+        self.csv = csv.writer(self.line, lineterminator='\n')
+        super(CsvWriter, self).__init__(filename, buffer_size, flush_interval)
+
+    def row(self, values):
+        self.line.seek(0)
+        self.line.truncate()
+        self.csv.writerow(values)
+        return self.line.getvalue()
+
+    def header(self):
+        return self.row(self.fields)
+
+    def encode(self, record):
+        values = []
+        for field in self.fields:
+            value = record[field]
+            if isinstance(value, list):
+                value = ';'.join(str(v) for v in value)
+            values.append('' if value is None else value)
+        return self.row(values)
+
+
+record_writers = {'text': TextWriter,
+                  'jsonl': JsonLinesWriter,
+                  'csv': CsvWriter
+                  }
+
+
+def write_port_records(writer, records, subdomains, results):
+    # one more record for every scanned subdomain, with its open ports
+    open_ports = {}
+    for host, port, state, latency in results:
+        ports = open_ports.setdefault(host, [])
+        if state == 'open':
+            ports.append(port)
+    for subdomain in subdomains:
+        if subdomain in records and subdomain in open_ports:
+            records[subdomain]['ports'] = sorted(open_ports[subdomain])
+            writer.write(records[subdomain])
+
+
+class ScanHistory(object):
+    """SQLite store of the subdomains found by every run
+
+    A row per target and subdomain keeps the times it was first and last
+    seen and the addresses it resolved to last, the engines that found it
+    go to the sources table and every run to the runs table. The results
+    are buffered and written batch_size at a time in one transaction, so a
+    large scan doesn't pay for a commit per subdomain. The names taken from
+    the history instead of being resolved again come with the 'history'
+    source, they are only marked as seen.
+    """
+    schema = (
+        'CREATE TABLE IF NOT EXISTS subdomains (target TEXT NOT NULL, subdomain TEXT NOT NULL, '
+        'first_seen REAL NOT NULL, last_seen REAL NOT NULL, record_type TEXT, addresses TEXT, resolved REAL, '
+        'PRIMARY KEY (target, subdomain))',
+        'CREATE TABLE IF NOT EXISTS sources (target TEXT NOT NULL, subdomain TEXT NOT NULL, source TEXT NOT NULL, '
+        'PRIMARY KEY (target, subdomain, source))',
+        'CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY, target TEXT NOT NULL, started REAL NOT NULL, finished REAL)',
+    )
+
+    def __init__(self, path, batch_size=500):
+        self.db = sqlite3.connect(str(path), timeout=60)
+        # concurrent runs of other targets can read while one writes
+        self.db.execute('PRAGMA journal_mode=WAL')
+        with self.db:
+            for statement in self.schema:
+                self.db.execute(statement)
+        self.batch_size = batch_size
+        self.pending = []
+
+    def start(self, target):
+        with self.db:
+            return self.db.execute('INSERT INTO runs (target, started) VALUES (?, ?)', (target, time.time())).lastrowid
+
+    def finish(self, run):
+        self.flush()
+        with self.db:
+            self.db.execute('UPDATE runs SET finished = ? WHERE id = ?', (time.time(), run))
+
+    def last_run(self, target):
+        """Start time of the last run of target that completed, None before the first one"""
+        row = self.db.execute('SELECT MAX(started) FROM runs WHERE target = ? AND finished IS NOT NULL', (target,)).fetchone()
+        return row[0]
+
+    def first_seen(self, target):
+        """{subdomain: first seen time} of every subdomain of target"""
+        return dict(self.db.execute('SELECT subdomain, first_seen FROM subdomains WHERE target = ?', (target,)))
+
+    def verified(self, target, max_age):
+        """{subdomain: addresses} of the subdomains of target resolved in the last max_age seconds"""
+        return dict((subdomain, addresses) for subdomain, (record_type, addresses) in self.resolved(target, max_age).items())
+
+    def resolved(self, target, max_age):
+        """{subdomain: (record_type, addresses)} of the subdomains of target resolved in the last max_age seconds"""
+        rows = self.db.execute('SELECT subdomain, record_type, addresses FROM subdomains WHERE target = ? AND resolved >= ?',
+                               (target, time.time() - max_age))
+        return dict((subdomain, (record_type, json.loads(addresses))) for subdomain, record_type, addresses in rows)
+
+    def add(self, target, subdomain, source, addresses=None, record_type=None):
+        self.pending.append((target, subdomain, source, list(addresses or []), record_type, time.time()))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        with self.db:
+            self.db.executemany('INSERT OR IGNORE INTO subdomains (target, subdomain, first_seen, last_seen) VALUES (?, ?, ?, ?)',
+                                ((target, subdomain, now, now) for target, subdomain, source, addresses, record_type, now in pending))
+            self.db.executemany('UPDATE subdomains SET last_seen = ? WHERE target = ? AND subdomain = ?',
+                                ((now, target, subdomain) for target, subdomain, source, addresses, record_type, now in pending))
+            self.db.executemany('UPDATE subdomains SET record_type = ?, addresses = ?, resolved = ? WHERE target = ? AND subdomain = ?',
+                                ((record_type, json.dumps(addresses), now, target, subdomain)
+                                 for target, subdomain, source, addresses, record_type, now in pending
+                                 if addresses and source != 'history'))
+            self.db.executemany('INSERT OR IGNORE INTO sources (target, subdomain, source) VALUES (?, ?, ?)',
+                                ((target, subdomain, source) for target, subdomain, source, addresses, record_type, now in pending
+                                 if source != 'history'))
+
+    def close(self):
+        self.flush()
+        self.db.close()
 
 
 def subdomain_sorting_key(hostname):
@@ -140,17 +420,328 @@ def subdomain_sorting_key(hostname):
     return parts, 0
 
 
+class SubdomainTrie(object):
+    """Set of subdomains stored label by label from the top-level domain down
+
+    Every node is a dict of its child labels, with the '' key set on the
+    nodes of the hostnames that were added. The labels are interned so the
+    common suffixes of a large scan are stored once, adding a hostname tells
+    whether it is new, and iterating walks the nodes in the order of
+    subdomain_sorting_key without splitting or sorting the whole result.
+    """
+    END = ''
+
+    def __init__(self, hostnames=()):
+        self.root = {}
+        self.count = 0
+        for hostname in hostnames:
+            self.add(hostname)
+
+    def node(self, hostname):
+        node = self.root
+        for label in reversed(hostname.split('.')):
+            node = node.get(label)
+            if node is None:
+                return None
+        return node
+
+    def add(self, hostname):
+        """Add hostname, True if it wasn't there yet"""
+        node = self.root
+        for label in reversed(hostname.split('.')):
+            child = node.get(label)
+            if child is None:
+                child = node[intern(label)] = {}
+            node = child
+        if self.END in node:
+            return False
+        node[self.END] = True
+        self.count += 1
+        return True
+
+    def __contains__(self, hostname):
+        node = self.node(hostname)
+        return node is not None and self.END in node
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return self.walk(self.root, [])
+
+    def walk(self, node, labels):
+        # www.<name> sorts right after <name>, before the other names under it
+        www = node.get('www')
+        if labels and www is not None and self.END in www:
+            yield '.'.join(reversed(labels + ['www']))
+        for label in sorted(node):
+            if label == self.END:
+                continue
+            child = node[label]
+            labels.append(label)
+            if (label != 'www' or len(labels) == 1) and self.END in child:
+                yield '.'.join(reversed(labels))
+            for hostname in self.walk(child, labels):
+                yield hostname
+            labels.pop()
+
+    def under(self, suffix):
+        """The hostnames under suffix in sorted order, '*.suffix' leaves suffix itself out"""
+        wildcard = suffix.startswith('*.')
+        if wildcard:
+            suffix = suffix[2:]
+        node = self.node(suffix)
+        if node is None:
+            return
+        if not wildcard and self.END in node:
+            yield suffix
+        for hostname in self.walk(node, list(reversed(suffix.split('.')))):
+            yield hostname
+
+    def tree(self, suffix):
+        """suffix and everything under it as nested {name, found, subdomains} dicts for JSON output"""
+        node = self.node(suffix)
+        if node is None:
+            return {'name': suffix, 'found': False, 'subdomains': []}
+        return self.subtree(node, suffix)
+
+    def subtree(self, node, name):
+        subdomains = [self.subtree(node[label], label + '.' + name) for label in sorted(node) if label != self.END]
+        return {'name': name, 'found': self.END in node, 'subdomains': subdomains}
+
+
+class ResponseCache(object):
+    """Compressed on-disk cache for the engine responses
+
+    Every entry is a file named after the sha1 of the engine name and url
+    which holds the time it was fetched followed by the zlib compressed body.
+    Entries are written to a temporary file and renamed into place, so that
+    concurrent runs can share the same directory. Reading an entry touches it
+    and the least recently used entries are evicted past max_size bytes.
+    """
+    header = struct.Struct('!d')
+
+    def __init__(self, path, max_size=100 * 1024 * 1024):
+        self.path = path
+        self.max_size = max_size
+        self.written = 0
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # another run created it first
+                pass
+        self.evict()
+
+    def entry(self, engine_name, url):
+        key = hashlib.sha1((engine_name + '\n' + url).encode('utf-8')).hexdigest()
+        return os.path.join(self.path, key)
+
+    def get(self, engine_name, url, ttl):
+        path = self.entry(engine_name, url)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            fetched = self.header.unpack(data[:self.header.size])[0]
+            if time.time() - fetched > ttl:
+                return None
+            body = zlib.decompress(data[self.header.size:])
+            os.utime(path, None)
+        except (IOError, OSError, struct.error, zlib.error):
+            return None
+        return body
+
+    def set(self, engine_name, url, body):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        data = self.header.pack(time.time()) + zlib.compress(body)
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            if hasattr(os, 'replace'):
+                os.replace(tmp, self.entry(engine_name, url))
+            else:
+                os.rename(tmp, self.entry(engine_name, url))
+        except (IOError, OSError):
+            return
+        self.written += len(data)
+        if self.written > self.max_size // 10:
+            self.evict()
+
+    def evict(self):
+        self.written = 0
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            try:
+                st = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+            total += st.st_size
+        if total <= self.max_size:
+            return
+        # oldest first, leave some headroom so we don't evict on every write
+        for mtime, size, name in sorted(entries):
+            if total <= self.max_size * 0.9:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
+
+
+class HostExtractor(object):
+    """Single pass extraction of the hostnames from an engine's response body
+
+    The link patterns of an engine are joined into one regex, compiled once
+    when the engine class is defined, and run over the raw response bytes, so
+    nothing gets decoded but the hostnames themselves. Every link has its
+    markup, scheme, credentials, port and path stripped in the same pass and
+    is kept only if it is a valid hostname under the target domain. within is
+    a pattern for the part of the page that holds the results, split breaks a
+    link that carries several hostnames.
+    """
+    markup = re.compile(br'<[^>]*>|&nbsp;|[<>]')
+    hostname = re.compile(br'\s*(?:[a-z][a-z0-9+.\-]*://)?(?:[^\s/@]*@)?'
+                          br'((?:[a-z0-9_](?:[a-z0-9_\-]{0,61}[a-z0-9])?\.)+[a-z](?:[a-z0-9\-]{0,61}[a-z0-9])?)'
+                          br'\.?(?:[\s:/?#]|$)', re.I)
+
+    def __init__(self, patterns, within=None, split=None, flags=0):
+        self.link = re.compile(b'|'.join(b'(?:' + pattern + b')' for pattern in patterns), flags)
+        self.within = re.compile(within, flags) if within else None
+        self.split = split
+
+    def links(self, body):
+        if not body:
+            return
+        start, end = 0, len(body)
+        if self.within is not None:
+            scope = self.within.search(body)
+            if scope is None:
+                return
+            start, end = scope.span(1)
+        for match in self.link.finditer(body, start, end):
+            for link in match.groups():
+                if link is not None:
+                    break
+            if self.split and self.split in link:
+                for part in link.split(self.split):
+                    yield part
+            else:
+                yield link
+
+    def host(self, link, domain):
+        """The hostname of link if it is under domain, None otherwise"""
+        if b'<' in link or b'&' in link or b'>' in link:
+            link = self.markup.sub(b'', link)
+        match = self.hostname.match(link)
+        if match is None:
+            return None
+        host = match.group(1).lower().decode('ascii')
+        if host != domain and not host.endswith('.' + domain):
+            return None
+        return host
+
+    def extract(self, body, domain):
+        """All the hostnames under domain in body in page order, duplicates included"""
+        domain = domain.lower()
+        hosts = []
+        for link in self.links(body):
+            host = self.host(link, domain)
+            if host is not None:
+                hosts.append(host)
+        return hosts
+
+
+class RateScheduler(object):
+    """Token bucket pacing of an engine's requests with backoff
+
+    The bucket holds up to burst tokens and refills at rate tokens per second,
+    every request takes one, so an engine goes as fast as it is allowed to
+    instead of sleeping a fixed time after every page. A rate of 0 doesn't
+    pace at all. Every throttled response (a 429/503 or a block page) empties
+    the bucket and holds the next request back for twice as long as the last
+    time, up to max_backoff seconds or the server's Retry-After. A request
+    that goes through resets the backoff.
+    """
+    throttle_status = (429, 503)
+
+    def __init__(self, rate=0, burst=1, max_retries=4, max_backoff=120):
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+        self.tokens = burst
+        self.stamp = time.time()
+        self.not_before = 0
+        self.failures = 0
+
+    def delay(self):
+        """Take a token and return how long to wait before sending the request"""
+        now = time.time()
+        wait = max(0, self.not_before - now)
+        if self.rate:
+            self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= 1
+            if self.tokens < 0:
+                # a little jitter so that the requests don't look scripted
+                wait = max(wait, -self.tokens / self.rate * random.uniform(1, 1.3))
+        return wait
+
+    def acquire(self):
+        wait = self.delay()
+        if wait:
+            time.sleep(wait)
+
+    def throttled(self, response):
+        return response is not None and response.status_code in self.throttle_status
+
+    def back_off(self, response=None):
+        """Hold the next request back, False once the retries are used up"""
+        self.failures += 1
+        if self.failures > self.max_retries:
+            return False
+        backoff = (1.0 / self.rate if self.rate else 1) * 2 ** self.failures
+        retry_after = response.headers.get('Retry-After', '') if response is not None else ''
+        if retry_after.isdigit():
+            backoff = int(retry_after)
+        self.tokens = 0
+        self.not_before = time.time() + min(backoff, self.max_backoff)
+        return True
+
+    def passed(self):
+        self.failures = 0
+
+
 class enumratorBase(object):
+    # how long a cached response of this engine stays valid, in seconds
+    CACHE_TTL = 24 * 60 * 60
+    # the HostExtractor for the engine's result pages
+    PARSER = None
+    # requests per second and how many can go out back to back, 0 doesn't pace
+    RATE = 0
+    BURST = 1
+
     def __init__(self, base_url, engine_name, domain, subdomains=None, silent=False, verbose=True):
         subdomains = subdomains or []
         self.domain = urlparse.urlparse(domain).netloc
         self.session = requests.Session()
+        self.cache = None
+        # subbrute's answer_cache for the engines that resolve what they find
+        self.dns_cache = None
         self.subdomains = []
         self.timeout = 25
         self.base_url = base_url
         self.engine_name = engine_name
         self.silent = silent
         self.verbose = verbose
+        self.pacer = RateScheduler(self.RATE, self.BURST)
+        # the last response from the network, None when it came from the cache
+        self.response = None
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.36',
             'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
@@ -172,16 +763,37 @@ class enumratorBase(object):
     def send_req(self, query, page_no=1):
 
         url = self.base_url.format(query=query, page_no=page_no)
+        self.response = None
+        cached = self.get_cached(url)
+        if cached is not None:
+            return cached
+        self.pacer.acquire()
         try:
             resp = self.session.get(url, headers=self.headers, timeout=self.timeout)
         except Exception:
             resp = None
+        self.response = resp
+        self.put_cached(url, resp)
         return self.get_response(resp)
 
+    def get_cached(self, url):
+        if self.cache is None:
+            return None
+        return self.cache.get(self.engine_name, url, self.CACHE_TTL)
+
+    def put_cached(self, url, response):
+        # only successful responses are worth replaying, block pages aren't
+        if self.cache is None or response is None or response.status_code != 200:
+            return
+        if not self.check_response_errors(self.get_response(response)):
+            return
+        self.cache.set(self.engine_name, url, self.get_response(response))
+
     def get_response(self, response):
+        # the raw body, the parsers work on bytes and decode just the hostnames
         if response is None:
             return 0
-        return response.text if hasattr(response, "text") else response.content
+        return response.content
 
     def check_max_subdomains(self, count):
         if self.MAX_DOMAINS == 0:
@@ -193,10 +805,21 @@ class enumratorBase(object):
             return False
         return num >= self.MAX_PAGES
 
+    def add_subdomain(self, subdomain):
+        if subdomain in self.subdomains or subdomain == self.domain:
+            return False
+        if self.verbose:
+            self.print_("%s%s: %s%s" % (R, self.engine_name, W, subdomain))
+        self.subdomains.append(subdomain)
+        return True
+
     # override
     def extract_domains(self, resp):
-        """ chlid class should override this function """
-        return
+        """ chlid class without a PARSER should override this function """
+        links_list = self.PARSER.extract(resp, self.domain)
+        for subdomain in links_list:
+            self.add_subdomain(subdomain)
+        return links_list
 
     # override
     def check_response_errors(self, resp):
@@ -205,9 +828,16 @@ class enumratorBase(object):
         """
         return True
 
-    def should_sleep(self):
-        """Some enumrators require sleeping to avoid bot detections like Google enumerator"""
-        return
+    def blocked(self, resp):
+        return self.pacer.throttled(self.response) or not self.check_response_errors(resp)
+
+    def back_off(self):
+        """Wait out a throttled response, False when the engine should give up"""
+        self.print_(R + "[!] Error: %s probably now is blocking our requests" % self.engine_name + W)
+        if self.pacer.back_off(self.response):
+            return True
+        self.print_(R + "[~] Finished now the %s Enumeration ..." % self.engine_name + W)
+        return False
 
     def generate_query(self):
         """ chlid class should override this function """
@@ -236,10 +866,14 @@ class enumratorBase(object):
                 return self.subdomains
             resp = self.send_req(query, page_no)
 
-            # check if there is any error occured
-            if not self.check_response_errors(resp):
-                return self.subdomains
+            # ask again once the engine lets us, the pacer backs off every time
+            while self.blocked(resp):
+                if not self.back_off():
+                    return self.subdomains
+                resp = self.send_req(query, page_no)
+            self.pacer.passed()
             links = self.extract_domains(resp)
+            self.report()
 
             # if the previous page hyperlinks was the similar to the current one, then maybe we have reached the last page
             if links == prev_links:
@@ -251,7 +885,6 @@ class enumratorBase(object):
                     return self.subdomains
 
             prev_links = links
-            self.should_sleep()
 
         return self.subdomains
 
@@ -262,54 +895,46 @@ class enumratorBaseThreaded(multiprocessing.Process, enumratorBase):
         enumratorBase.__init__(self, base_url, engine_name, domain, subdomains, silent=silent, verbose=verbose)
         multiprocessing.Process.__init__(self)
         self.q = q
+        self.reported = 0
         return
 
+    def report(self, found=None):
+        """Send the subdomains found since the last report to the parent, one message per page"""
+        found = self.subdomains if found is None else found
+        if self.q is None or len(found) <= self.reported:
+            return
+        self.q.put((self.engine_name, found[self.reported:]))
+        self.reported = len(found)
+
     def run(self):
-        domain_list = self.enumerate()
-        for domain in domain_list:
-            self.q.append(domain)
+        try:
+            self.report(self.enumerate())
+        finally:
+            # let the parent know that we are done, the parent dedups the results
+            self.q.put((self.engine_name, None))
 
 
 class GoogleEnum(enumratorBaseThreaded):
+    PARSER = HostExtractor([br'<cite.*?>(.*?)</cite>'])
+
     def __init__(self, domain, subdomains=None, q=None, silent=False, verbose=True):
         subdomains = subdomains or []
         base_url = "https://google.com/search?q={query}&btnG=Search&hl=en-US&biw=&bih=&gbv=1&start={page_no}&filter=0"
         self.engine_name = "Google"
         self.MAX_DOMAINS = 11
         self.MAX_PAGES = 200
+        # Google blocks quickly, stay at one page every 5 seconds after the first few
+        self.RATE = 0.2
+        self.BURST = 3
         super(GoogleEnum, self).__init__(base_url, self.engine_name, domain, subdomains, q=q, silent=silent, verbose=verbose)
         self.q = q
         return
 
-    def extract_domains(self, resp):
-        links_list = list()
-        link_regx = re.compile('<cite.*?>(.*?)<\/cite>')
-        try:
-            links_list = link_regx.findall(resp)
-            for link in links_list:
-                link = re.sub('<span.*>', '', link)
-                if not link.startswith('http'):
-                    link = "http://" + link
-                subdomain = urlparse.urlparse(link).netloc
-                if subdomain and subdomain not in self.subdomains and subdomain != self.domain:
-                    if self.verbose:
-                        self.print_("%s%s: %s%s" % (R, self.engine_name, W, subdomain))
-                    self.subdomains.append(subdomain.strip())
-        except Exception:
-            pass
-        return links_list
-
     def check_response_errors(self, resp):
-        if (type(resp) is str or type(resp) is unicode) and 'Our systems have detected unusual traffic' in resp:
-            self.print_(R + "[!] Error: Google probably now is blocking our requests" + W)
-            self.print_(R + "[~] Finished now the Google Enumeration ..." + W)
+        if isinstance(resp, bytes) and b'Our systems have detected unusual traffic' in resp:
             return False
         return True
 
-    def should_sleep(self):
-        time.sleep(5)
-        return
-
     def generate_query(self):
         if self.subdomains:
             fmt = 'site:{domain} -www.{domain} -{found}'
@@ -321,6 +946,9 @@ class GoogleEnum(enumratorBaseThreaded):
 
 
 class YahooEnum(enumratorBaseThreaded):
+    PARSER = HostExtractor([br'<span class="txt"><span class=" cite fw-xl fz-15px">(.*?)</span>',
+                            br'<span class=" fz-.*? fw-m fc-12th wr-bw.*?">(.*?)</span>'])
+
     def __init__(self, domain, subdomains=None, q=None, silent=False, verbose=True):
         subdomains = subdomains or []
         base_url = "https://search.yahoo.com/search?p={query}&b={page_no}"
@@ -331,33 +959,6 @@ class YahooEnum(enumratorBaseThreaded):
         self.q = q
         return
 
-    def extract_domains(self, resp):
-        link_regx2 = re.compile('<span class=" fz-.*? fw-m fc-12th wr-bw.*?">(.*?)</span>')
-        link_regx = re.compile('<span class="txt"><span class=" cite fw-xl fz-15px">(.*?)</span>')
-        links_list = []
-        try:
-            links = link_regx.findall(resp)
-            links2 = link_regx2.findall(resp)
-            links_list = links + links2
-            for link in links_list:
-                link = re.sub("<(\/)?b>", "", link)
-                if not link.startswith('http'):
-                    link = "http://" + link
-                subdomain = urlparse.urlparse(link).netloc
-                if not subdomain.endswith(self.domain):
-                    continue
-                if subdomain and subdomain not in self.subdomains and subdomain != self.domain:
-                    if self.verbose:
-                        self.print_("%s%s: %s%s" % (R, self.engine_name, W, subdomain))
-                    self.subdomains.append(subdomain.strip())
-        except Exception:
-            pass
-
-        return links_list
-
-    def should_sleep(self):
-        return
-
     def get_page(self, num):
         return num + 10
 
@@ -372,6 +973,8 @@ class YahooEnum(enumratorBaseThreaded):
 
 
 class AskEnum(enumratorBaseThreaded):
+    PARSER = HostExtractor([br'<p class="web-result-url">(.*?)</p>'])
+
     def __init__(self, domain, subdomains=None, q=None, silent=False, verbose=True):
         subdomains = subdomains or []
         base_url = 'http://www.ask.com/web?q={query}&page={page_no}&qid=8D6EE6BF52E0C04527E51F64F22C4534&o=0&l=dir&qsrc=998&qo=pagination'
@@ -382,24 +985,6 @@ class AskEnum(enumratorBaseThreaded):
         self.q = q
         return
 
-    def extract_domains(self, resp):
-        links_list = list()
-        link_regx = re.compile('<p class="web-result-url">(.*?)</p>')
-        try:
-            links_list = link_regx.findall(resp)
-            for link in links_list:
-                if not link.startswith('http'):
-                    link = "http://" + link
-                subdomain = urlparse.urlparse(link).netloc
-                if subdomain not in self.subdomains and subdomain != self.domain:
-                    if self.verbose:
-                        self.print_("%s%s: %s%s" % (R, self.engine_name, W, subdomain))
-                    self.subdomains.append(subdomain.strip())
-        except Exception:
-            pass
-
-        return links_list
-
     def get_page(self, num):
         return num + 1
 
@@ -415,6 +1000,9 @@ class AskEnum(enumratorBaseThreaded):
 
 
 class BingEnum(enumratorBaseThreaded):
+    PARSER = HostExtractor([br'<li class="b_algo"><h2><a href="(.*?)"',
+                            br'<div class="b_title"><h2><a href="(.*?)"'])
+
     def __init__(self, domain, subdomains=None, q=None, silent=False, verbose=True):
         subdomains = subdomains or []
         base_url = 'https://www.bing.com/search?q={query}&go=Submit&first={page_no}'
@@ -426,29 +1014,6 @@ class BingEnum(enumratorBaseThreaded):
         self.verbose = verbose
         return
 
-    def extract_domains(self, resp):
-        links_list = list()
-        link_regx = re.compile('<li class="b_algo"><h2><a href="(.*?)"')
-        link_regx2 = re.compile('<div class="b_title"><h2><a href="(.*?)"')
-        try:
-            links = link_regx.findall(resp)
-            links2 = link_regx2.findall(resp)
-            links_list = links + links2
-
-            for link in links_list:
-                link = re.sub('<(\/)?strong>|<span.*?>|<|>', '', link)
-                if not link.startswith('http'):
-                    link = "http://" + link
-                subdomain = urlparse.urlparse(link).netloc
-                if subdomain not in self.subdomains and subdomain != self.domain:
-                    if self.verbose:
-                        self.print_("%s%s: %s%s" % (R, self.engine_name, W, subdomain))
-                    self.subdomains.append(subdomain.strip())
-        except Exception:
-            pass
-
-        return links_list
-
     def generate_query(self):
         if self.subdomains:
             fmt = 'domain:{domain} -www.{domain} -{found}'
@@ -460,41 +1025,30 @@ class BingEnum(enumratorBaseThreaded):
 
 
 class BaiduEnum(enumratorBaseThreaded):
+    PARSER = HostExtractor([br'<a.*?class="c-showurl".*?>(.*?)</a>'])
+
     def __init__(self, domain, subdomains=None, q=None, silent=False, verbose=True):
         subdomains = subdomains or []
         base_url = 'https://www.baidu.com/s?pn={page_no}&wd={query}&oq={query}'
         self.engine_name = "Baidu"
         self.MAX_DOMAINS = 2
         self.MAX_PAGES = 760
+        self.RATE = 0.3
+        self.BURST = 3
         enumratorBaseThreaded.__init__(self, base_url, self.engine_name, domain, subdomains, q=q, silent=silent, verbose=verbose)
         self.querydomain = self.domain
         self.q = q
         return
 
     def extract_domains(self, resp):
-        links = list()
         found_newdomain = False
-        subdomain_list = []
-        link_regx = re.compile('<a.*?class="c-showurl".*?>(.*?)</a>')
-        try:
-            links = link_regx.findall(resp)
-            for link in links:
-                link = re.sub('<.*?>|>|<|&nbsp;', '', link)
-                if not link.startswith('http'):
-                    link = "http://" + link
-                subdomain = urlparse.urlparse(link).netloc
-                if subdomain.endswith(self.domain):
-                    subdomain_list.append(subdomain)
-                    if subdomain not in self.subdomains and subdomain != self.domain:
-                        found_newdomain = True
-                        if self.verbose:
-                            self.print_("%s%s: %s%s" % (R, self.engine_name, W, subdomain))
-                        self.subdomains.append(subdomain.strip())
-        except Exception:
-            pass
+        subdomain_list = self.PARSER.extract(resp, self.domain)
+        for subdomain in subdomain_list:
+            if self.add_subdomain(subdomain):
+                found_newdomain = True
         if not found_newdomain and subdomain_list:
             self.querydomain = self.findsubs(subdomain_list)
-        return links
+        return subdomain_list
 
     def findsubs(self, subdomains):
         count = Counter(subdomains)
@@ -506,10 +1060,6 @@ class BaiduEnum(enumratorBaseThreaded):
     def check_response_errors(self, resp):
         return True
 
-    def should_sleep(self):
-        time.sleep(random.randint(2, 5))
-        return
-
     def generate_query(self):
         if self.subdomains and self.querydomain != self.domain:
             found = ' -site:'.join(self.querydomain)
@@ -520,16 +1070,22 @@ class BaiduEnum(enumratorBaseThreaded):
 
 
 class NetcraftEnum(enumratorBaseThreaded):
+    PARSER = HostExtractor([br'<a class="results-table__host" href="(.*?)"'])
+    next_regx = re.compile(br'<a.*?href="(.*?)">Next Page')
+
     def __init__(self, domain, subdomains=None, q=None, silent=False, verbose=True):
         subdomains = subdomains or []
         self.base_url = 'https://searchdns.netcraft.com/?restriction=site+ends+with&host={domain}'
         self.engine_name = "Netcraft"
+        self.RATE = 0.7
+        self.BURST = 3
         super(NetcraftEnum, self).__init__(self.base_url, self.engine_name, domain, subdomains, q=q, silent=silent, verbose=verbose)
         self.q = q
         return
 
     def req(self, url, cookies=None):
         cookies = cookies or {}
+        self.pacer.acquire()
         try:
             resp = self.session.get(url, headers=self.headers, timeout=self.timeout, cookies=cookies)
         except Exception as e:
@@ -537,14 +1093,9 @@ class NetcraftEnum(enumratorBaseThreaded):
             resp = None
         return resp
 
-    def should_sleep(self):
-        time.sleep(random.randint(1, 2))
-        return
-
     def get_next(self, resp):
-        link_regx = re.compile('<a.*?href="(.*?)">Next Page')
-        link = link_regx.findall(resp)
-        url = 'http://searchdns.netcraft.com' + link[0]
+        link = self.next_regx.findall(resp)
+        url = 'http://searchdns.netcraft.com' + link[0].decode('utf-8')
         return url
 
     def create_cookies(self, cookie):
@@ -568,33 +1119,27 @@ class NetcraftEnum(enumratorBaseThreaded):
         cookies = self.get_cookies(resp.headers)
         url = self.base_url.format(domain=self.domain)
         while True:
-            resp = self.get_response(self.req(url, cookies))
+            self.response = self.req(url, cookies)
+            resp = self.get_response(self.response)
+            if self.blocked(resp):
+                if not self.back_off():
+                    return self.subdomains
+                continue
+            self.pacer.passed()
             self.extract_domains(resp)
-            if 'Next Page' not in resp:
+            self.report()
+            if not resp or b'Next Page' not in resp:
                 return self.subdomains
                 break
             url = self.get_next(resp)
-            self.should_sleep()
 
-    def extract_domains(self, resp):
-        links_list = list()
-        link_regx = re.compile('<a class="results-table__host" href="(.*?)"')
-        try:
-            links_list = link_regx.findall(resp)
-            for link in links_list:
-                subdomain = urlparse.urlparse(link).netloc
-                if not subdomain.endswith(self.domain):
-                    continue
-                if subdomain and subdomain not in self.subdomains and subdomain != self.domain:
-                    if self.verbose:
-                        self.print_("%s%s: %s%s" % (R, self.engine_name, W, subdomain))
-                    self.subdomains.append(subdomain.strip())
-        except Exception:
-            pass
-        return links_list
 
 
 class DNSdumpster(enumratorBaseThreaded):
+    PARSER = HostExtractor([br'<td class="col-md-4">(.*?)<br>'],
+                           within=br'<a name="hostanchor"></a>Host Records.*?<table.*?>(.*?)</table>', flags=re.S)
+    csrf_regex = re.compile(br'<input type="hidden" name="csrfmiddlewaretoken" value="(.*?)">', re.S)
+
     def __init__(self, domain, subdomains=None, q=None, silent=False, verbose=True):
         subdomains = subdomains or []
         base_url = 'https://dnsdumpster.com/'
@@ -611,8 +1156,8 @@ class DNSdumpster(enumratorBaseThreaded):
         Resolver.nameservers = ['8.8.8.8', '8.8.4.4']
         self.lock.acquire()
         try:
-            ip = Resolver.query(host, 'A')[0].to_text()
-            if ip:
+            addresses = subbrute.cached_query(Resolver, self.dns_cache, host, 'A')
+            if addresses:
                 if self.verbose:
                     self.print_("%s%s: %s%s" % (R, self.engine_name, W, host))
                 is_valid = True
@@ -626,6 +1171,7 @@ class DNSdumpster(enumratorBaseThreaded):
         params = params or {}
         headers = dict(self.headers)
         headers['Referer'] = 'https://dnsdumpster.com'
+        self.pacer.acquire()
         try:
             if req_method == 'GET':
                 resp = self.session.get(url, headers=headers, timeout=self.timeout)
@@ -637,9 +1183,8 @@ class DNSdumpster(enumratorBaseThreaded):
         return self.get_response(resp)
 
     def get_csrftoken(self, resp):
-        csrf_regex = re.compile('<input type="hidden" name="csrfmiddlewaretoken" value="(.*?)">', re.S)
-        token = csrf_regex.findall(resp)[0]
-        return token.strip()
+        token = self.csrf_regex.findall(resp)[0]
+        return token.strip().decode('utf-8')
 
     def enumerate(self):
         self.lock = threading.BoundedSemaphore(value=70)
@@ -652,24 +1197,17 @@ class DNSdumpster(enumratorBaseThreaded):
             t = threading.Thread(target=self.check_host, args=(subdomain,))
             t.start()
             t.join()
+            self.report(self.live_subdomains)
+        if self.dns_cache is not None:
+            self.dns_cache.flush()
         return self.live_subdomains
 
     def extract_domains(self, resp):
-        tbl_regex = re.compile('<a name="hostanchor"><\/a>Host Records.*?<table.*?>(.*?)</table>', re.S)
-        link_regex = re.compile('<td class="col-md-4">(.*?)<br>', re.S)
-        links = []
-        try:
-            results_tbl = tbl_regex.findall(resp)[0]
-        except IndexError:
-            results_tbl = ''
-        links_list = link_regex.findall(results_tbl)
-        links = list(set(links_list))
-        for link in links:
-            subdomain = link.strip()
-            if not subdomain.endswith(self.domain):
-                continue
-            if subdomain and subdomain not in self.subdomains and subdomain != self.domain:
-                self.subdomains.append(subdomain.strip())
+        # the hosts are printed once check_host finds them alive
+        links = self.PARSER.extract(resp, self.domain)
+        for subdomain in links:
+            if subdomain not in self.subdomains and subdomain != self.domain:
+                self.subdomains.append(subdomain)
         return links
 
 
@@ -685,27 +1223,42 @@ class Virustotal(enumratorBaseThreaded):
 
     # the main send_req need to be rewritten
     def send_req(self, url):
+        self.response = None
+        cached = self.get_cached(url)
+        if cached is not None:
+            return cached
+        self.pacer.acquire()
         try:
             resp = self.session.get(url, headers=self.headers, timeout=self.timeout)
         except Exception as e:
             self.print_(e)
             resp = None
 
+        self.response = resp
+        self.put_cached(url, resp)
         return self.get_response(resp)
 
     # once the send_req is rewritten we don't need to call this function, the stock one should be ok
     def enumerate(self):
         while self.url != '':
             resp = self.send_req(self.url)
+            if self.pacer.throttled(self.response):
+                if self.back_off():
+                    continue
+                break
             resp = json.loads(resp)
             if 'error' in resp:
-                self.print_(R + "[!] Error: Virustotal probably now is blocking our requests" + W)
+                # the quota errors come back as a 200, wait for the next window
+                if self.back_off():
+                    continue
                 break
+            self.pacer.passed()
             if 'links' in resp and 'next' in resp['links']:
                 self.url = resp['links']['next']
             else:
                 self.url = ''
             self.extract_domains(resp)
+            self.report()
         return self.subdomains
 
     def extract_domains(self, resp):
@@ -734,11 +1287,15 @@ class ThreatCrowd(enumratorBaseThreaded):
         return
 
     def req(self, url):
+        cached = self.get_cached(url)
+        if cached is not None:
+            return cached
         try:
             resp = self.session.get(url, headers=self.headers, timeout=self.timeout)
         except Exception:
             resp = None
 
+        self.put_cached(url, resp)
         return self.get_response(resp)
 
     def enumerate(self):
@@ -763,20 +1320,29 @@ class ThreatCrowd(enumratorBaseThreaded):
 
 
 class CrtSearch(enumratorBaseThreaded):
+    # a certificate lists all of its names in one cell, wildcards don't validate
+    PARSER = HostExtractor([br'<TD>(.*?)</TD>'], split=b'<BR>')
+
     def __init__(self, domain, subdomains=None, q=None, silent=False, verbose=True):
         subdomains = subdomains or []
         base_url = 'https://crt.sh/?q=%25.{domain}'
         self.engine_name = "SSL Certificates"
+        # new certificates show up all the time
+        self.CACHE_TTL = 6 * 60 * 60
         self.q = q
         super(CrtSearch, self).__init__(base_url, self.engine_name, domain, subdomains, q=q, silent=silent, verbose=verbose)
         return
 
     def req(self, url):
+        cached = self.get_cached(url)
+        if cached is not None:
+            return cached
         try:
             resp = self.session.get(url, headers=self.headers, timeout=self.timeout)
         except Exception:
             resp = None
 
+        self.put_cached(url, resp)
         return self.get_response(resp)
 
     def enumerate(self):
@@ -786,32 +1352,6 @@ class CrtSearch(enumratorBaseThreaded):
             self.extract_domains(resp)
         return self.subdomains
 
-    def extract_domains(self, resp):
-        link_regx = re.compile('<TD>(.*?)</TD>')
-        try:
-            links = link_regx.findall(resp)
-            for link in links:
-                link = link.strip()
-                subdomains = []
-                if '<BR>' in link:
-                    subdomains = link.split('<BR>')
-                else:
-                    subdomains.append(link)
-
-                for subdomain in subdomains:
-                    if not subdomain.endswith(self.domain) or '*' in subdomain:
-                        continue
-
-                    if '@' in subdomain:
-                        subdomain = subdomain[subdomain.find('@')+1:]
-
-                    if subdomain not in self.subdomains and subdomain != self.domain:
-                        if self.verbose:
-                            self.print_("%s%s: %s%s" % (R, self.engine_name, W, subdomain))
-                        self.subdomains.append(subdomain.strip())
-        except Exception as e:
-            print(e)
-            pass
 
 class PassiveDNS(enumratorBaseThreaded):
     def __init__(self, domain, subdomains=None, q=None, silent=False, verbose=True):
@@ -823,11 +1363,15 @@ class PassiveDNS(enumratorBaseThreaded):
         return
 
     def req(self, url):
+        cached = self.get_cached(url)
+        if cached is not None:
+            return cached
         try:
             resp = self.session.get(url, headers=self.headers, timeout=self.timeout)
         except Exception as e:
             resp = None
 
+        self.put_cached(url, resp)
         return self.get_response(resp)
 
     def enumerate(self):
@@ -852,50 +1396,450 @@ class PassiveDNS(enumratorBaseThreaded):
 
 
 class portscan():
-    def __init__(self, subdomains, ports):
+    """Non-blocking TCP connect scan of every subdomain against the given ports
+
+    All the ports of a host are connected in parallel, with at most
+    max_inflight connects open at a time over all the hosts. A connect that
+    doesn't complete within timeout seconds is reported as filtered.
+    """
+    def __init__(self, subdomains, ports, max_inflight=256, timeout=2, silent=False):
         self.subdomains = subdomains
-        self.ports = ports
-        self.lock = None
+        self.ports = [int(port) for port in ports]
+        self.max_inflight = max_inflight
+        self.timeout = timeout
+        self.silent = silent
 
-    def port_scan(self, host, ports):
-        openports = []
-        self.lock.acquire()
-        for port in ports:
-            try:
-                s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                s.settimeout(2)
-                result = s.connect_ex((host, int(port)))
-                if result == 0:
-                    openports.append(port)
+    def resolve(self, host):
+        try:
+            return host, socket.gethostbyname(host)
+        except (socket.error, UnicodeError):
+            return host, None
+
+    def connect(self, address, port):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.setblocking(0)
+        return s, s.connect_ex((address, port))
+
+    def state(self, error):
+        if error == 0:
+            return 'open'
+        if error == errno.ECONNREFUSED:
+            return 'closed'
+        return 'filtered'
+
+    def scan(self):
+        """Yield (host, port, state, latency) for every host and port as the connects finish
+
+        state is 'open', 'closed', 'filtered' or 'error' when the host doesn't
+        resolve, latency is the connect time in seconds or None.
+        """
+        in_progress = (errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY, getattr(errno, 'WSAEWOULDBLOCK', -1))
+        # the hosts are resolved a few at a time in the background
+        pool = ThreadPool(20)
+        hosts = pool.imap(self.resolve, self.subdomains)
+        queued = deque()
+        inflight = {}
+        try:
+            while hosts is not None or queued or inflight:
+                while len(inflight) < self.max_inflight and (hosts is not None or queued):
+                    if not queued:
+                        try:
+                            # don't hold up the open connects for a slow lookup
+                            host, address = hosts.next(timeout=0 if inflight else None)
+                        except StopIteration:
+                            hosts = None
+                            break
+                        except multiprocessing.TimeoutError:
+                            break
+                        if address is None:
+                            for port in self.ports:
+                                yield host, port, 'error', None
+                        else:
+                            queued.extend((host, address, port) for port in self.ports)
+                        continue
+                    host, address, port = queued.popleft()
+                    start = time.time()
+                    s, error = self.connect(address, port)
+                    if error in in_progress:
+                        inflight[s] = (host, port, start)
+                    else:
+                        s.close()
+                        yield host, port, self.state(error), time.time() - start
+                if not inflight:
+                    continue
+                now = time.time()
+                wait = max(0, min(start + self.timeout for host, port, start in inflight.values()) - now)
+                if hosts is not None and not queued:
+                    wait = min(wait, 0.05)
+                socks = list(inflight)
+                _, writable, failed = select.select([], socks, socks, wait)
+                now = time.time()
+                for s in set(writable) | set(failed):
+                    host, port, start = inflight.pop(s)
+                    error = s.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                    s.close()
+                    yield host, port, self.state(error), now - start
+                for s in [s for s, (host, port, start) in inflight.items() if now - start >= self.timeout]:
+                    host, port, start = inflight.pop(s)
+                    s.close()
+                    yield host, port, 'filtered', None
+        finally:
+            for s in inflight:
                 s.close()
-            except Exception:
-                pass
-        self.lock.release()
-        if len(openports) > 0:
-            print("%s%s%s - %sFound open ports:%s %s%s%s" % (G, host, W, R, W, Y, ', '.join(openports), W))
+            pool.terminate()
 
     def run(self):
-        self.lock = threading.BoundedSemaphore(value=20)
-        for subdomain in self.subdomains:
-            t = threading.Thread(target=self.port_scan, args=(subdomain, self.ports))
-            t.start()
+        results = []
+        openports = {}
+        for host, port, state, latency in self.scan():
+            results.append((host, port, state, latency))
+            if state == 'open':
+                openports.setdefault(host, []).append(port)
+        if not self.silent:
+            for host in self.subdomains:
+                if host in openports:
+                    ports = ', '.join(str(port) for port in sorted(openports[host]))
+                    print("%s%s%s - %sFound open ports:%s %s%s%s" % (G, host, W, R, W, Y, ports, W))
+        return results
+
+
+supported_engines = {'baidu': BaiduEnum,
+                     'yahoo': YahooEnum,
+                     'google': GoogleEnum,
+                     'bing': BingEnum,
+                     'ask': AskEnum,
+                     'netcraft': NetcraftEnum,
+                     'dnsdumpster': DNSdumpster,
+                     'virustotal': Virustotal,
+                     'threatcrowd': ThreatCrowd,
+                     'ssl': CrtSearch,
+                     'passivedns': PassiveDNS
+                     }
+
+default_engines = [
+    BaiduEnum, YahooEnum, GoogleEnum, BingEnum, AskEnum,
+    NetcraftEnum, DNSdumpster, Virustotal, ThreatCrowd,
+    CrtSearch, PassiveDNS
+]
+
+domain_check = re.compile("^(http|https)?[a-zA-Z0-9]+([\-\.]{1}[a-zA-Z0-9]+)*\.[a-zA-Z]{2,}$")
+
+
+def choose_engines(engines=None):
+    # engines is either a comma-separated string or a list of engine names
+    if engines is None:
+        return list(default_engines)
+    if not isinstance(engines, (list, tuple)):
+        engines = engines.split(',')
+    chosenEnums = []
+    for engine in engines:
+        if engine.lower() in supported_engines:
+            chosenEnums.append(supported_engines[engine.lower()])
+    return chosenEnums
+
+
+def engine_session(size):
+    """A requests.Session with a connection pool for size engines"""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=size, pool_maxsize=size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def run_engines_threaded(enums, session=None):
+    """Run every engine in a thread of the current process
+
+    The engines spend their time waiting on requests, so threads are enough
+    to overlap them, and all of them share a single requests.Session and its
+    connection pool. The run is over as soon as the slowest engine is. A
+    session passed in is left open for the next run.
+    """
+    shared = session is not None
+    if not shared:
+        session = engine_session(len(enums))
+    errors = {}
+
+    def run(enum):
+        try:
+            enum.run()
+        except Exception as e:
+            errors[enum] = e
+
+    threads = []
+    for enum in enums:
+        enum.session = session
+        thread = threading.Thread(target=run, args=(enum,))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    try:
+        for thread in threads:
+            thread.join()
+    finally:
+        if not shared:
+            session.close()
+
+    for enum in enums:
+        if enum in errors:
+            # a broken engine shouldn't take the others down with it
+            enum.print_(R + "[!] Error: %s failed: %s" % (enum.engine_name, errors[enum]) + W)
+
+
+def iter_engines(enums, engine_mode='process', session=None):
+    """Run the engines and yield the (engine_name, subdomains) batches as they report them
+
+    session is a requests.Session for the thread mode to share between runs.
+    """
+    if not enums:
+        return
+    if engine_mode == 'thread':
+        results_queue = Queue.Queue()
+        for enum in enums:
+            enum.q = results_queue
+        runner = threading.Thread(target=run_engines_threaded, args=(enums, session))
+        runner.daemon = True
+        runner.start()
+        workers = [runner]
+    else:
+        # every engine is a separate process that reports over one queue
+        if is_windows:
+            results_queue = Queue.Queue()
+        else:
+            results_queue = multiprocessing.Queue()
+        for enum in enums:
+            enum.q = results_queue
+            enum.start()
+        workers = enums
+
+    # drain before joining, a process can't exit while its queue is unflushed
+    pending = len(enums)
+    while pending:
+        try:
+            engine_name, batch = results_queue.get(timeout=1)
+        except Queue.Empty:
+            # an engine killed before it could report would block us forever
+            if not any(worker.is_alive() for worker in workers) and results_queue.empty():
+                break
+            continue
+        if batch is None:
+            pending -= 1
+        else:
+            yield engine_name, batch
+    for worker in workers:
+        worker.join()
+
+
+def run_engines(enums, engine_mode='process'):
+    subdomains = SubdomainTrie()
+    for engine_name, batch in iter_engines(enums, engine_mode):
+        for subdomain in batch:
+            subdomains.add(subdomain)
+    return subdomains
+
+
+def iter_subdomains(domain, engines=None, bruteforce=False, threads=30, silent=True, verbose=False,
+                    engine_mode='process', cache_dir=None, cache_size=100, checkpoint=None, bruteforce_engine='process',
+                    seen=None):
+    """Yield (subdomain, source) for every new unique subdomain as soon as it is found
+
+    source is the name of the engine that found the subdomain first, or
+    'subbrute' for the names found by the bruteforce module. engines takes
+    the same comma-separated names as the -e option, None runs all of them.
+    checkpoint is a state file for the bruteforce, an interrupted run given
+    the same file resumes where it stopped. bruteforce_engine is 'process'
+    for subbrute's lookup processes or 'async' for its DNS event loop.
+    cache_dir keeps the engines' responses, the DNS answers for their TTL,
+    subbrute's resolver scores and the wildcards of the target. seen is the SubdomainTrie the results are
+    deduplicated against, pass one in to get them sorted once the run is over.
+    """
+    target = target_name(domain)
+    for target, subdomain, source, addresses in iter_targets([domain], engines, bruteforce, threads, silent, verbose,
+                                                             engine_mode, cache_dir, cache_size, {target: checkpoint},
+                                                             bruteforce_engine, {target: seen if seen is not None else SubdomainTrie()}):
+        yield subdomain, source
+
+
+def target_name(domain):
+    if not domain_check.match(domain):
+        raise ValueError("invalid domain: %s" % domain)
+    return urlparse.urlparse('http://' + domain).netloc.lower()
+
+
+def iter_targets(domains, engines=None, bruteforce=False, threads=30, silent=True, verbose=False,
+                 engine_mode='process', cache_dir=None, cache_size=100, checkpoints=None, bruteforce_engine='process',
+                 seen=None, verified=None, alterations=0, dns_metrics=None, recursive=0, all_sources=False):
+    """Yield (target, subdomain, source, addresses) for every new unique subdomain of every domain
+
+    All the domains go through one process tree. The engines enumerate one
+    target after the other and in the thread mode they keep one connection
+    pool for all of them, then a single subbrute run bruteforces every target
+    with the same qualified resolvers and lookup processes, taking turns so
+    that the DNS pipeline stays full. addresses are the A records that the
+    bruteforce resolved, empty for the engines' results. checkpoints maps a
+    target to its bruteforce state file and seen to its SubdomainTrie.
+    verified maps a target to {subdomain: addresses} of the names that were
+    resolved recently, they come with the 'history' source. The bruteforce
+    doesn't query them again, nor the names that the engines found, use
+    resolve_subdomains() to resolve those. alterations is the number of
+    candidates the bruteforce may try ahead of the wordlist, made out of the
+    subdomains found so far: numeric neighbours, environment words such as
+    dev and prod around their first label and swapped for the ones in them.
+    dns_metrics is a file for the JSON report of the bruteforce queries, per
+    resolver. recursive is the number of levels below the subdomains that
+    the bruteforce found, or that were verified, to bruteforce in turn with
+    the same lookup processes, breadth first and with fewer words per level.
+    With all_sources, a subdomain is yielded again for every other engine
+    that reports it later, with the name of that engine. The other
+    arguments are the ones of iter_subdomains.
+    """
+    targets = []
+    for domain in domains:
+        target = target_name(domain)
+        if target not in targets:
+            targets.append(target)
+    if seen is None:
+        seen = {}
+    for target in targets:
+        seen.setdefault(target, SubdomainTrie())
+    # {target: {subdomain: engines}} of the names reported so far
+    sources = dict((target, {}) for target in targets)
+
+    cache = None
+    dns_cache = None
+    if cache_dir:
+        cache = ResponseCache(os.path.join(cache_dir, 'http'), cache_size * 1024 * 1024)
+        dns_cache = subbrute.answer_cache(os.path.join(cache_dir, 'dns.sqlite'))
+    session = None
+    if engine_mode == 'thread' and choose_engines(engines):
+        session = engine_session(len(choose_engines(engines)))
+    try:
+        for target in targets:
+            enums = [enum('http://' + target, [], silent=silent, verbose=verbose) for enum in choose_engines(engines)]
+            for enum in enums:
+                enum.cache = cache
+                enum.dns_cache = dns_cache
+            for engine_name, batch in iter_engines(enums, engine_mode, session):
+                for subdomain in batch:
+                    if seen[target].add(subdomain):
+                        if all_sources:
+                            sources[target][subdomain] = set([engine_name])
+                        yield target, subdomain, engine_name, []
+                    elif all_sources:
+                        reporters = sources[target].setdefault(subdomain, set())
+                        if engine_name not in reporters:
+                            reporters.add(engine_name)
+                            yield target, subdomain, engine_name, []
+    finally:
+        if session is not None:
+            session.close()
+        if dns_cache is not None:
+            dns_cache.close()
+
+    if bruteforce:
+        if not silent:
+            print(G + "[-] Starting bruteforce module now using subbrute.." + W)
+        record_type = False
+        path_to_file = os.path.dirname(os.path.realpath(__file__))
+        subs = os.path.join(path_to_file, 'subbrute', 'names.txt')
+        resolvers = os.path.join(path_to_file, 'subbrute', 'resolvers.txt')
+        known = []
+        for target in targets:
+            for hostname, addresses in (verified or {}).get(target, {}).items():
+                if seen[target].add(hostname):
+                    yield target, hostname, 'history', addresses
+            known.extend(seen[target])
+        altered = None
+        if alterations:
+            altered = subbrute.alterations(targets, budget=alterations)
+            for hostname in known:
+                altered.add(hostname)
+        levels = None
+        if recursive:
+            levels = subbrute.recursion(targets, subs, recursive)
+            for target in targets:
+                for hostname in (verified or {}).get(target, {}):
+                    levels.add(hostname)
+        for target, hostname, record_type, response in subbrute.run_many(targets, record_type, subs, resolvers, threads, checkpoints,
+                                                                         engine=bruteforce_engine, cache_dir=cache_dir, known=known,
+                                                                         altered=altered, metrics=dns_metrics, recursive=levels):
+            if seen[target].add(hostname):
+                yield target, hostname, 'subbrute', response
+
+
+def resolve_subdomains(targets, subdomains, threads=30, cache_dir=None):
+    """{subdomain: (record_type, addresses)} of the subdomains that resolve
+
+    The subdomains are resolved in bulk for A, AAAA and CNAME records with
+    subbrute's qualified resolvers and wildcard filter, so a wildcard answer
+    doesn't make a name live. addresses are the A and AAAA records, or the
+    CNAME targets of a name that has no addresses, and record_type is the
+    type of the first of them.
+    """
+    path_to_file = os.path.dirname(os.path.realpath(__file__))
+    resolvers = os.path.join(path_to_file, 'subbrute', 'resolvers.txt')
+    answers = {}
+    for hostname, record_type, response in subbrute.resolve_many(subdomains, targets, ('A', 'AAAA', 'CNAME'), resolvers, threads,
+                                                                 cache_dir=cache_dir):
+        answers.setdefault(hostname, {})[record_type] = response
+    live = {}
+    for hostname, records in answers.items():
+        addresses = records.get('A', []) + records.get('AAAA', [])
+        if addresses:
+            live[hostname] = ('A' if 'A' in records else 'AAAA', addresses)
+        else:
+            live[hostname] = ('CNAME', records['CNAME'])
+    return live
+
 
+def apply_resolved(records, resolved):
+    """Give the records that have no addresses the ones of resolved, {subdomain: (record_type, addresses)}
+
+    resolved is what the scan history resolved recently, resolve_records()
+    doesn't resolve the records updated here again. Returns them.
+    """
+    updated = []
+    for subdomain, (record_type, addresses) in resolved.items():
+        record = records.get(subdomain)
+        if record is not None and addresses and not record['addresses']:
+            record['record_type'], record['addresses'] = record_type, list(addresses)
+            updated.append(record)
+    return updated
 
-def main(domain, threads, savefile, ports, silent, verbose, enable_bruteforce, engines):
-    bruteforce_list = set()
-    search_list = set()
 
-    if is_windows:
-        subdomains_queue = list()
+def resolve_records(records, threads=30, cache_dir=None):
+    """Resolve the records that have no addresses yet, {target: {subdomain: record}}
+
+    All the targets are resolved in one go and the records that resolved
+    are updated in place, returns them as (target, record).
+    """
+    unresolved = set()
+    for target, target_records in records.items():
+        unresolved.update(subdomain for subdomain, record in target_records.items() if not record['addresses'])
+    live = resolve_subdomains(list(records), sorted(unresolved), threads, cache_dir)
+    resolved = []
+    for target, target_records in records.items():
+        for subdomain, record in target_records.items():
+            if subdomain in live and not record['addresses']:
+                record['record_type'], record['addresses'] = live[subdomain]
+                resolved.append((target, record))
+    return resolved
+
+
+def print_subdomain(subdomain, source, verbose):
+    if verbose:
+        print("%s%s: %s%s" % (R, source, W, subdomain))
     else:
-        subdomains_queue = multiprocessing.Manager().list()
+        print(G + subdomain + W)
 
+
+def main(domain, threads, savefile, ports, silent, verbose, enable_bruteforce, engines, engine_mode='process', cache_dir=None, cache_size=100, bruteforce_engine='process', ports_output=None, output_format='text',
+         history=None, since=None, new_only=False, fresh=0, resolve=False, alterations=0, dns_metrics=None, recursive=0):
     # Check Bruteforce Status
     if enable_bruteforce or enable_bruteforce is None:
         enable_bruteforce = True
 
     # Validate domain
-    domain_check = re.compile("^(http|https)?[a-zA-Z0-9]+([\-\.]{1}[a-zA-Z0-9]+)*\.[a-zA-Z]{2,}$")
     if not domain_check.match(domain):
         if not silent:
             print(R + "Error: Please enter a valid domain" + W)
@@ -912,95 +1856,276 @@ def main(domain, threads, savefile, ports, silent, verbose, enable_bruteforce, e
     if verbose and not silent:
         print(Y + "[-] verbosity is enabled, will show the subdomains results in realtime" + W)
 
-    supported_engines = {'baidu': BaiduEnum,
-                         'yahoo': YahooEnum,
-                         'google': GoogleEnum,
-                         'bing': BingEnum,
-                         'ask': AskEnum,
-                         'netcraft': NetcraftEnum,
-                         'dnsdumpster': DNSdumpster,
-                         'virustotal': Virustotal,
-                         'threatcrowd': ThreatCrowd,
-                         'ssl': CrtSearch,
-                         'passivedns': PassiveDNS
-                         }
-
-    chosenEnums = []
-
-    if engines is None:
-        chosenEnums = [
-            BaiduEnum, YahooEnum, GoogleEnum, BingEnum, AskEnum,
-            NetcraftEnum, DNSdumpster, Virustotal, ThreatCrowd,
-            CrtSearch, PassiveDNS
-        ]
-    else:
-        engines = engines.split(',')
-        for engine in engines:
-            if engine.lower() in supported_engines:
-                chosenEnums.append(supported_engines[engine.lower()])
-
-    # Start the engines enumeration
-    enums = [enum(domain, [], q=subdomains_queue, silent=silent, verbose=verbose) for enum in chosenEnums]
-    for enum in enums:
-        enum.start()
-    for enum in enums:
-        enum.join()
+    # the results are printed and saved as they stream in, the console shows
+    # the engine next to every subdomain in verbose mode
+    show = not silent and (verbose or not ports)
+    target = target_name(parsed_domain.netloc)
+    found = SubdomainTrie()
+    writer = None
+    if savefile and output_format in record_writers:
+        print("%s[-] Saving results to file: %s%s%s%s" % (Y, W, R, savefile, W))
+        writer = record_writers[output_format](savefile)
+    # kept for the engines that report a subdomain later, the resolution and the port scan records
+    records = {}
+    scan_history = None
+    known = {}
+    verified = {}
+    fresh_records = {}
+    if history:
+        scan_history = ScanHistory(history)
+        run = scan_history.start(target)
+        known = scan_history.first_seen(target)
+        if fresh:
+            fresh_records = scan_history.resolved(target, fresh * 3600)
+            verified = dict((subdomain, addresses) for subdomain, (record_type, addresses) in fresh_records.items())
+    if new_only:
+        since = time.time()
 
-    subdomains = set(subdomains_queue)
-    for subdomain in subdomains:
-        search_list.add(subdomain)
+    try:
+        for target, subdomain, source, addresses in iter_targets([target], engines, enable_bruteforce, threads,
+                                                                 silent=silent, verbose=False, engine_mode=engine_mode,
+                                                                 cache_dir=cache_dir, cache_size=cache_size,
+                                                                 bruteforce_engine=bruteforce_engine, seen={target: found},
+                                                                 verified={target: verified}, alterations=alterations,
+                                                                 dns_metrics=dns_metrics, recursive=recursive, all_sources=True):
+            record = records.get(subdomain)
+            if record is not None:
+                # another engine reported it, the last record of a subdomain has all of them
+                if source not in record['sources']:
+                    record['sources'].append(source)
+                    if scan_history is not None:
+                        scan_history.add(target, subdomain, source)
+                    if writer is not None and (since is None or known.get(subdomain, since) >= since):
+                        writer.write(record)
+                continue
+            if scan_history is not None:
+                scan_history.add(target, subdomain, source, addresses, 'A' if addresses else None)
+            record = new_record(subdomain, source, addresses, 'A' if addresses else None, known.get(subdomain))
+            records[subdomain] = record
+            # only the delta is reported with --since and --new-only
+            if since is not None and known.get(subdomain, since) < since:
+                continue
+            if show:
+                print_subdomain(subdomain, source, verbose)
+            if writer is not None:
+                writer.write(record)
+        if resolve and records:
+            if not silent:
+                print(G + "[-] Resolving the subdomains found by the engines" + W)
+            # the ones resolved within --fresh hours are taken from the history
+            for record in apply_resolved(records, fresh_records):
+                if writer is not None and (since is None or known.get(record['subdomain'], since) >= since):
+                    writer.write(record)
+            resolved = resolve_records({target: records}, threads, cache_dir)
+            for target, record in resolved:
+                if scan_history is not None:
+                    scan_history.add(target, record['subdomain'], record['sources'][0], record['addresses'], record['record_type'])
+                if writer is not None and (since is None or known.get(record['subdomain'], since) >= since):
+                    writer.write(record)
+            if not silent:
+                print(Y + "[-] Live Subdomains: %s of %s" % (sum(1 for record in records.values() if record['addresses']), len(records)) + W)
+        if scan_history is not None:
+            scan_history.finish(run)
+        if since is not None:
+            found = SubdomainTrie(subdomain for subdomain in found if known.get(subdomain, since) >= since)
+        if savefile and output_format == 'tree':
+            write_tree(savefile, found.tree(target))
 
-    if enable_bruteforce:
-        if not silent:
-            print(G + "[-] Starting bruteforce module now using subbrute.." + W)
-        record_type = False
-        path_to_file = os.path.dirname(os.path.realpath(__file__))
-        subs = os.path.join(path_to_file, 'subbrute', 'names.txt')
-        resolvers = os.path.join(path_to_file, 'subbrute', 'resolvers.txt')
-        process_count = threads
-        output = False
-        json_output = False
-        bruteforce_list = subbrute.print_target(parsed_domain.netloc, record_type, subs, resolvers, process_count, output, json_output, search_list, verbose)
+        subdomains = list(found)
+        if subdomains:
 
-    subdomains = search_list.union(bruteforce_list)
+            if not silent:
+                if since is not None:
+                    print(Y + "[-] Total New Subdomains Found since %s: %s" % (iso_time(since), len(subdomains)) + W)
+                else:
+                    print(Y + "[-] Total Unique Subdomains Found: %s" % len(subdomains) + W)
+
+            if ports:
+                if not silent:
+                    print(G + "[-] Start port scan now for the following ports: %s%s" % (Y, ports) + W)
+                ports = ports.split(',')
+                pscan = portscan(subdomains, ports, silent=silent)
+                results = pscan.run()
+                if writer is not None:
+                    write_port_records(writer, records, subdomains, results)
+                if ports_output:
+                    write_file(ports_output, ("%s,%d,%s,%s" % (host, port, state, '' if latency is None else '%.1f' % (latency * 1000))
+                                              for host, port, state, latency in results))
+    finally:
+        if writer is not None:
+            writer.close()
+        if scan_history is not None:
+            scan_history.close()
+    return subdomains
 
-    if subdomains:
-        subdomains = sorted(subdomains, key=subdomain_sorting_key)
 
-        if savefile:
-            write_file(savefile, subdomains)
+def main_batch(domains, threads, output_dir, ports, silent, verbose, enable_bruteforce, engines, engine_mode='thread', cache_dir=None, cache_size=100, bruteforce_engine='process', ports_output=None, output_format='text',
+               history=None, since=None, new_only=False, fresh=0, resolve=False, alterations=0, dns_metrics=None, recursive=0):
+    """main() for many domains in one run, returns {domain: sorted subdomains}
 
-        if not silent:
-            print(Y + "[-] Total Unique Subdomains Found: %s" % len(subdomains) + W)
+    The subdomains of each domain are saved to <output_dir>/<domain>.txt (or
+    .jsonl, .csv or .json after the output format) and its port scan to
+    <ports_output>/<domain>.txt.
+    """
+    if enable_bruteforce or enable_bruteforce is None:
+        enable_bruteforce = True
 
-        if ports:
+    targets = []
+    for domain in domains:
+        domain = domain.strip()
+        if not domain:
+            continue
+        if not domain_check.match(domain):
             if not silent:
-                print(G + "[-] Start port scan now for the following ports: %s%s" % (Y, ports) + W)
-            ports = ports.split(',')
-            pscan = portscan(subdomains, ports)
-            pscan.run()
+                print(R + "Error: Skipping invalid domain %s" % domain + W)
+            continue
+        targets.append(domain)
+    for directory in (output_dir, ports_output):
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
 
-        elif not silent:
-            for subdomain in subdomains:
-                print(G + subdomain + W)
-    return subdomains
+    if not silent:
+        print(B + "[-] Enumerating subdomains now for %d domains" % len(targets) + W)
+
+    show = not silent and (verbose or not ports)
+    found = {}
+    writers = {}
+    records = {}
+    scan_history = None
+    runs = {}
+    known = {}
+    verified = {}
+    fresh_records = {}
+    if history:
+        scan_history = ScanHistory(history)
+        for target in set(target_name(domain) for domain in targets):
+            runs[target] = scan_history.start(target)
+            known[target] = scan_history.first_seen(target)
+            if fresh:
+                fresh_records[target] = scan_history.resolved(target, fresh * 3600)
+                verified[target] = dict((subdomain, addresses) for subdomain, (record_type, addresses) in fresh_records[target].items())
+    if new_only:
+        since = time.time()
+    try:
+        for target, subdomain, source, addresses in iter_targets(targets, engines, enable_bruteforce, threads, silent=silent, verbose=False,
+                                                                 engine_mode=engine_mode, cache_dir=cache_dir, cache_size=cache_size,
+                                                                 bruteforce_engine=bruteforce_engine, seen=found, verified=verified,
+                                                                 alterations=alterations, dns_metrics=dns_metrics, recursive=recursive,
+                                                                 all_sources=True):
+            first_seen = known.get(target, {}).get(subdomain)
+            record = records.get(target, {}).get(subdomain)
+            if record is not None:
+                # another engine reported it, the last record of a subdomain has all of them
+                if source not in record['sources']:
+                    record['sources'].append(source)
+                    if scan_history is not None:
+                        scan_history.add(target, subdomain, source)
+                    if target in writers and (since is None or first_seen is None or first_seen >= since):
+                        writers[target].write(record)
+                continue
+            if scan_history is not None:
+                scan_history.add(target, subdomain, source, addresses, 'A' if addresses else None)
+            record = new_record(subdomain, source, addresses, 'A' if addresses else None, first_seen)
+            records.setdefault(target, {})[subdomain] = record
+            if since is not None and first_seen is not None and first_seen < since:
+                continue
+            if show:
+                print_subdomain(subdomain, source, verbose)
+            if output_dir and output_format in record_writers:
+                if target not in writers:
+                    writer = record_writers[output_format]
+                    writers[target] = writer(os.path.join(output_dir, target + writer.extension))
+                writers[target].write(record)
+
+        if resolve and records:
+            if not silent:
+                print(G + "[-] Resolving the subdomains found by the engines" + W)
+            # the ones resolved within --fresh hours are taken from the history
+            for target, target_records in records.items():
+                for record in apply_resolved(target_records, fresh_records.get(target, {})):
+                    first_seen = known.get(target, {}).get(record['subdomain'])
+                    if target in writers and (since is None or first_seen is None or first_seen >= since):
+                        writers[target].write(record)
+            for target, record in resolve_records(records, threads, cache_dir):
+                if scan_history is not None:
+                    scan_history.add(target, record['subdomain'], record['sources'][0], record['addresses'], record['record_type'])
+                first_seen = known.get(target, {}).get(record['subdomain'])
+                if target in writers and (since is None or first_seen is None or first_seen >= since):
+                    writers[target].write(record)
+        for target, run in runs.items():
+            scan_history.finish(run)
+        results = {}
+        for target, subdomains in found.items():
+            if since is not None:
+                first_seen = known.get(target, {})
+                subdomains = SubdomainTrie(subdomain for subdomain in subdomains if first_seen.get(subdomain, since) >= since)
+            if output_dir and output_format == 'tree':
+                write_tree(os.path.join(output_dir, target + '.json'), subdomains.tree(target))
+            results[target] = list(subdomains)
+            if not silent:
+                if since is not None:
+                    print(Y + "[-] Total New Subdomains Found for %s since %s: %s" % (target, iso_time(since), len(subdomains)) + W)
+                else:
+                    print(Y + "[-] Total Unique Subdomains Found for %s: %s" % (target, len(subdomains)) + W)
+            if ports and results[target]:
+                if not silent:
+                    print(G + "[-] Start port scan now for %s on the following ports: %s%s" % (target, Y, ports) + W)
+                scan = portscan(results[target], ports.split(','), silent=silent).run()
+                if target in writers:
+                    write_port_records(writers[target], records.get(target, {}), results[target], scan)
+                if ports_output:
+                    write_file(os.path.join(ports_output, target + '.txt'),
+                               ("%s,%d,%s,%s" % (host, port, state, '' if latency is None else '%.1f' % (latency * 1000))
+                                for host, port, state, latency in scan))
+    finally:
+        for writer in writers.values():
+            writer.close()
+        if scan_history is not None:
+            scan_history.close()
+    return results
 
 
 def interactive():
     args = parse_args()
     domain = args.domain
+    domain_list = args.domain_list
     threads = args.threads
     savefile = args.output
     ports = args.ports
     enable_bruteforce = args.bruteforce
     verbose = args.verbose
     engines = args.engines
+    engine_mode = args.engine_mode
+    cache_dir = args.cache_dir
+    cache_size = args.cache_size
+    bruteforce_engine = args.bruteforce_engine
+    ports_output = args.ports_output
+    output_format = args.output_format
+    history = args.history
+    fresh = args.fresh
+    since = None
+    if args.since:
+        try:
+            since = parse_since(args.since)
+        except ValueError:
+            parser_error("--since takes a UTC date or time like 2024-01-31 or 2024-01-31T08:00, or an age like 12h or 7d")
+    if (since is not None or args.new_only or fresh) and not history:
+        parser_error("--since, --new-only and --fresh require --history")
     if verbose or verbose is None:
         verbose = True
     if args.no_color:
         no_color()
     banner()
-    res = main(domain, threads, savefile, ports, silent=False, verbose=verbose, enable_bruteforce=enable_bruteforce, engines=engines)
+    if domain_list:
+        with open(domain_list) as f:
+            domains = f.read().split()
+        res = main_batch(domains, threads, savefile, ports, silent=False, verbose=verbose, enable_bruteforce=enable_bruteforce, engines=engines, engine_mode=engine_mode or 'thread', cache_dir=cache_dir, cache_size=cache_size, bruteforce_engine=bruteforce_engine, ports_output=ports_output, output_format=output_format,
+                         history=history, since=since, new_only=args.new_only, fresh=fresh, resolve=args.resolve,
+                         alterations=args.alterations, dns_metrics=args.dns_metrics, recursive=args.recursive)
+        return
+    res = main(domain, threads, savefile, ports, silent=False, verbose=verbose, enable_bruteforce=enable_bruteforce, engines=engines, engine_mode=engine_mode or 'process', cache_dir=cache_dir, cache_size=cache_size, bruteforce_engine=bruteforce_engine, ports_output=ports_output, output_format=output_format,
+               history=history, since=since, new_only=args.new_only, fresh=fresh, resolve=args.resolve,
+               alterations=args.alterations, dns_metrics=args.dns_metrics, recursive=args.recursive)
 
 if __name__ == "__main__":
     interactive()
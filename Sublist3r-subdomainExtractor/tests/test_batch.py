@@ -0,0 +1,147 @@
+# coding: utf-8
+# Many domains through one run, with stub engines instead of the search engines.
+#
+#   python -m unittest discover tests
+
+import os
+import sys
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import sublist3r
+
+
+class stubEnum(sublist3r.enumratorBaseThreaded):
+    # {domain: subdomains} that the engine reports
+    NAMES = {}
+
+    def __init__(self, domain, subdomains=None, q=None, silent=False, verbose=True):
+        super(stubEnum, self).__init__('', self.ENGINE_NAME, domain, subdomains, q=q, silent=silent, verbose=verbose)
+
+    def print_banner(self):
+        return
+
+    def enumerate(self):
+        self.subdomains = list(self.NAMES.get(self.domain, []))
+        return self.subdomains
+
+
+class stubOne(stubEnum):
+    ENGINE_NAME = 'StubOne'
+    NAMES = {'example.com': ['www.example.com', 'mail.example.com'],
+             'example.org': ['www.example.org']}
+
+
+class stubTwo(stubEnum):
+    ENGINE_NAME = 'StubTwo'
+    NAMES = {'example.com': ['www.example.com', 'dev.example.com'],
+             'example.org': ['www.example.org', 'api.example.org']}
+
+
+class brokenEnum(stubEnum):
+    ENGINE_NAME = 'Broken'
+
+    def enumerate(self):
+        raise ValueError('no results page')
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.supported = dict(sublist3r.supported_engines)
+        sublist3r.supported_engines['stubone'] = stubOne
+        sublist3r.supported_engines['stubtwo'] = stubTwo
+        sublist3r.supported_engines['broken'] = brokenEnum
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        sublist3r.supported_engines.clear()
+        sublist3r.supported_engines.update(self.supported)
+        shutil.rmtree(self.workdir)
+
+    def main_batch(self, output_format, **kwargs):
+        output_dir = os.path.join(self.workdir, output_format)
+        results = sublist3r.main_batch(['example.com', ' example.org ', 'not a domain', ''], 30, output_dir, None, True, False, False,
+                                       'stubone,stubtwo', engine_mode='process', output_format=output_format, **kwargs)
+        self.assertEqual(dict((target, sorted(subdomains)) for target, subdomains in results.items()), {
+            'example.com': ['dev.example.com', 'mail.example.com', 'www.example.com'],
+            'example.org': ['api.example.org', 'www.example.org'],
+        })
+        return output_dir
+
+    def test_iter_targets_all_sources(self):
+        results = list(sublist3r.iter_targets(['example.com', 'example.org'], 'stubone,stubtwo', all_sources=True))
+        sources = {}
+        for target, subdomain, source, addresses in results:
+            self.assertEqual(addresses, [])
+            sources.setdefault((target, subdomain), []).append(source)
+        self.assertEqual(dict((key, sorted(value)) for key, value in sources.items()), {
+            ('example.com', 'www.example.com'): ['StubOne', 'StubTwo'],
+            ('example.com', 'mail.example.com'): ['StubOne'],
+            ('example.com', 'dev.example.com'): ['StubTwo'],
+            ('example.org', 'www.example.org'): ['StubOne', 'StubTwo'],
+            ('example.org', 'api.example.org'): ['StubTwo'],
+        })
+
+    def test_iter_targets_first_source(self):
+        results = list(sublist3r.iter_targets(['example.com', 'example.org'], 'stubone,stubtwo'))
+        self.assertEqual(sorted((target, subdomain) for target, subdomain, source, addresses in results), [
+            ('example.com', 'dev.example.com'), ('example.com', 'mail.example.com'), ('example.com', 'www.example.com'),
+            ('example.org', 'api.example.org'), ('example.org', 'www.example.org')])
+
+    def test_iter_targets_threads(self):
+        # the engines share one session across the targets, a broken one doesn't stop the others
+        results = list(sublist3r.iter_targets(['example.com', 'example.org'], 'stubone,broken,stubtwo', engine_mode='thread',
+                                              all_sources=True))
+        self.assertEqual(len(results), 7)
+        self.assertEqual(sorted(set((target, subdomain) for target, subdomain, source, addresses in results)), [
+            ('example.com', 'dev.example.com'), ('example.com', 'mail.example.com'), ('example.com', 'www.example.com'),
+            ('example.org', 'api.example.org'), ('example.org', 'www.example.org')])
+
+    def test_main_batch_text(self):
+        output_dir = self.main_batch('text')
+        self.assertEqual(sorted(os.listdir(output_dir)), ['example.com.txt', 'example.org.txt'])
+        with open(os.path.join(output_dir, 'example.org.txt')) as f:
+            # one line per subdomain, however many engines reported it
+            self.assertEqual(sorted(f.read().split()), ['api.example.org', 'www.example.org'])
+
+    def test_main_batch_jsonl_and_history(self):
+        history = os.path.join(self.workdir, 'history.sqlite')
+        output_dir = self.main_batch('jsonl', history=history)
+        sources = {}
+        with open(os.path.join(output_dir, 'example.com.jsonl')) as f:
+            for line in f:
+                record = json.loads(line)
+                # the last record of a subdomain is the complete one
+                sources[record['subdomain']] = sorted(record['sources'])
+        self.assertEqual(sources, {'www.example.com': ['StubOne', 'StubTwo'],
+                                   'mail.example.com': ['StubOne'],
+                                   'dev.example.com': ['StubTwo']})
+        db = sqlite3.connect(history)
+        try:
+            rows = db.execute('SELECT target, subdomain, source FROM sources ORDER BY target, subdomain, source').fetchall()
+            runs = db.execute('SELECT target FROM runs WHERE finished IS NOT NULL ORDER BY target').fetchall()
+        finally:
+            db.close()
+        self.assertEqual(rows, [('example.com', 'dev.example.com', 'StubTwo'),
+                                ('example.com', 'mail.example.com', 'StubOne'),
+                                ('example.com', 'www.example.com', 'StubOne'),
+                                ('example.com', 'www.example.com', 'StubTwo'),
+                                ('example.org', 'api.example.org', 'StubTwo'),
+                                ('example.org', 'www.example.org', 'StubOne'),
+                                ('example.org', 'www.example.org', 'StubTwo')])
+        self.assertEqual(runs, [('example.com',), ('example.org',)])
+
+        # nothing is new the second time
+        output_dir = os.path.join(self.workdir, 'again')
+        results = sublist3r.main_batch(['example.com', 'example.org'], 30, output_dir, None, True, False, False,
+                                       'stubone,stubtwo', engine_mode='process', output_format='jsonl', history=history, new_only=True)
+        self.assertEqual(results, {'example.com': [], 'example.org': []})
+
+
+if __name__ == '__main__':
+    unittest.main()
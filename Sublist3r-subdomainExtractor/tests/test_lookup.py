@@ -0,0 +1,148 @@
+# coding: utf-8
+# Both lookup engines of subbrute against the stub DNS server, offline.
+#
+#   python -m unittest discover tests
+
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import socket
+import tempfile
+import unittest
+import subprocess
+import multiprocessing
+
+try:
+    import queue as Queue
+except ImportError:
+    import Queue
+
+root = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, root)
+from subbrute import subbrute
+
+count = 300
+every = 10
+
+
+def free_ports(n):
+    socks = []
+    for i in range(n):
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.bind(('127.0.0.1', 0))
+        socks.append(s)
+    ports = [s.getsockname()[1] for s in socks]
+    for s in socks:
+        s.close()
+    return ports
+
+
+class LookupTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.mkdtemp()
+        cls.ports = free_ports(4)
+        cls.stub = subprocess.Popen([sys.executable, os.path.join(root, 'benchmarks', 'dns_stub.py'),
+                                     '--ports', ','.join(str(port) for port in cls.ports), '--every', str(every)])
+        cls.names = os.path.join(cls.workdir, 'names.txt')
+        with open(cls.names, 'w') as f:
+            for i in range(count):
+                f.write('n%d\n' % i)
+        cls.resolvers = os.path.join(cls.workdir, 'resolvers.txt')
+        with open(cls.resolvers, 'w') as f:
+            for port in cls.ports:
+                f.write('127.0.0.1#%d\n' % port)
+        time.sleep(0.5)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub.kill()
+        cls.stub.wait()
+        shutil.rmtree(cls.workdir)
+
+    def lookup(self, engine, process_count):
+        metrics = os.path.join(self.workdir, 'metrics-%s.json' % engine)
+        found = [hostname for (hostname, record_type, response) in
+                 subbrute.run('example.com', False, self.names, self.resolvers, process_count, engine = engine, metrics = metrics)]
+        self.assertEqual(sorted(found), sorted('n%d.example.com' % i for i in range(0, count, every)))
+        with open(metrics) as f:
+            report = json.load(f)
+        self.assertEqual(report['unresolved'], [])
+        # the resolvers are told apart by their port
+        self.assertTrue(report['resolvers'])
+        self.assertLessEqual(set(report['resolvers']), set('127.0.0.1#%d' % port for port in self.ports))
+
+    def test_process(self):
+        self.lookup('process', 2)
+
+    def test_more_processes_than_resolvers(self):
+        # the processes without a resolver wait for one instead of failing their names
+        self.lookup('process', 8)
+
+    def test_async(self):
+        self.lookup('async', 2)
+
+    def test_retry_goes_to_another_resolver(self):
+        dead = free_ports(1)[0]
+        live = self.ports[0]
+        handlers = dict((signum, signal.getsignal(signum)) for signum in (signal.SIGINT, signal.SIGTSTP, signal.SIGQUIT))
+        try:
+            out_q = Queue.Queue()
+            worker = subbrute.lookup(Queue.Queue(), out_q, Queue.Queue(), frozenset(['example.com']), subbrute.shared_set(64),
+                                     subbrute.shared_set(64), timeout = 0.2)
+        finally:
+            for (signum, handler) in handlers.items():
+                signal.signal(signum, handler)
+        # both on the same address,  the port tells them apart
+        worker.nameservers = ['127.0.0.1#%d' % dead, '127.0.0.1#%d' % live]
+        # the live resolver failed it before,  so the dead one is asked and nothing else
+        self.assertFalse(worker.check('n10.example.com', 'A', 0, 7, ['127.0.0.1#%d' % live]))
+        message = out_q.get_nowait()
+        self.assertEqual(message, ('requeue', ('n10.example.com', 'A', 1, 7, ['127.0.0.1#%d' % live, '127.0.0.1#%d' % dead])))
+        # the retry skips the dead one
+        for i in range(4):
+            self.assertTrue(worker.check('n10.example.com', 'A', 1, 7, ['127.0.0.1#%d' % dead]))
+        resolvers = worker.metrics.take()[0]
+        self.assertEqual(resolvers['127.0.0.1#%d' % live]['queries'], 4)
+        self.assertEqual(resolvers['127.0.0.1#%d' % dead]['queries'], 1)
+        # both resolvers take turns with the other hosts
+        for i in range(4):
+            try:
+                worker.check('n%d.example.com' % (i * 10), 'A')
+            except Exception:
+                pass
+        self.assertEqual(sorted(worker.metrics.take()[0]), sorted(['127.0.0.1#%d' % dead, '127.0.0.1#%d' % live]))
+
+    def test_stopped_early_can_be_resumed(self):
+        checkpoint = os.path.join(self.workdir, 'stopped.state')
+        results = subbrute.run('example.com', False, self.names, self.resolvers, 2, checkpoint = checkpoint)
+        first = next(results)
+        results.close()
+        self.assertTrue(os.path.exists(checkpoint))
+        self.assertEqual(multiprocessing.active_children(), [])
+        rest = [hostname for (hostname, record_type, response) in
+                subbrute.run('example.com', False, self.names, self.resolvers, 2, checkpoint = checkpoint)]
+        self.assertEqual(sorted(set([first[0]] + rest)), sorted('n%d.example.com' % i for i in range(0, count, every)))
+        self.assertFalse(os.path.exists(checkpoint))
+
+    def test_dead_lookup_processes_keep_the_checkpoint(self):
+        checkpoint = os.path.join(self.workdir, 'crashed.state')
+        run = subbrute.lookup.run
+        subbrute.lookup.run = lambda self: os._exit(1)
+        try:
+            found = list(subbrute.run('example.com', False, self.names, self.resolvers, 2, checkpoint = checkpoint))
+        finally:
+            subbrute.lookup.run = run
+        self.assertEqual(found, [])
+        with open(checkpoint) as f:
+            state = json.load(f)
+        self.assertEqual(state['offset'], 0)
+        self.assertEqual(multiprocessing.active_children(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+# coding: utf-8
+# The connect scan against local listeners, offline.
+#
+#   python -m unittest discover tests
+
+import os
+import sys
+import socket
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import sublist3r
+
+
+class localscan(sublist3r.portscan):
+    # every host is this machine, except the ones named unresolvable
+    def resolve(self, host):
+        if host.startswith('unresolvable'):
+            return host, None
+        return host, '127.0.0.1'
+
+
+class PortscanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.listeners = []
+        for i in range(3):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            s.bind(('127.0.0.1', 0))
+            # nothing accepts, the backlog has to hold every connect
+            s.listen(128)
+            self.listeners.append(s)
+        self.open = [s.getsockname()[1] for s in self.listeners]
+        # bound and closed again, nothing listens there
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.bind(('127.0.0.1', 0))
+        self.closed = s.getsockname()[1]
+        s.close()
+
+    def tearDown(self):
+        for s in self.listeners:
+            s.close()
+
+    def states(self, results):
+        return dict(((host, port), state) for (host, port, state, latency) in results)
+
+    def test_open_and_closed(self):
+        results = localscan(['a.example.com', 'b.example.com'], self.open + [self.closed], silent=True).run()
+        self.assertEqual(len(results), 2 * 4)
+        states = self.states(results)
+        for host in ('a.example.com', 'b.example.com'):
+            for port in self.open:
+                self.assertEqual(states[host, port], 'open')
+            self.assertEqual(states[host, self.closed], 'closed')
+        for (host, port, state, latency) in results:
+            self.assertIsNotNone(latency)
+
+    def test_unresolvable_host(self):
+        results = localscan(['unresolvable.example.com', 'a.example.com'], self.open, silent=True).run()
+        states = self.states(results)
+        for port in self.open:
+            self.assertEqual(states['unresolvable.example.com', port], 'error')
+            self.assertEqual(states['a.example.com', port], 'open')
+
+    def test_max_inflight(self):
+        # more connects than may be open at once, every one of them is still reported
+        hosts = ['h%d.example.com' % i for i in range(20)]
+        results = localscan(hosts, self.open + [self.closed], max_inflight=2, silent=True).run()
+        states = self.states(results)
+        self.assertEqual(len(results), len(hosts) * 4)
+        self.assertEqual(sorted(set(states.values())), ['closed', 'open'])
+
+    def test_localhost_resolves(self):
+        results = sublist3r.portscan(['localhost'], self.open[:1], silent=True).run()
+        self.assertEqual(results[0][:3], ('localhost', self.open[0], 'open'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+# coding: utf-8
+# The on-disk response cache of the engines, offline.
+#
+#   python -m unittest discover tests
+
+import os
+import sys
+import time
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import sublist3r
+
+
+class FakeResponse(object):
+    status_code = 200
+
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.urls = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.urls.append(url)
+        return FakeResponse(b'<a>www.example.com</a> page ' + url.encode('ascii'))
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_round_trip(self):
+        cache = sublist3r.ResponseCache(self.path)
+        cache.set('Google', 'https://google.com/?q=1', b'body')
+        cache.set('Bing', 'https://bing.com/?q=1', u'caf\xe9')
+        self.assertEqual(cache.get('Google', 'https://google.com/?q=1', 60), b'body')
+        self.assertEqual(cache.get('Bing', 'https://bing.com/?q=1', 60), u'caf\xe9'.encode('utf-8'))
+        # the engine is part of the key
+        self.assertIsNone(cache.get('Bing', 'https://google.com/?q=1', 60))
+
+    def test_ttl(self):
+        cache = sublist3r.ResponseCache(self.path)
+        cache.set('Google', 'https://google.com/?q=1', b'body')
+        time.sleep(0.05)
+        self.assertIsNone(cache.get('Google', 'https://google.com/?q=1', 0.01))
+        self.assertEqual(cache.get('Google', 'https://google.com/?q=1', 60), b'body')
+
+    def test_least_recently_used_are_evicted(self):
+        cache = sublist3r.ResponseCache(self.path)
+        # incompressible bodies, 10 of them don't fit in the smaller cache
+        bodies = dict(('https://example.com/%d' % i, os.urandom(2048)) for i in range(10))
+        for i, url in enumerate(sorted(bodies)):
+            cache.set('Google', url, bodies[url])
+            # a second apart, in the order they were written
+            os.utime(cache.entry('Google', url), (1000000 + i, 1000000 + i))
+        oldest = sorted(bodies)[0]
+        # reading an entry makes it the most recently used
+        self.assertEqual(cache.get('Google', oldest, 1e12), bodies[oldest])
+        cache.max_size = 10 * 1024
+        cache.evict()
+        left = [url for url in sorted(bodies) if os.path.exists(cache.entry('Google', url))]
+        self.assertIn(oldest, left)
+        self.assertNotIn(sorted(bodies)[1], left)
+        self.assertLessEqual(sum(os.path.getsize(cache.entry('Google', url)) for url in left), 10 * 1024)
+
+    def test_shared_between_runs(self):
+        sublist3r.ResponseCache(self.path).set('Google', 'https://google.com/?q=1', b'body')
+        self.assertEqual(sublist3r.ResponseCache(self.path).get('Google', 'https://google.com/?q=1', 60), b'body')
+
+    def test_send_req_replays_from_the_cache(self):
+        cache = sublist3r.ResponseCache(self.path)
+        first = sublist3r.enumratorBase('https://example.com/?q={query}&p={page_no}', 'Example', 'http://example.com', silent=True)
+        first.session = FakeSession()
+        first.cache = cache
+        body = first.send_req('site:example.com', 1)
+        self.assertEqual(len(first.session.urls), 1)
+
+        second = sublist3r.enumratorBase('https://example.com/?q={query}&p={page_no}', 'Example', 'http://example.com', silent=True)
+        second.session = FakeSession()
+        second.cache = cache
+        self.assertEqual(second.send_req('site:example.com', 1), body)
+        self.assertEqual(second.session.urls, [])
+        # the cache doesn't hand out the response object, only the body
+        self.assertIsNone(second.response)
+        second.send_req('site:example.com', 2)
+        self.assertEqual(len(second.session.urls), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+# coding: utf-8
+# The wordlist builder and the compiled wordlists of subbrute, offline.
+#
+#   python -m unittest discover tests
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from subbrute import subbrute
+
+
+class CountLabelsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.dump = os.path.join(self.workdir, 'dump.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def count(self, data, chunk_size):
+        with open(self.dump, 'wb') as f:
+            f.write(data)
+        counter = subbrute.count_labels(self.dump, chunk_size = chunk_size)
+        try:
+            return dict(counter.top())
+        finally:
+            counter.close()
+
+    def test_names_across_chunks(self):
+        data = b'www.example.com\n' * 50 + b'mail.example.com,1.2.3.4\n' * 20 + b'api.example.org'
+        for chunk_size in (3, 7, 64, 1 << 20):
+            self.assertEqual(self.count(data, chunk_size), {b'www': 50, b'mail': 20, b'api': 1})
+
+    def test_long_runs_are_dropped(self):
+        # no separator for far longer than a name, in the middle of a chunk and across many of them
+        run = b'a' * 5000 + b'.b.example.com'
+        data = b'www.example.com ' + run + b' mail.example.com ' + run + b'\n' + run
+        for chunk_size in (16, 300, 4096, 1 << 20):
+            self.assertEqual(self.count(data, chunk_size), {b'www': 1, b'mail': 1})
+
+    def test_binary_input(self):
+        data = os.urandom(1 << 16).replace(b'.', b'x') + b'\nwww.example.com\n'
+        self.assertEqual(self.count(data, 1024).get(b'www'), 1)
+
+
+class CompiledWordlistTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def test_round_trip(self):
+        path = os.path.join(self.workdir, 'names.sbwl')
+        names = [u'www', u'mail', u'dev-1', u'a.b']
+        self.assertEqual(subbrute.write_wordlist(path, names), 4)
+        words = subbrute.wordlist(path)
+        self.assertEqual(len(words), 4)
+        self.assertEqual([words[i] for i in range(4)], names)
+        self.assertEqual(words[-1], u'a.b')
+        self.assertEqual(list(words.iter_from(2)), names[2:])
+        self.assertRaises(IndexError, lambda: words[4])
+
+    def test_empty(self):
+        path = os.path.join(self.workdir, 'empty.sbwl')
+        self.assertEqual(subbrute.write_wordlist(path, []), 0)
+        self.assertEqual(len(subbrute.wordlist(path)), 0)
+
+    def test_compile(self):
+        source = os.path.join(self.workdir, 'names.txt')
+        with open(source, 'w') as f:
+            f.write('www\nMail,5\nwww\nnot a name\ndev\n')
+        path = os.path.join(self.workdir, 'names.sbwl')
+        subbrute.compile_wordlist(source, path)
+        # counted ones first, the others keep their order
+        self.assertEqual(list(subbrute.wordlist(path).iter_from(0)), [u'mail', u'www', u'dev'])
+
+
+if __name__ == '__main__':
+    unittest.main()